@@ -0,0 +1,101 @@
+# chat_cache.py
+# 聊天元数据缓存：缓存聊天类型/名称/群人数，避免每条消息都调用 ChatInfo()/chat_info() 等 UI 接口
+# - 首次见到聊天时填充，过期（TTL）或被标记失效后在下次访问时惰性刷新
+# - 群改名、入群/退群等系统消息会使对应条目失效
+# - 统计命中率与节省的 UI 调用耗时
+import threading
+import time
+from collections import OrderedDict
+
+import memstats
+
+CACHE_TTL = 1800        # 条目有效期（秒），过期后下次访问时刷新
+CACHE_MAX_SIZE = 1000   # 最多缓存的聊天数（LRU 淘汰）
+
+
+class ChatMetaCache:
+    """按聊天对象（优先 chat.who）缓存 {'type','name','member_count'}"""
+    def __init__(self, ttl: float = CACHE_TTL, max_size: int = CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {'type','name','member_count','expires'}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._miss_cost = 0.0  # 未命中时 UI 调用累计耗时（秒）
+
+    @staticmethod
+    def key_of(chat):
+        return getattr(chat, "who", None) or id(chat)
+
+    @staticmethod
+    def _fetch(chat, msg):
+        """调用 UI 接口获取聊天信息"""
+        name = getattr(chat, "who", None)
+        if not name and hasattr(chat, "ChatInfo"):
+            try:
+                name = (chat.ChatInfo() or {}).get("chat_name")
+            except Exception:
+                name = None
+        name = name or "unknown"
+        meta = {"type": "friend", "name": name, "member_count": None}
+        try:
+            ci = msg.chat_info() if hasattr(msg, "chat_info") else {}
+            if isinstance(ci, dict):
+                meta["type"] = ci.get("chat_type", "friend")
+                meta["name"] = ci.get("chat_name", name) or name
+                meta["member_count"] = ci.get("group_member_count")
+        except Exception:
+            pass
+        return meta
+
+    def get(self, chat, msg):
+        """返回聊天元数据（dict 副本），必要时调用 UI 接口刷新"""
+        key = self.key_of(chat)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {k: entry[k] for k in ("type", "name", "member_count")}
+        t0 = time.perf_counter()
+        meta = self._fetch(chat, msg)
+        cost = time.perf_counter() - t0
+        with self._lock:
+            self.misses += 1
+            self._miss_cost += cost
+            self._entries[key] = {**meta, "expires": now + self.ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return dict(meta)
+
+    def invalidate(self, chat=None, key=None):
+        """标记条目失效（下次访问时刷新）"""
+        key = key if key is not None else self.key_of(chat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["expires"] = 0
+                self.invalidations += 1
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"entries": self._entries})
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            avg_miss_ms = self._miss_cost * 1000 / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "avg_miss_ms": round(avg_miss_ms, 2),
+                "saved_ms": round(avg_miss_ms * self.hits, 1),
+            }
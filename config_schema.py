@@ -0,0 +1,394 @@
+# config_schema.py
+# config.json 的声明式字段表：启动时编译为校验函数，保存/增量更新时一次遍历完成校验与类型转换
+# - validate_fields(updates)：只校验传入的字段，非法值抛出 ValueError（PATCH 接口用）
+# - coerce_fields(updates, current)：非法值回退为当前值/默认值（整表保存用，兼容旧行为）
+# - config_version(config)：按规范化 JSON 计算版本号，用于 ETag / If-Match
+# - diff_config(old, new)：字段级差异，运行中的机器人据此热更新
+# - plugin_settings(declared, raw)：按插件声明的 SETTINGS 转换 config.json 中 plugins 段的对应配置
+import hashlib
+import json
+import math
+import re
+
+# 字段声明：type 取值 bool / str / int / float / time / list / enum / keyword_dict / log_levels / dict
+# - dict 可带 "fields"（子字段声明，格式同本表）与 "values"（任意键的值声明，用于「名称 -> 设置」映射），
+#   未声明的子字段原样保留；list 可带 "items"（元素声明）；str 可带 "pattern"（正则）
+# - "nullable": True 表示允许 null
+# 各段的子字段与对应模块的 DEFAULTS 保持一致，保证写入 config.json 的值能被各组件的 configure 接受
+_RATE = {"type": "dict", "fields": {
+    "rate": {"type": "float", "min": 0.0, "max": 1000.0},
+    "burst": {"type": "int", "min": 1, "max": 100000},
+}}
+
+RATE_LIMIT = {  # ratelimit.DEFAULTS
+    "enabled": {"type": "bool"},
+    "sender": _RATE,
+    "chat": _RATE,
+    "plugin_default": _RATE,
+    "plugins": {"type": "dict", "values": _RATE},
+    "max_keys": {"type": "int", "min": 1, "max": 1000000},
+    "idle_seconds": {"type": "float", "min": 1.0, "max": 86400.0},
+    "notify": {"type": "bool"},
+    "notify_msg": {"type": "str"},
+    "notify_interval": {"type": "float", "min": 1.0, "max": 86400.0},
+}
+
+INBOUND = {  # inbound.DEFAULTS
+    "weights": {"type": "dict", "values": {"type": "int", "min": 1, "max": 1000}},
+    "max_backlog": {"type": "int", "min": 1, "max": 1000000},
+    "stale_seconds": {"type": "float", "min": 0.0, "max": 86400.0},
+    "shed_classes": {"type": "list", "items": {"type": "enum", "choices": ["admin", "private", "mention", "group"]}},
+    "batch_size": {"type": "int", "min": 1, "max": 1000},
+}
+
+REPLY_COALESCE = {  # outbound.COALESCE_DEFAULTS
+    "enabled": {"type": "bool"},
+    "window": {"type": "float", "min": 0.0, "max": 3600.0},
+    "hold": {"type": "float", "min": 0.0, "max": 60.0},
+    "ref_text": {"type": "str"},
+}
+
+STATE_STORE = {  # state_store.DEFAULTS
+    "max_entries": {"type": "int", "min": 1, "max": 10000000},
+    "max_bytes": {"type": "int", "min": 1024, "max": 1 << 34},
+    "default_ttl": {"type": "float", "min": 1.0, "max": 30 * 86400.0},
+    "snapshot": {"type": "bool"},
+    "snapshot_interval": {"type": "float", "min": 10.0, "max": 86400.0},
+}
+
+WATCHDOG = {  # hang_watch.DEFAULTS
+    "enabled": {"type": "bool"},
+    "threshold": {"type": "float", "min": 1.0, "max": 86400.0},
+    "thresholds": {"type": "dict", "values": {"type": "float", "min": 1.0, "max": 86400.0}},
+    "interval": {"type": "float", "min": 0.5, "max": 3600.0},
+    "dump_stacks": {"type": "bool"},
+    "dump_cooldown": {"type": "float", "min": 0.0, "max": 86400.0},
+    "restart_listener": {"type": "bool"},
+}
+
+REMOTE_PLUGINS = {  # remote_plugins.DEFAULTS
+    "enabled": {"type": "bool"},
+    "workers": {"type": "list", "items": {"type": "str", "pattern": r"^(unix://.+|(tcp://)?[^:/]*:\d{1,5})$"}},
+    "plugins": {"type": "list", "items": {"type": "str"}},
+    "token": {"type": "str"},
+    "ack_timeout": {"type": "float", "min": 0.1, "max": 60.0},
+    "heartbeat": {"type": "float", "min": 0.5, "max": 600.0},
+    "connect_timeout": {"type": "float", "min": 0.1, "max": 60.0},
+    "affinity_size": {"type": "int", "min": 1, "max": 1000000},
+}
+
+# plugins 段：插件文件名 -> 设置；各插件字段由插件的 SETTINGS 在加载时校验，这里只校验限流覆盖
+PLUGINS = {"type": "dict", "values": {"type": "dict", "fields": {"rate_limit": _RATE}}}
+
+SIM = {  # wxsim.DEFAULTS
+    "nickname": {"type": "str"},
+    "latency": {"type": "float", "min": 0.0, "max": 60.0},
+    "jitter": {"type": "float", "min": 0.0, "max": 60.0},
+    "failure_rate": {"type": "float", "min": 0.0, "max": 1.0},
+    "op_latency": {"type": "dict", "values": {"type": "float", "min": 0.0, "max": 60.0}},
+    "op_failure": {"type": "dict", "values": {"type": "float", "min": 0.0, "max": 1.0}},
+    "seed": {"type": "int", "nullable": True},
+}
+
+WECHAT_NOTIFY = {
+    "corp_id": {"type": "str"},
+    "secret": {"type": "str"},
+    "agentid": {"type": "str"},
+}
+
+FIELDS = {
+    "admin": {"type": "str"},
+    "AllListen_switch": {"type": "bool"},
+    "listen_list": {"type": "list"},
+    "group": {"type": "list"},
+    "group_switch": {"type": "bool"},
+    "group_reply_at": {"type": "bool"},
+    "group_welcome": {"type": "bool"},
+    "group_welcome_random": {"type": "float", "min": 0.0, "max": 1.0, "default": 1.0},
+    "group_welcome_msg": {"type": "str"},
+    "group_welcome_window": {"type": "float", "min": 0.0, "max": 600.0, "default": 8.0},
+    "new_friend_switch": {"type": "bool"},
+    "new_friend_msg": {"type": "list"},
+    "chat_keyword_switch": {"type": "bool"},
+    "group_keyword_switch": {"type": "bool"},
+    "keyword_match_mode": {"type": "enum", "choices": ["exact", "prefix", "contains"], "default": "contains"},
+    "keyword_dict": {"type": "keyword_dict"},
+    "everyday_msg_switch": {"type": "bool"},
+    "everyday_start_stop_bot_switch": {"type": "bool"},
+    "everyday_start_bot_time": {"type": "time", "default": "08:00"},
+    "everyday_stop_bot_time": {"type": "time", "default": "23:00"},
+    "api_sdk_list": {"type": "list"},
+    "outbound_max_len": {"type": "int", "min": 50, "max": 20000, "default": 2000},
+    "reply_deadline": {"type": "int", "min": 5, "max": 3600, "default": 180},
+    "rate_limit": {"type": "dict", "fields": RATE_LIMIT},
+    "inbound": {"type": "dict", "fields": INBOUND},
+    "reply_coalesce": {"type": "dict", "fields": REPLY_COALESCE},
+    "state_store": {"type": "dict", "fields": STATE_STORE},
+    "watchdog": {"type": "dict", "fields": WATCHDOG},
+    "remote_plugins": {"type": "dict", "fields": REMOTE_PLUGINS},
+    "log_levels": {"type": "log_levels"},
+    "plugins": PLUGINS,
+    "backend": {"type": "enum", "choices": ["wxautox", "sim"], "default": "wxautox"},
+    "sim": {"type": "dict", "fields": SIM},
+    "notify_method": {"type": "str"},
+    "wechat_notify": {"type": "dict", "fields": WECHAT_NOTIFY},
+}
+
+_TIME_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+# ====== 各类型的转换函数（非法值抛 ValueError） ======
+def _to_bool(v, spec):
+    if isinstance(v, str):
+        return v.strip().lower() in ('on', 'true', '1', 'yes')
+    return bool(v)
+
+
+def _to_str(v, spec):
+    if v is None:
+        return ""
+    if isinstance(v, (dict, list)):
+        raise ValueError("需要字符串")
+    v = str(v)
+    if "pattern" in spec and not re.match(spec["pattern"], v):
+        raise ValueError(f"格式不正确：{v}")
+    return v
+
+
+def _to_number(cast):
+    def conv(v, spec):
+        if isinstance(v, bool) or isinstance(v, (dict, list)):
+            raise ValueError("需要数字")
+        if isinstance(v, float) and not math.isfinite(v):
+            raise ValueError("需要有限的数字")
+        try:
+            val = cast(v)
+        except (TypeError, ValueError):
+            raise ValueError("需要数字")
+        except OverflowError:
+            raise ValueError("需要有限的数字")
+        if isinstance(val, float) and not math.isfinite(val):
+            raise ValueError("需要有限的数字")
+        if "min" in spec:
+            val = max(spec["min"], val)
+        if "max" in spec:
+            val = min(spec["max"], val)
+        return val
+    return conv
+
+
+def _to_time(v, spec):
+    m = _TIME_RE.match(str(v or "").strip())
+    if not m:
+        raise ValueError("时间格式应为 HH:MM")
+    return f"{int(m.group(1)):02d}:{m.group(2)}"
+
+
+def _to_list(v, spec):
+    if isinstance(v, str):
+        v = [v] if v else []
+    elif not isinstance(v, (list, tuple)):
+        raise ValueError("需要列表")
+    items = [item for item in v if str(item).strip()]
+    if "items" not in spec:
+        return items
+    out = []
+    for i, item in enumerate(items):
+        try:
+            out.append(_convert(item, spec["items"]))
+        except ValueError as e:
+            raise ValueError(f"[{i}] {e}")
+    return out
+
+
+def _to_enum(v, spec):
+    if v not in spec["choices"]:
+        raise ValueError(f"取值应为 {'/'.join(spec['choices'])}")
+    return v
+
+
+def _to_dict(v, spec):
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except ValueError:
+            raise ValueError("需要 JSON 对象")
+    if not isinstance(v, dict):
+        raise ValueError("需要 JSON 对象")
+    fields, values = spec.get("fields") or {}, spec.get("values")
+    if not fields and values is None:
+        return v
+    out, errors = {}, []
+    for key, item in v.items():
+        sub = fields.get(key, values)
+        if sub is None:
+            out[key] = item  # 未声明的子字段原样保留
+            continue
+        try:
+            out[key] = _convert(item, sub)
+        except ValueError as e:
+            errors.append(f"{key}: {e}")
+    if errors:
+        raise ValueError("; ".join(errors))
+    return out
+
+
+def _to_keyword_dict(v, spec):
+    """keyword_dict 支持：dict / JSON字符串 / list[{key, value}]"""
+    if isinstance(v, dict):
+        return v
+    if isinstance(v, str):
+        try:
+            obj = json.loads(v)
+        except ValueError:
+            raise ValueError("需要 JSON 对象")
+        if isinstance(obj, dict):
+            return obj
+        v = obj
+    if isinstance(v, list):
+        out = {}
+        for item in v:
+            if isinstance(item, dict):
+                key = str(item.get('key', '')).strip()
+                if key:
+                    out[key] = str(item.get('value', ''))
+        return out
+    raise ValueError("需要关键词字典")
+
+
+def _to_log_levels(v, spec):
+    """log_levels：{模块名: 级别}，级别取 DEBUG/INFO/SUCCESS/WARNING/ERROR"""
+    v = _to_dict(v, spec)
+    out = {}
+    for name, level in v.items():
+        level = str(level).upper()
+        if level not in _LOG_LEVELS:
+            raise ValueError(f"{name or '(全局)'} 的级别应为 {'/'.join(_LOG_LEVELS)}")
+        out[str(name)] = level
+    return out
+
+
+_LOG_LEVELS = ("DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR")
+
+_CONVERTERS = {
+    "bool": _to_bool,
+    "str": _to_str,
+    "int": _to_number(lambda v: int(float(v))),
+    "float": _to_number(float),
+    "time": _to_time,
+    "list": _to_list,
+    "enum": _to_enum,
+    "dict": _to_dict,
+    "keyword_dict": _to_keyword_dict,
+    "log_levels": _to_log_levels,
+}
+
+
+def _convert(v, spec):
+    """按声明转换单个值（嵌套字段用）"""
+    if v is None and spec.get("nullable"):
+        return None
+    return _CONVERTERS[spec["type"]](v, spec)
+
+
+def compile_schema(fields):
+    """将字段声明编译为 {字段名: (校验函数, 默认值)}"""
+    compiled = {}
+    for name, spec in fields.items():
+        conv = _CONVERTERS[spec["type"]]
+        compiled[name] = ((lambda c, s: (lambda v: c(v, s)))(conv, spec), spec.get("default"))
+    return compiled
+
+
+VALIDATORS = compile_schema(FIELDS)
+
+
+def validate_fields(updates):
+    """严格校验：返回转换后的字段；任一字段非法时抛出 ValueError（汇总全部错误）"""
+    out, errors = {}, {}
+    for key, value in updates.items():
+        entry = VALIDATORS.get(key)
+        if entry is None:
+            out[key] = value  # 未声明字段原样保留（兼容插件或旧版本字段）
+            continue
+        try:
+            out[key] = entry[0](value)
+        except ValueError as e:
+            errors[key] = str(e)
+    if errors:
+        raise ValueError("; ".join(f"{k}: {v}" for k, v in errors.items()))
+    return out
+
+
+def _merge(spec, current, new):
+    """按声明把 new 合并进 current：dict 类型逐键递归合并，其余类型整体替换"""
+    if spec.get("type") != "dict" or not isinstance(current, dict) or not isinstance(new, dict):
+        return new
+    fields, values = spec.get("fields") or {}, spec.get("values") or {}
+    out = dict(current)
+    for key, value in new.items():
+        out[key] = _merge(fields.get(key, values), current.get(key), value)
+    return out
+
+
+def merge_fields(updates, current):
+    """
+    增量更新的合并：dict 类型的配置段（rate_limit、plugins 等）只覆盖传入的子字段，
+    未传入的子字段保留当前值；keyword_dict 等其他类型整体替换
+    """
+    return {key: _merge(FIELDS.get(key, {}), current.get(key), value) for key, value in updates.items()}
+
+
+def coerce_fields(updates, current):
+    """宽松校验：非法值回退为当前值（或声明的默认值）"""
+    out = {}
+    for key, value in updates.items():
+        entry = VALIDATORS.get(key)
+        if entry is None:
+            out[key] = value
+            continue
+        try:
+            out[key] = entry[0](value)
+        except ValueError:
+            if key in current:
+                out[key] = current[key]
+            elif entry[1] is not None:
+                out[key] = entry[1]
+    return out
+
+
+def plugin_settings(declared, raw):
+    """
+    插件设置：declared 为插件的 SETTINGS 声明（字段格式同 FIELDS，须带 default），raw 为 plugins 段中该插件的配置
+    返回 (完整设置, 错误)，缺失或非法的字段取默认值，未声明的字段忽略
+    """
+    raw = raw if isinstance(raw, dict) else {}
+    values, errors = {}, {}
+    for name, spec in declared.items():
+        if name not in raw:
+            values[name] = spec.get("default")
+            continue
+        try:
+            values[name] = _CONVERTERS[spec["type"]](raw[name], spec)
+        except ValueError as e:
+            errors[name] = str(e)
+            values[name] = spec.get("default")
+    return values, errors
+
+
+def config_version(config):
+    """配置版本号（规范化 JSON 的摘要）"""
+    raw = json.dumps(config, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def diff_config(old, new):
+    """返回发生变化的字段 {字段: {'old': 旧值, 'new': 新值}}"""
+    return {k: {'old': old.get(k), 'new': v} for k, v in new.items() if old.get(k) != v}
+
+
+class ConfigVersionConflict(Exception):
+    """If-Match 版本与当前配置版本不一致"""
+    def __init__(self, current_version):
+        super().__init__(f"配置已被修改，当前版本 {current_version}")
+        self.current_version = current_version
@@ -0,0 +1,209 @@
+# context.py
+# 消息处理上下文：截止时间 + 取消令牌，随 chat_info['ctx'] 传给插件
+# - 机器人停止时取消根令牌，所有进行中的消息上下文随之取消
+# - ctx.get / ctx.post：超时取剩余时间，取消时关闭连接，阻塞中的请求立即中断
+# - ctx.sleep：可被取消打断的等待；outbound.send_text(..., ctx=ctx) 丢弃已过期/已取消的回复
+# 插件用法：
+#   ctx = chat_info.get('ctx')
+#   resp = ctx.get(url, params=params, timeout=10)   # 取消/超时抛 Cancelled
+#   if ctx.done: return
+import socket
+import threading
+import time
+import weakref
+
+
+class Cancelled(Exception):
+    """上下文已取消（机器人停止或被调用方取消）"""
+
+
+class DeadlineExceeded(Cancelled):
+    """上下文已超过截止时间"""
+
+
+class CancelToken:
+    """取消令牌：可注册取消回调（关闭连接等），父令牌取消时子令牌一并取消"""
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._seq = 0
+        self._children = weakref.WeakSet()
+        self.reason = None
+        if parent is not None:
+            parent._adopt(self)
+
+    def _adopt(self, child):
+        with self._lock:
+            if not self._event.is_set():
+                self._children.add(child)
+                return
+        child.cancel(self.reason)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="已取消"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            children = list(self._children)
+            self._callbacks.clear()
+            self._children = weakref.WeakSet()
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+        for child in children:
+            child.cancel(reason)
+
+    def on_cancel(self, fn):
+        """注册取消回调，返回可传给 remove_callback 的句柄；已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._seq += 1
+                self._callbacks[self._seq] = fn
+                return self._seq
+        fn()
+        return None
+
+    def remove_callback(self, handle):
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    def wait(self, timeout=None):
+        """等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+
+class Context:
+    """单条消息的处理上下文：deadline 为绝对时间（time.time()），None 表示不限"""
+    def __init__(self, deadline=None, parent=None):
+        self.deadline = deadline
+        self.token = CancelToken(parent)
+
+    @classmethod
+    def with_timeout(cls, seconds, parent=None):
+        return cls(time.time() + seconds if seconds else None, parent)
+
+    def child(self, seconds=None):
+        """派生子上下文：截止时间取两者较早者，随父上下文一起取消"""
+        deadline = self.deadline
+        if seconds:
+            deadline = min(deadline or float("inf"), time.time() + seconds)
+        return Context(deadline, self.token)
+
+    def remaining(self):
+        """剩余秒数，不限时返回 None"""
+        return None if self.deadline is None else self.deadline - time.time()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def done(self):
+        return self.token.cancelled or self.expired
+
+    def cancel(self, reason="已取消"):
+        self.token.cancel(reason)
+
+    def check(self):
+        """已取消或超时时抛出异常"""
+        if self.token.cancelled:
+            raise Cancelled(self.token.reason)
+        if self.expired:
+            raise DeadlineExceeded("已超过处理截止时间")
+
+    def timeout(self, cap=None):
+        """本次阻塞操作可用的超时：剩余时间与 cap 的较小者"""
+        self.check()
+        rem = self.remaining()
+        if rem is None:
+            return cap
+        return rem if cap is None else min(cap, rem)
+
+    def sleep(self, seconds):
+        """可被取消打断的 sleep，被打断或超时抛出异常"""
+        wait = self.timeout(seconds)
+        if self.token.wait(wait):
+            raise Cancelled(self.token.reason)
+        if wait < seconds:
+            raise DeadlineExceeded("已超过处理截止时间")
+
+    # ---------- HTTP ----------
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        发起 HTTP 请求：超时不超过剩余时间；上下文取消时关闭连接，使阻塞的请求立即失败
+        取消/超时均抛出 Cancelled（DeadlineExceeded），其余异常原样抛出
+        """
+        session, abort = _abortable_session()
+        handle = self.token.on_cancel(abort)
+        try:
+            return session.request(method, url, timeout=self.timeout(timeout), **kwargs)
+        except Exception:
+            self.check()  # 因取消而中断的请求统一抛 Cancelled
+            raise
+        finally:
+            if handle is not None:
+                self.token.remove_callback(handle)
+            session.close()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def _abortable_session():
+    """
+    返回 (session, abort)：session.close() 只回收空闲连接，阻塞在读取中的连接不受影响，
+    因此连接池记录借出的连接，abort() 对其 socket 执行 shutdown，使阻塞的 recv 立即返回
+    """
+    import requests
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    active = set()
+    lock = threading.Lock()
+
+    class Tracking:
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            with lock:
+                active.add(conn)
+            return conn
+
+        def _put_conn(self, conn):
+            with lock:
+                active.discard(conn)
+            super()._put_conn(conn)
+
+    pool_classes = {"http": type("HTTPConnectionPool", (Tracking, HTTPConnectionPool), {}),
+                    "https": type("HTTPSConnectionPool", (Tracking, HTTPSConnectionPool), {})}
+    session = requests.Session()
+    for adapter in session.adapters.values():
+        adapter.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def abort():
+        with lock:
+            conns = list(active)
+        for conn in conns:
+            sock = getattr(conn, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        session.close()
+
+    return session, abort
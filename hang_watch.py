@@ -0,0 +1,184 @@
+# hang_watch.py（避开第三方库 watchdog 的模块名）
+# 卡死检测：监听回调、入站工作线程、发送线程、定时任务在开始一次处理时登记心跳，结束时清除
+# - 独立的守护线程定期检查：某次处理持续超过阈值即判定卡死（空闲等待不算）
+# - 判定卡死时把所有线程的调用栈写入日志（带冷却，避免刷屏），并在网页端标记卡死的组件
+# - 可选回调 on_stuck(组件, 详情)：例如监听回调卡死时重启监听
+# 用法：
+#   with watchdog.track("inbound", chat_name):
+#       watchdog.note("插件 search.handle")   # 更新当前线程正在做的事（出现在卡死报告里）
+#       handler(item)
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from logger import get_logger
+
+_log = get_logger("wxbot.watchdog")
+
+DEFAULTS = {
+    "enabled": True,
+    "threshold": 90,            # 单次处理超过该秒数判定为卡死
+    "thresholds": {},           # 按组件覆盖阈值，如 {"outbound": 60, "scheduler": 300}
+    "interval": 5,              # 检查间隔（秒）
+    "dump_stacks": True,        # 卡死时把全部线程调用栈写入日志
+    "dump_cooldown": 300,       # 两次调用栈转储的最小间隔（秒）
+    "restart_listener": False,  # 监听回调卡死时重启微信监听
+}
+
+
+class _Beat:
+    __slots__ = ("component", "detail", "since", "thread", "ident", "stuck")
+
+    def __init__(self, component, detail):
+        self.component = component
+        self.detail = detail
+        self.since = time.time()
+        current = threading.current_thread()
+        self.thread = current.name
+        self.ident = current.ident
+        self.stuck = False
+
+
+class Watchdog:
+    def __init__(self, config=None, on_stuck=None, name="watchdog"):
+        self.name = name
+        self.on_stuck = on_stuck
+        self._lock = threading.Lock()
+        self._active = {}            # 线程 ident -> 正在进行的 _Beat
+        self._last = {}              # 组件 -> 最近一次完成处理的时间
+        self._done = {}              # 组件 -> 完成次数
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_dump = 0.0
+        self.events = deque(maxlen=20)
+        self.counters = {"stuck": 0, "recovered": 0, "dumps": 0}
+        self.configure(config)
+
+    def configure(self, config=None):
+        cfg = {**DEFAULTS, **(config or {})}
+        self.enabled = bool(cfg["enabled"])
+        self.threshold = max(1.0, float(cfg["threshold"]))
+        self.thresholds = {k: max(1.0, float(v)) for k, v in (cfg.get("thresholds") or {}).items()}
+        self.interval = max(0.5, float(cfg["interval"]))
+        self.dump_enabled = bool(cfg["dump_stacks"])
+        self.dump_cooldown = max(0.0, float(cfg["dump_cooldown"]))
+        self.restart_listener = bool(cfg["restart_listener"])
+
+    # ---------- 心跳 ----------
+    @contextmanager
+    def track(self, component, detail=""):
+        """标记当前线程开始一次处理，退出时清除（支持嵌套，恢复外层心跳）"""
+        ident = threading.get_ident()
+        beat = _Beat(component, detail)
+        with self._lock:
+            outer = self._active.get(ident)
+            self._active[ident] = beat
+        try:
+            yield beat
+        finally:
+            now = time.time()
+            with self._lock:
+                if outer is None:
+                    self._active.pop(ident, None)
+                else:
+                    self._active[ident] = outer
+                self._last[component] = now
+                self._done[component] = self._done.get(component, 0) + 1
+            if beat.stuck:
+                self.counters["recovered"] += 1
+                self._event("recovered", beat, now - beat.since)
+                _log.warning("%s 已恢复（卡住 %.0fs）：%s", component, now - beat.since, beat.detail)
+
+    def note(self, detail):
+        """更新当前线程正在进行的处理的详情（不在 track 中时忽略）"""
+        beat = self._active.get(threading.get_ident())
+        if beat is not None:
+            beat.detail = detail
+
+    # ---------- 检查 ----------
+    def check(self, now=None):
+        """检查一次，返回新判定为卡死的心跳列表"""
+        now = now or time.time()
+        with self._lock:
+            fresh = [b for b in self._active.values()
+                     if not b.stuck and now - b.since > self.thresholds.get(b.component, self.threshold)]
+            for b in fresh:
+                b.stuck = True
+        for b in fresh:
+            self.counters["stuck"] += 1
+            self._event("stuck", b, now - b.since)
+            _log.error("检测到 %s 卡死：已持续 %.0fs，线程 %s，正在处理：%s",
+                       b.component, now - b.since, b.thread, b.detail or "-")
+        if fresh and self.dump_enabled and now - self._last_dump >= self.dump_cooldown:
+            self._last_dump = now
+            self.counters["dumps"] += 1
+            _log.error("全部线程调用栈：\n%s", dump_stacks({b.ident for b in fresh}))
+        for b in fresh:
+            if self.on_stuck is not None:
+                try:
+                    self.on_stuck(b.component, b.detail)
+                except Exception as e:
+                    _log.error("卡死处理回调出错: %s", e)
+        return fresh
+
+    def _event(self, kind, beat, age):
+        self.events.append({"time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "event": kind,
+                            "component": beat.component, "detail": beat.detail,
+                            "thread": beat.thread, "seconds": round(age, 1)})
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            if self.enabled:
+                try:
+                    self.check()
+                except Exception as e:
+                    _log.error("看门狗检查出错: %s", e)
+
+    def start(self):
+        if self._thread and self._thread.is_alive() and not self._stop.is_set():
+            return
+        self._stop = threading.Event()  # 每个检查线程各用一个停止事件，停止后立即重启也不会串
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- 状态 ----------
+    def stuck(self):
+        """当前卡死的处理（网页端标记用）"""
+        now = time.time()
+        with self._lock:
+            return [{"component": b.component, "detail": b.detail, "thread": b.thread,
+                     "seconds": round(now - b.since, 1)} for b in self._active.values() if b.stuck]
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            components = {}
+            for b in self._active.values():
+                c = components.setdefault(b.component, {"busy": 0, "longest": 0.0, "stuck": False})
+                c["busy"] += 1
+                c["longest"] = round(max(c["longest"], now - b.since), 1)
+                c["stuck"] = c["stuck"] or b.stuck
+            for name, last in self._last.items():
+                c = components.setdefault(name, {"busy": 0, "longest": 0.0, "stuck": False})
+                c["last_beat_age"] = round(now - last, 1)
+                c["completed"] = self._done.get(name, 0)
+        return {"enabled": self.enabled, "threshold": self.threshold, "running": bool(self._thread and self._thread.is_alive()),
+                "components": components, "stuck": self.stuck(), **self.counters, "events": list(self.events)}
+
+
+def dump_stacks(highlight=()):
+    """格式化全部线程的当前调用栈，highlight 中的线程标记为 [卡死]"""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    out = []
+    for ident, frame in sys._current_frames().items():
+        mark = " [卡死]" if ident in highlight else ""
+        out.append(f"--- 线程 {names.get(ident, ident)}{mark} ---")
+        out.append("".join(traceback.format_stack(frame)).rstrip())
+    return "\n".join(out)
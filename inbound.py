@@ -0,0 +1,197 @@
+# inbound.py
+# 入站消息优先级调度：监听回调只做分类入队，由工作线程按加权公平顺序处理
+# - 优先级类别：admin（管理员）> private（私聊）> mention（群内 @ 机器人）> group（普通群消息）
+# - 平滑加权轮询（smooth weighted round-robin），高优先级多处理但低优先级不会饿死
+# - 积压超过 max_backlog 时，丢弃等待超过 stale_seconds 的低优先级消息（load shedding）
+# - 统计各类别的入队/处理/丢弃数与当前排队时长
+# - 批量模式（batch_size > 1）：积压时一次取出多条交给 batch_handler，插件可在一次调用中检查整批消息
+import threading
+import time
+import traceback
+from collections import deque
+
+import memstats
+from logger import log
+
+PRIORITY_CLASSES = ("admin", "private", "mention", "group")
+
+DEFAULTS = {
+    "weights": {"admin": 8, "private": 4, "mention": 4, "group": 1},
+    "max_backlog": 200,         # 总积压超过该值时开始丢弃过期的低优先级消息
+    "stale_seconds": 60,        # 等待超过该时长视为过期
+    "shed_classes": ["group"],  # 允许被丢弃的类别
+    "batch_size": 1,            # 每批最多处理的消息数，1 为逐条处理
+}
+
+
+class InboundScheduler:
+    """
+    入站调度器
+    handler(item) 在工作线程中调用，item 为 submit 时传入的任意对象
+    batch_handler(items)：批量模式下积压不止一条时调用，items 按加权轮询顺序排列；None 表示不支持批量
+    """
+    def __init__(self, handler, config=None, name="inbound", batch_handler=None):
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.name = name
+        self._cond = threading.Condition()
+        self._queues = {c: deque() for c in PRIORITY_CLASSES}  # 元素：(入队时间, item)
+        self._current = {c: 0 for c in PRIORITY_CLASSES}
+        self._thread = None
+        self._stopped = True
+        self.monitor = None  # 卡死检测（hang_watch.Watchdog），由主程序设置
+        self.counters = {c: {"queued": 0, "processed": 0, "shed": 0, "wait_total": 0.0} for c in PRIORITY_CLASSES}
+        self.batches = {"count": 0, "items": 0, "max": 0}
+        self.configure(config)
+
+    def configure(self, config=None):
+        cfg = {**DEFAULTS, **(config or {})}
+        weights = {**DEFAULTS["weights"], **(cfg.get("weights") or {})}
+        with self._cond:
+            self.weights = {c: max(1, int(weights.get(c, 1))) for c in PRIORITY_CLASSES}
+            self.max_backlog = max(1, int(cfg["max_backlog"]))
+            self.stale_seconds = float(cfg["stale_seconds"])
+            self.shed_classes = [c for c in PRIORITY_CLASSES[::-1] if c in (cfg.get("shed_classes") or [])]
+            self.batch_size = max(1, int(cfg.get("batch_size", 1)))
+
+    # ---------- 入队 ----------
+    def submit(self, cls, item):
+        """按类别入队（回调线程调用，立即返回）"""
+        if cls not in self._queues:
+            cls = "group"
+        with self._cond:
+            self._queues[cls].append((time.time(), item))
+            self.counters[cls]["queued"] += 1
+            self._shed()
+            self._cond.notify()
+
+    def _backlog(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def _shed(self, now=None):
+        """积压过多时丢弃过期的低优先级消息（调用方持锁）"""
+        if self._backlog() <= self.max_backlog:
+            return
+        now = now or time.time()
+        for cls in self.shed_classes:
+            q = self._queues[cls]
+            dropped = 0
+            while q and now - q[0][0] > self.stale_seconds:
+                q.popleft()
+                dropped += 1
+            if dropped:
+                self.counters[cls]["shed"] += dropped
+                log("WARNING", f"[{self.name}] 积压过多，丢弃 {dropped} 条过期的 {cls} 消息")
+            if self._backlog() <= self.max_backlog:
+                break
+
+    def _pick(self):
+        """平滑加权轮询选出下一个类别（调用方持锁），无消息返回 None"""
+        active = [c for c in PRIORITY_CLASSES if self._queues[c]]
+        if not active:
+            return None
+        total = 0
+        best = None
+        for c in active:
+            self._current[c] += self.weights[c]
+            total += self.weights[c]
+            if best is None or self._current[c] > self._current[best]:
+                best = c
+        self._current[best] -= total
+        return best
+
+    def _take(self, limit):
+        """按加权轮询顺序取出最多 limit 条（调用方持锁），返回 [(类别, item)]"""
+        now = time.time()
+        taken = []
+        while len(taken) < limit:
+            cls = self._pick()
+            if cls is None:
+                break
+            enq, item = self._queues[cls].popleft()
+            c = self.counters[cls]
+            c["processed"] += 1
+            c["wait_total"] += now - enq
+            taken.append((cls, item))
+        return taken
+
+    # ---------- 工作线程 ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._backlog() == 0:
+                    self._cond.wait()
+                if self._stopped:
+                    # 在锁内登记退出，start() 据此判断需要启动新线程
+                    if self._thread is threading.current_thread():
+                        self._thread = None
+                    return
+                self._shed()
+                limit = self.batch_size if self.batch_handler is not None else 1
+                taken = self._take(limit)
+                if not taken:
+                    continue
+                if len(taken) > 1:
+                    b = self.batches
+                    b["count"] += 1
+                    b["items"] += len(taken)
+                    b["max"] = max(b["max"], len(taken))
+            if len(taken) > 1:
+                fn, arg, detail = self.batch_handler, [item for _, item in taken], f"batch x{len(taken)}"
+            else:
+                fn, arg, detail = self.handler, taken[0][1], taken[0][0]
+            try:
+                if self.monitor is not None:
+                    with self.monitor.track(self.name, detail):
+                        fn(arg)
+                else:
+                    fn(arg)
+            except Exception as e:
+                log("ERROR", f"[{self.name}] 消息处理出错: {e}")
+                log("ERROR", traceback.format_exc())
+
+    def start(self):
+        """
+        启动工作线程；上次 stop() 后仍在处理最后一条消息的旧线程会继续运行
+        （_stopped 清除后它处理完当前消息即回到循环取下一条），不会再启动第二个线程
+        """
+        with self._cond:
+            self._stopped = False
+            if self._thread is not None and self._thread.is_alive():
+                self._cond.notify_all()
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, drop=True):
+        """停止工作线程；drop=True 时丢弃未处理的消息"""
+        with self._cond:
+            self._stopped = True
+            if drop:
+                for q in self._queues.values():
+                    q.clear()
+            self._cond.notify_all()
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._cond:
+            return memstats.measure({"queues": self._queues})
+
+    def stats(self):
+        now = time.time()
+        with self._cond:
+            out = {}
+            for c in PRIORITY_CLASSES:
+                q, cnt = self._queues[c], self.counters[c]
+                out[c] = {
+                    "backlog": len(q),
+                    "oldest_age": round(now - q[0][0], 2) if q else 0,
+                    "queued": cnt["queued"],
+                    "processed": cnt["processed"],
+                    "shed": cnt["shed"],
+                    "avg_wait_ms": round(cnt["wait_total"] * 1000 / cnt["processed"], 1) if cnt["processed"] else 0,
+                }
+            b = self.batches
+            batches = {"batch_size": self.batch_size, "count": b["count"], "max": b["max"],
+                       "avg_size": round(b["items"] / b["count"], 1) if b["count"] else 0}
+            return {"backlog": self._backlog(), "weights": dict(self.weights), "classes": out, "batches": batches}
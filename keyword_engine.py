@@ -0,0 +1,161 @@
+# keyword_engine.py
+# 关键词自动回复引擎：将 config.keyword_dict 编译为 Aho-Corasick 自动机，
+# 对每条消息只扫描一遍即可匹配成千上万个关键词
+# 匹配模式（keyword_dict 的键可带前缀单独指定，否则使用默认模式）：
+#   "=关键词"  exact    消息完全等于关键词
+#   "^关键词"  prefix   消息以关键词开头
+#   "关键词"   contains 消息包含关键词（默认，可由 keyword_match_mode 修改）
+# 配置变更时在后台线程重建自动机，完成后整体替换引用（原子切换），无需重启机器人
+import threading
+import time
+from collections import deque
+
+from logger import log
+
+MATCH_MODES = ("exact", "prefix", "contains")
+_MODE_MARKS = {"=": "exact", "^": "prefix"}
+# 同时命中多个关键词时的优先级：exact > prefix > contains，同级取最长
+_MODE_RANK = {"exact": 3, "prefix": 2, "contains": 1}
+
+
+def parse_keyword(key, default_mode="contains"):
+    """解析键的模式前缀，返回 (关键词, 模式)"""
+    key = str(key)
+    mode = _MODE_MARKS.get(key[:1])
+    if mode and len(key) > 1:
+        return key[1:].strip().lower(), mode
+    return key.strip().lower(), default_mode
+
+
+class Automaton:
+    """不可变的 Aho-Corasick 自动机（构建完成后只读，可被多线程并发查询）"""
+    __slots__ = ("goto", "fail", "out", "exact", "size", "build_ms")
+
+    def __init__(self, keyword_dict, default_mode="contains"):
+        t0 = time.perf_counter()
+        if default_mode not in MATCH_MODES:
+            default_mode = "contains"
+        # 节点 i：goto[i] 为 {字符: 子节点}，out[i] 为 [(关键词长度, 模式, 回复)]
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.exact = {}
+        self.size = 0
+        for key, reply in (keyword_dict or {}).items():
+            word, mode = parse_keyword(key, default_mode)
+            if not word or reply is None or str(reply) == "":
+                continue
+            self.size += 1
+            if mode == "exact":
+                self.exact[word] = str(reply)
+                continue
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append((len(word), mode, str(reply)))
+        self._build_fail()
+        self.build_ms = (time.perf_counter() - t0) * 1000
+
+    def _build_fail(self):
+        """BFS 构建失败指针，并将失败链上的输出合并到当前节点"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                if self.out[self.fail[child]]:
+                    self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def match(self, text):
+        """返回最佳匹配 (模式, 关键词长度, 回复)，未命中返回 None"""
+        if not text:
+            return None
+        text = text.strip().lower()
+        reply = self.exact.get(text)
+        if reply is not None:
+            return ("exact", len(text), reply)
+        best = None
+        best_key = (0, 0)
+        node = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, mode, rep in out[node]:
+                if mode == "prefix" and i + 1 != length:
+                    continue
+                key = (_MODE_RANK[mode], length)
+                if key > best_key:
+                    best_key = key
+                    best = (mode, length, rep)
+        return best
+
+
+class KeywordReplyEngine:
+    """
+    关键词回复引擎
+    - match() 读取当前自动机引用，无锁
+    - rebuild()/rebuild_async() 构建新自动机后一次性替换引用
+    """
+    def __init__(self, keyword_dict=None, default_mode="contains"):
+        self._automaton = Automaton(keyword_dict or {}, default_mode)
+        self._build_lock = threading.Lock()
+        self._pending = None
+        self.hits = 0
+        self.lookups = 0
+
+    def rebuild(self, keyword_dict, default_mode="contains"):
+        automaton = Automaton(keyword_dict, default_mode)
+        self._automaton = automaton  # 引用赋值是原子的，查询线程不会看到半成品
+        log("INFO", f"关键词自动机已重建：{automaton.size} 个关键词，{len(automaton.goto)} 个节点，耗时 {automaton.build_ms:.1f}ms")
+        return automaton
+
+    def rebuild_async(self, keyword_dict, default_mode="contains"):
+        """在后台线程重建；构建期间的多次请求只保留最新一次"""
+        with self._build_lock:
+            running = self._pending is not None
+            self._pending = (dict(keyword_dict or {}), default_mode)
+            if running:
+                return
+
+        def worker():
+            while True:
+                with self._build_lock:
+                    args = self._pending
+                    if args is None:
+                        return
+                try:
+                    self.rebuild(*args)
+                except Exception as e:
+                    log("ERROR", f"关键词自动机重建失败: {e}")
+                with self._build_lock:
+                    if self._pending is args:
+                        self._pending = None
+                        return
+        threading.Thread(target=worker, name="keyword-rebuild", daemon=True).start()
+
+    def match(self, text):
+        """返回回复文本，未命中返回 None"""
+        self.lookups += 1
+        res = self._automaton.match(text)
+        if res is None:
+            return None
+        self.hits += 1
+        return res[2]
+
+    def stats(self):
+        a = self._automaton
+        return {"keywords": a.size, "nodes": len(a.goto), "build_ms": round(a.build_ms, 2),
+                "lookups": self.lookups, "hits": self.hits}
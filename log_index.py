@@ -0,0 +1,280 @@
+# log_index.py
+# 历史日志全文索引：对 ./logs/log_YYMMDD.txt 建立增量倒排索引
+# - 每个文件只完整索引一次，之后按字节偏移追读（tail）新增内容
+# - 支持按文本、级别、日期范围、插件过滤，分页返回
+# 可被 web_server 直接 import 使用
+import os
+import re
+import threading
+from array import array
+from datetime import datetime
+
+LOG_PATH = "./logs"
+
+# 日志文件名：log_YYMMDD.txt
+_FILE_RE = re.compile(r"^log_(\d{6})\.txt$")
+# 兼容以下行格式：
+#   [2025-01-01 12:00:00] [INFO] [模块] msg   （logger 统一日志）
+#   [2025-01-01 12:00:00] [INFO] msg          （旧版主程序 log_server）
+#   2025/01/01 12:00:00 [INFO] msg            （旧版 logger.log）
+_LINE_RE = re.compile(r"^\[?(\d{4}[-/]\d{2}[-/]\d{2} \d{2}:\d{2}:\d{2})\]? \[([A-Za-z]+)\] ?(.*)$")
+# 插件名：取 "插件 xxx" 这类主程序日志，或 "[plugins.xxx_plugin]" / "[xxx_plugin]" 模块标签（以先出现者为准）
+_PLUGIN_RE = re.compile(r"插件\s*([^\s:：，,()（）]+)|\[(?:plugins\.)?([A-Za-z0-9_]+_plugin)\]")
+# 分词：ASCII 单词 + 中文单字/双字
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CJK_RE = re.compile(r"[㐀-鿿]+")
+
+
+def tokenize(text):
+    """将文本切分为索引词：英文数字按单词（小写），中文按单字与相邻双字"""
+    tokens = set()
+    for w in _WORD_RE.findall(text):
+        tokens.add(w.lower())
+    for seg in _CJK_RE.findall(text):
+        for i, ch in enumerate(seg):
+            tokens.add(ch)
+            if i + 1 < len(seg):
+                tokens.add(seg[i:i + 2])
+    return tokens
+
+
+def _query_tokens(text):
+    """查询分词：中文有双字时只用双字（更精确），否则退化为单字"""
+    tokens = set(w.lower() for w in _WORD_RE.findall(text))
+    for seg in _CJK_RE.findall(text):
+        if len(seg) == 1:
+            tokens.add(seg)
+        else:
+            for i in range(len(seg) - 1):
+                tokens.add(seg[i:i + 2])
+    return tokens
+
+
+def _parse_ts(s):
+    try:
+        return int(datetime.strptime(s.replace("/", "-"), "%Y-%m-%d %H:%M:%S").timestamp())
+    except ValueError:
+        return 0
+
+
+class LogIndex:
+    """
+    日志倒排索引
+    每条日志在内存中只保留紧凑的元数据（文件、偏移、长度、时间、级别、插件），
+    正文按需从文件读取；倒排表使用 array('I') 存储条目编号，内存占用小。
+    """
+    def __init__(self, log_path: str = LOG_PATH):
+        self.log_path = log_path
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # 文件状态：name -> {'id': int, 'offset': 已索引字节数, 'day': 'YYMMDD'}
+        self.files = {}
+        self.file_names = []
+        # 条目元数据（按条目编号对齐的并行数组）
+        self.e_file = array('H')
+        self.e_offset = array('Q')
+        self.e_length = array('I')
+        self.e_ts = array('q')
+        self.e_level = array('B')
+        self.e_plugin = array('H')
+        # 级别/插件名字典化
+        self.levels = []
+        self.level_ids = {}
+        self.plugins = [""]
+        self.plugin_ids = {"": 0}
+        # 倒排表：token -> array('I') 条目编号（递增）
+        self.postings = {}
+        self.indexed_bytes = 0
+
+    # ---------- 索引构建 ----------
+    def _level_id(self, level):
+        level = level.upper()
+        lid = self.level_ids.get(level)
+        if lid is None:
+            lid = len(self.levels)
+            self.levels.append(level)
+            self.level_ids[level] = lid
+        return lid
+
+    def _plugin_id(self, message):
+        m = _PLUGIN_RE.search(message)
+        if not m:
+            return 0
+        name = m.group(1) or m.group(2)
+        pid = self.plugin_ids.get(name)
+        if pid is None:
+            pid = len(self.plugins)
+            self.plugins.append(name)
+            self.plugin_ids[name] = pid
+        return pid
+
+    def _add_tokens(self, eid, text):
+        for tok in tokenize(text):
+            lst = self.postings.get(tok)
+            if lst is None:
+                lst = self.postings[tok] = array('I')
+            if not lst or lst[-1] != eid:
+                lst.append(eid)
+
+    def _index_file(self, name):
+        """从上次偏移处继续索引文件，只处理完整的行"""
+        path = os.path.join(self.log_path, name)
+        st = self.files.get(name)
+        if st is None:
+            day = _FILE_RE.match(name).group(1)
+            st = {'id': len(self.file_names), 'offset': 0, 'day': day}
+            self.files[name] = st
+            self.file_names.append(name)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 0
+        if size < st['offset']:
+            # 文件被截断/替换，已有倒排无法局部撤销，交给上层重建
+            raise _Truncated(name)
+        if size == st['offset']:
+            return 0
+        added = 0
+        with open(path, 'rb') as f:
+            f.seek(st['offset'])
+            pos = st['offset']
+            last_eid = len(self.e_offset) - 1 if self.e_file and self.e_file[-1] == st['id'] else -1
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # 半行，等待下次追读
+                line = raw.decode('utf-8', errors='replace').lstrip('﻿').rstrip('\r\n')
+                m = _LINE_RE.match(line)
+                if m:
+                    ts, level, message = m.groups()
+                    eid = len(self.e_offset)
+                    self.e_file.append(st['id'])
+                    self.e_offset.append(pos)
+                    self.e_length.append(len(raw))
+                    self.e_ts.append(_parse_ts(ts))
+                    self.e_level.append(self._level_id(level))
+                    self.e_plugin.append(self._plugin_id(message))
+                    self._add_tokens(eid, message)
+                    last_eid = eid
+                    added += 1
+                elif last_eid >= 0 and line:
+                    # 续行（如 traceback）并入上一条
+                    self.e_length[last_eid] += len(raw)
+                    self._add_tokens(last_eid, line)
+                pos += len(raw)
+        self.indexed_bytes += pos - st['offset']
+        st['offset'] = pos
+        return added
+
+    def refresh(self):
+        """扫描日志目录：新文件完整索引，已有文件只追读新增部分"""
+        with self._lock:
+            if not os.path.isdir(self.log_path):
+                return 0
+            names = sorted(n for n in os.listdir(self.log_path) if _FILE_RE.match(n))
+            added = 0
+            try:
+                for name in names:
+                    added += self._index_file(name)
+            except _Truncated:
+                self._reset()
+                for name in names:
+                    added += self._index_file(name)
+            return added
+
+    # ---------- 查询 ----------
+    def _candidates(self, text):
+        tokens = _query_tokens(text or "")
+        if not tokens:
+            return None  # 不限文本
+        lists = []
+        for tok in tokens:
+            lst = self.postings.get(tok)
+            if not lst:
+                return []
+            lists.append(lst)
+        lists.sort(key=len)
+        result = set(lists[0])
+        for lst in lists[1:]:
+            result.intersection_update(lst)
+            if not result:
+                break
+        return sorted(result)
+
+    def _read_entry(self, eid, handles):
+        name = self.file_names[self.e_file[eid]]
+        f = handles.get(name)
+        if f is None:
+            f = handles[name] = open(os.path.join(self.log_path, name), 'rb')
+        f.seek(self.e_offset[eid])
+        raw = f.read(self.e_length[eid])
+        return raw.decode('utf-8', errors='replace').lstrip('﻿').rstrip('\r\n').replace('\r\n', '\n')
+
+    def search(self, text="", level=None, start=None, end=None, plugin=None, page=1, page_size=50):
+        """
+        查询日志，结果按时间倒序
+        level: 级别（可逗号分隔多个）；start/end: datetime 或时间戳；plugin: 插件名
+        返回 {'total', 'page', 'page_size', 'items': [{'time','level','plugin','file','message'}]}
+        """
+        self.refresh()
+        with self._lock:
+            cand = self._candidates(text)
+            if cand is None:
+                cand = range(len(self.e_offset))
+            level_set = None
+            if level:
+                level_set = {self.level_ids.get(l.strip().upper(), -1) for l in str(level).split(',') if l.strip()}
+            plugin_id = self.plugin_ids.get(plugin, -1) if plugin else None
+            start_ts = int(start.timestamp()) if isinstance(start, datetime) else start
+            end_ts = int(end.timestamp()) if isinstance(end, datetime) else end
+
+            matched = []
+            for eid in reversed(cand):
+                if level_set is not None and self.e_level[eid] not in level_set:
+                    continue
+                if plugin_id is not None and self.e_plugin[eid] != plugin_id:
+                    continue
+                ts = self.e_ts[eid]
+                if start_ts is not None and ts < start_ts:
+                    continue
+                if end_ts is not None and ts > end_ts:
+                    continue
+                matched.append(eid)
+
+            page = max(1, int(page))
+            page_size = max(1, min(int(page_size), 500))
+            sel = matched[(page - 1) * page_size: page * page_size]
+            handles = {}
+            items = []
+            try:
+                for eid in sel:
+                    items.append({
+                        'time': datetime.fromtimestamp(self.e_ts[eid]).strftime('%Y-%m-%d %H:%M:%S'),
+                        'level': self.levels[self.e_level[eid]],
+                        'plugin': self.plugins[self.e_plugin[eid]],
+                        'file': self.file_names[self.e_file[eid]],
+                        'message': self._read_entry(eid, handles),
+                    })
+            finally:
+                for f in handles.values():
+                    f.close()
+            return {'total': len(matched), 'page': page, 'page_size': page_size, 'items': items}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self.file_names),
+                'entries': len(self.e_offset),
+                'tokens': len(self.postings),
+                'indexed_bytes': self.indexed_bytes,
+                'plugins': self.plugins[1:],
+            }
+
+
+class _Truncated(Exception):
+    pass
+
+
+# 全局索引实例（web 端使用）
+log_index = LogIndex(LOG_PATH)
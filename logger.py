@@ -1,62 +1,251 @@
 # logger.py
-# 通用日志模块：控制台输出 + 内存缓存（web 用）+ 本地文件记录
-# 可被主程序与插件 import 复用
+# 通用日志模块：主程序、网页端、插件共用的一套日志系统
+# - 按模块名分级（点号层级，如 "plugins.search_plugin" 继承 "plugins" 的级别），可在运行时修改
+# - 惰性格式化：log.debug("x=%s", x) 只有通过级别过滤后才拼接字符串、取时间
+# - 统一输出管道：控制台 + 内存缓存（web 用）+ 本地文件（按天分文件，供 log_index 检索）
+# - 兼容旧接口：log(level, message) 以及主程序/插件的 log(message, level)
+# 可被主程序与插件 import 复用：
+#   from logger import get_logger
+#   _log = get_logger("plugins.my_plugin")
+#   _log.info("查询 %s 成功", city)
+from collections import deque
 from datetime import datetime
 import os
 import threading
+import time
+
+import memstats
 
 LOG_PATH = "./logs"
 _lock = threading.Lock()
 
-# 内存中的最近日志（可供 web 前端读取）
-log_messages = []
+# 级别（SUCCESS 介于 INFO 与 WARNING 之间，沿用原有的五个级别）
+LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+DEFAULT_LEVEL = "INFO"
 
 # 限制内存日志条数
 MAX_MEM_LOG = 2000
 
-def log_server(level, msg):
-    """
-    将日志写到内存缓存（供 web 页面读取）并输出到控制台。
-    level: "INFO","ERROR","WARNING","DEBUG","SUCCESS"
-    """
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    entry = {
-        'time': timestamp,
-        'level': level,
-        'message': msg
-    }
+
+def _level_no(level):
+    if isinstance(level, int):
+        return level
+    return LEVELS.get(str(level).upper(), LEVELS["INFO"])
+
+
+# ====== 日志记录 ======
+class LogRecord:
+    """一条日志；message/time 在首次访问时才生成（只对通过过滤的记录发生）"""
+    __slots__ = ("created", "level", "name", "msg", "args", "_message", "_time")
+
+    def __init__(self, level, name, msg, args):
+        self.created = time.time()
+        self.level = level
+        self.name = name
+        self.msg = msg
+        self.args = args
+        self._message = None
+        self._time = None
+
+    @property
+    def message(self):
+        if self._message is None:
+            msg = self.msg() if callable(self.msg) else self.msg
+            if self.args:
+                try:
+                    msg = str(msg) % self.args
+                except (TypeError, ValueError):
+                    msg = " ".join([str(msg), *map(str, self.args)])
+            self._message = str(msg)
+        return self._message
+
+    @property
+    def time(self):
+        if self._time is None:
+            self._time = _format_time(self.created)
+        return self._time
+
+
+# 时间戳按秒缓存，同一秒内的日志不再重复 strftime
+# 缓存为不可变的 (秒, 文本) 元组，整体替换：多线程并发读写也不会取到秒与文本不匹配的组合
+_time_cache = (0, "")
+
+
+def _format_time(ts):
+    global _time_cache
+    sec = int(ts)
+    cached = _time_cache
+    if cached[0] != sec:
+        cached = (sec, datetime.fromtimestamp(sec).strftime('%Y-%m-%d %H:%M:%S'))
+        _time_cache = cached
+    return cached[1]
+
+
+# ====== 输出端（sink） ======
+class ConsoleSink:
+    def emit(self, record, line):
+        print(line)
+
+
+class MemorySink:
+    """最近日志缓存（网页端读取）"""
+    def __init__(self, size=MAX_MEM_LOG):
+        self.entries = deque(maxlen=size)
+
+    def emit(self, record, line):
+        self.entries.append({'time': record.time, 'level': record.level,
+                             'module': record.name, 'message': record.message})
+
+    def recent(self, limit):
+        n = len(self.entries)
+        return [self.entries[i] for i in range(max(0, n - limit), n)]
+
+
+class FileSink:
+    """按天写入 ./logs/log_YYMMDD.txt，文件句柄保持打开，跨天自动切换"""
+    def __init__(self, path=LOG_PATH):
+        self.path = path
+        self._day = None
+        self._fp = None
+
+    def _open(self, day):
+        if self._fp:
+            self._fp.close()
+        os.makedirs(self.path, exist_ok=True)
+        self._fp = open(os.path.join(self.path, f'log_{day}.txt'), 'a', encoding='utf-8')
+        self._day = day
+
+    def emit(self, record, line):
+        try:
+            day = datetime.fromtimestamp(record.created).strftime("%y%m%d")
+            if day != self._day:
+                self._open(day)
+            self._fp.write(line + '\n')
+            self._fp.flush()
+        except Exception as e:
+            self._day = None
+            print("logger write file error:", e)
+
+
+memory_sink = MemorySink()
+sinks = [ConsoleSink(), memory_sink, FileSink()]
+
+
+def _dispatch(record):
+    # 行格式与 log_index 的解析规则一致：[YYYY-MM-DD HH:MM:SS] [LEVEL] [模块] 消息
+    tag = f"[{record.name}] " if record.name else ""
+    line = f"[{record.time}] [{record.level}] {tag}{record.message}"
     with _lock:
-        log_messages.append(entry)
-        if len(log_messages) > MAX_MEM_LOG:
-            log_messages.pop(0)
-    # 控制台输出
-    print(f"[{timestamp}] [{level}] {msg}")
-
-def write_file(msg):
-    """将单行日志写入文件（按天分文件）"""
-    try:
-        now_day = datetime.now().strftime("%y%m%d")
-        if not os.path.exists(LOG_PATH):
-            os.makedirs(LOG_PATH, exist_ok=True)
-        with open(os.path.join(LOG_PATH, f'log_{now_day}.txt'), 'a', encoding='utf-8') as f:
-            f.write(msg + '\n')
-    except Exception as e:
-        print("logger write file error:", e)
-
-def log(level="INFO", message=''):
+        for sink in sinks:
+            try:
+                sink.emit(record, line)
+            except Exception:
+                pass
+
+
+# ====== 分级：按模块名（点号层级）查找生效级别 ======
+_levels = {"": LEVELS[DEFAULT_LEVEL]}
+_generation = [0]  # 级别表变化时递增，Logger 据此刷新缓存
+
+
+def set_level(name, level):
+    """设置某个模块（及其子模块）的级别；name="" 为全局默认"""
+    with _lock:
+        _levels[name or ""] = _level_no(level)
+        _generation[0] += 1
+
+
+def set_levels(mapping):
+    """用 {模块名: 级别} 整体替换级别表（config.json 的 log_levels 段）"""
+    with _lock:
+        _levels.clear()
+        _levels[""] = LEVELS[DEFAULT_LEVEL]
+        for name, level in (mapping or {}).items():
+            _levels[name or ""] = _level_no(level)
+        _generation[0] += 1
+
+
+def get_levels():
+    names = {v: k for k, v in LEVELS.items()}
+    with _lock:
+        return {name: names.get(no, no) for name, no in _levels.items()}
+
+
+def _effective_level(name):
+    while True:
+        if name in _levels:
+            return _levels[name]
+        if not name:
+            return _levels.get("", LEVELS[DEFAULT_LEVEL])
+        name = name.rpartition(".")[0]
+
+
+class Logger:
+    def __init__(self, name=""):
+        self.name = name
+        self._gen = -1
+        self._level = 0
+
+    def enabled(self, level):
+        if self._gen != _generation[0]:
+            self._level = _effective_level(self.name)
+            self._gen = _generation[0]
+        return _level_no(level) >= self._level
+
+    def log(self, level, msg, *args):
+        """msg 可带 %s 占位符（args 惰性代入），也可以是返回字符串的函数"""
+        level = str(level).upper()
+        if not self.enabled(level):
+            return
+        _dispatch(LogRecord(level, self.name, msg, args))
+
+    def debug(self, msg, *args):
+        self.log("DEBUG", msg, *args)
+
+    def info(self, msg, *args):
+        self.log("INFO", msg, *args)
+
+    def success(self, msg, *args):
+        self.log("SUCCESS", msg, *args)
+
+    def warning(self, msg, *args):
+        self.log("WARNING", msg, *args)
+
+    def error(self, msg, *args):
+        self.log("ERROR", msg, *args)
+
+
+_loggers = {}
+
+
+def get_logger(name=""):
+    """获取（或创建）模块日志器"""
+    lg = _loggers.get(name)
+    if lg is None:
+        lg = _loggers.setdefault(name, Logger(name))
+    return lg
+
+
+_root = get_logger("")
+
+
+def log(level="INFO", message='', *args):
     """
-    统一日志接口，主程序与插件请调用此函数。
-    level: INFO/WARNING/ERROR/DEBUG/SUCCESS
+    统一日志接口（兼容旧调用）：log(level, message)
+    若误按主程序习惯写成 log(message, level)，也能自动识别
     """
-    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-    full = f"{timestamp} [{level}] {message}"
-    log_server(level, message)
-    try:
-        write_file(full)
-    except Exception:
-        pass
+    if str(level).upper() not in LEVELS and str(message).upper() in LEVELS:
+        level, message = message, level
+    _root.log(level, message, *args)
+
+
+# 内存日志缓存的大小（供 /api/memory 使用）
+def memory_stats():
+    with _lock:
+        return memstats.measure({"log_buffer": memory_sink.entries})
+
 
 # 读取内存缓存（web 前端可调用）
 def get_recent_logs(limit=200):
     with _lock:
-        return log_messages[-limit:]
\ No newline at end of file
+        return memory_sink.recent(limit)
@@ -0,0 +1,192 @@
+# memstats.py
+# 内存诊断：进程 RSS、tracemalloc 快照与快照间差异、进程内主要数据结构大小、按来源分组的线程数
+# 供 web_server 的 /api/memory 接口使用；tracemalloc 默认关闭（有性能开销），按需开启
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+MAX_SNAPSHOTS = 5         # 最多保留的快照数（超出丢弃最早的）
+DEEP_SIZE_LIMIT = 20000   # 递归估算对象大小时最多访问的对象数
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()  # id -> (时间, tracemalloc.Snapshot)
+_seq = [0]
+
+# 过滤 tracemalloc 自身与导入机制的分配
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+# ====== RSS ======
+def rss_bytes():
+    """进程常驻内存（字节）：优先 psutil，其次 /proc（Linux），再次 Win32 API；都不可用返回 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except Exception:
+            pass
+    return None
+
+
+# ====== tracemalloc ======
+def tracing_status():
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "snapshots": list(_snapshots)}
+    current, peak = tracemalloc.get_traced_memory()
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit(),
+            "current": current, "peak": peak, "snapshots": list(_snapshots)}
+
+
+def start_tracing(frames=1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, int(frames)))
+    return tracing_status()
+
+
+def stop_tracing():
+    """停止追踪并清空已保存的快照"""
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+    return tracing_status()
+
+
+def take_snapshot():
+    """保存一个快照，返回快照 id；未开启追踪时抛 RuntimeError"""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc 未开启")
+    snap = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    with _lock:
+        _seq[0] += 1
+        sid = _seq[0]
+        _snapshots[sid] = (time.time(), snap)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return sid
+
+
+def _get_snapshot(sid):
+    with _lock:
+        item = _snapshots.get(int(sid))
+    if item is None:
+        raise KeyError(f"快照 {sid} 不存在")
+    return item[1]
+
+
+def _frame(stat_or_diff):
+    frame = stat_or_diff.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def top(sid=None, limit=20, group_by="lineno"):
+    """某个快照（默认现拍一个不保存的）中占用最多的位置"""
+    snap = _get_snapshot(sid) if sid else tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    stats = snap.statistics(group_by)[:limit]
+    return [{"where": _frame(s) if group_by == "lineno" else s.traceback[0].filename,
+             "size": s.size, "count": s.count} for s in stats]
+
+
+def diff(a, b=None, limit=20, group_by="lineno"):
+    """两个快照之间的差异（b 缺省为当前），按增长量排序"""
+    old = _get_snapshot(a)
+    new = _get_snapshot(b) if b else tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    stats = new.compare_to(old, group_by)[:limit]
+    return [{"where": _frame(s) if group_by == "lineno" else s.traceback[0].filename,
+             "size": s.size, "size_diff": s.size_diff, "count": s.count, "count_diff": s.count_diff}
+            for s in stats]
+
+
+# ====== 数据结构大小 ======
+def deep_sizeof(obj, limit=DEEP_SIZE_LIMIT):
+    """递归估算容器占用（字节），访问对象数超过 limit 时停止（结果为下限）"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)) or type(o).__name__ == "deque":
+            stack.extend(o)
+        elif hasattr(o, "__slots__") and not isinstance(o, type):
+            # 只展开 __slots__ 记录对象（缓存条目、令牌桶等），不追踪普通对象的引用，避免遍历整个对象图
+            stack.extend(getattr(o, s) for s in o.__slots__ if hasattr(o, s))
+    return total
+
+
+def measure(structures):
+    """structures: {名称: 对象}，返回 {名称: {'items', 'bytes'}}"""
+    out = {}
+    for name, obj in structures.items():
+        try:
+            items = len(obj)
+        except TypeError:
+            items = None
+        out[name] = {"items": items, "bytes": deep_sizeof(obj)}
+    return out
+
+
+# ====== 线程 ======
+def threads_by_origin(plugin_modules=()):
+    """
+    按启动来源对存活线程分组：取线程目标函数的模块名（thread._target.__module__），
+    属于插件模块的记为 plugin:<名称>，线程池工作线程按线程名前缀归类
+    """
+    plugin_modules = set(plugin_modules)
+    groups = {}
+    for t in threading.enumerate():
+        target = getattr(t, "_target", None)
+        module = getattr(target, "__module__", None) or ""
+        if module in plugin_modules:
+            origin = f"plugin:{module}"
+        elif module.startswith("concurrent.futures"):
+            origin = f"pool:{t.name.rsplit('_', 1)[0]}"
+        elif t is threading.main_thread():
+            origin = "main"
+        else:
+            origin = module or t.name
+        g = groups.setdefault(origin, {"count": 0, "daemon": 0, "names": []})
+        g["count"] += 1
+        g["daemon"] += int(t.daemon)
+        if len(g["names"]) < 5:
+            g["names"].append(t.name)
+    return {"total": threading.active_count(),
+            "groups": dict(sorted(groups.items(), key=lambda kv: -kv[1]["count"]))}
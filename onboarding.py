@@ -0,0 +1,220 @@
+# onboarding.py
+# 新好友接待队列：把「通过好友 -> 发送欢迎语/文件 -> 切换页面」拆成带执行时间的步骤，
+# 由调度器按时间逐步执行，主循环不再 sleep 等待
+# - 队列持久化到 onboarding_queue.json，重启后继续发送未完成的欢迎语
+# - 提供吞吐量与积压统计（stats）
+import json
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+
+import memstats
+from logger import log
+
+QUEUE_FILE = "onboarding_queue.json"
+
+ACCEPT_DELAY = 2          # 通过好友后首条欢迎语的延迟（秒）
+SEND_GAP = (1, 3)         # 欢迎语之间的随机间隔（秒）
+SWITCH_GAP = 1            # 切换聊天页/通讯录页的间隔（秒）
+RETRY_DELAY = 30          # 步骤失败后的重试延迟（秒）
+MAX_ATTEMPTS = 3          # 单个步骤最大尝试次数
+THROUGHPUT_WINDOW = 600   # 吞吐量统计窗口（秒）
+OFFLINE_RETRY = 5         # 有到期步骤但微信客户端未就绪时，隔多久再检查（秒）
+
+
+class OnboardingQueue:
+    """
+    新好友接待任务队列
+    步骤格式：{'id', 'friend', 'kind', 'payload', 'due', 'attempts'}
+    kind: accept（通过申请）/ text（发送文本）/ file（发送文件）/ switch_chat / switch_contact
+    accept 步骤依赖 GetNewFriends 返回的对象，无法持久化；重启后该申请会被重新发现
+    """
+    def __init__(self, bot, queue_file: str = QUEUE_FILE):
+        self.bot = bot
+        self.queue_file = queue_file
+        self._lock = threading.Lock()
+        self._pump_lock = threading.Lock()   # 同一时刻只有一轮 pump 操作界面，保证步骤顺序
+        self._steps = []          # 按 due 排序的待执行步骤
+        self._handles = {}        # friend -> GetNewFriends 返回的申请对象
+        self._seq = 0
+        self._pump_job = None
+        self._pump_due = None
+        self._done_times = deque()
+        self.counters = {"friends": 0, "done": 0, "failed": 0, "retried": 0}
+        self._load()
+
+    # ---------- 持久化 ----------
+    def _load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            steps = [s for s in data.get("steps", []) if s.get("kind") != "accept"]
+            self._steps = sorted(steps, key=lambda s: s["due"])
+            self._seq = max([s["id"] for s in steps], default=0)
+            if self._steps:
+                log("INFO", f"已恢复新好友接待队列：{len(self._steps)} 个待执行步骤")
+        except Exception as e:
+            log("ERROR", f"读取新好友接待队列失败: {e}")
+
+    def _save(self):
+        """原子写入（先写临时文件再替换）"""
+        try:
+            tmp = self.queue_file + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"steps": self._steps}, f, ensure_ascii=False)
+            os.replace(tmp, self.queue_file)
+        except Exception as e:
+            log("ERROR", f"保存新好友接待队列失败: {e}")
+
+    # ---------- 入队 ----------
+    def _push(self, friend, kind, payload, due):
+        self._seq += 1
+        step = {"id": self._seq, "friend": friend, "kind": kind, "payload": payload, "due": due, "attempts": 0}
+        self._steps.append(step)
+        return step
+
+    def poll(self):
+        """发现新好友申请并入队（定时任务调用，不等待）"""
+        wx = self.bot.wx
+        if not wx or not self.bot.config.new_friend_switch:
+            return
+        newfriends = wx.GetNewFriends(acceptable=True)
+        if not newfriends:
+            return
+        now = time.time()
+        added = 0
+        with self._lock:
+            queued = {s["friend"] for s in self._steps if s["kind"] == "accept"}
+            for new in newfriends:
+                name = getattr(new, "name", "")
+                if not name or name in queued:
+                    continue
+                self._handles[name] = new
+                self._push(name, "accept", name + "_机器人备注", now)
+                added += 1
+            if added:
+                self.counters["friends"] += added
+                self._steps.sort(key=lambda s: s["due"])
+                self._save()
+        if added:
+            log("INFO", f"发现 {added} 个新的好友申请，已加入接待队列")
+            self.schedule_pump()
+
+    def _plan_welcome(self, remark, start):
+        """通过好友后生成欢迎语与页面切换步骤（调用方持锁）"""
+        due = start
+        for msg in self.bot.config.new_friend_msg:
+            kind = "file" if os.path.isfile(msg) else "text"
+            self._push(remark, kind, msg, due)
+            due += random.randint(*SEND_GAP)
+        self._push(remark, "switch_chat", None, due)
+        self._push(remark, "switch_contact", None, due + SWITCH_GAP)
+        self._steps.sort(key=lambda s: s["due"])
+
+    # ---------- 执行 ----------
+    def schedule_pump(self, not_before=None):
+        """按最早到期步骤安排一次执行（不早于 not_before）；已安排的更早执行则保持不变"""
+        scheduler = self.bot.scheduler
+        if scheduler is None:
+            return
+        with self._lock:
+            if not self._steps:
+                return
+            due = max(self._steps[0]["due"], not_before or 0)
+            if self._pump_job is not None and not self._pump_job.cancelled and self._pump_due <= due:
+                return
+            if self._pump_job is not None:
+                scheduler.cancel(self._pump_job)
+            self._pump_due = due
+            self._pump_job = scheduler.after(max(0.0, due - time.time()), self.pump, name="onboarding_pump")
+
+    def _execute(self, step):
+        """执行单个步骤（不持锁，界面操作可能耗时数秒）；accept 成功时返回备注名"""
+        wx = self.bot.wx
+        kind = step["kind"]
+        if kind == "accept":
+            with self._lock:
+                handle = self._handles.pop(step["friend"], None)
+            if handle is None:
+                return None  # 申请对象已失效，等待下次 poll 重新发现
+            remark = step["payload"]
+            handle.accept(remark=remark)
+            log("INFO", f"已接受好友：{step['friend']} 并备注为 {remark}")
+            return remark
+        elif kind == "text":
+            wx.SendMsg(who=step["friend"], msg=step["payload"])
+        elif kind == "file":
+            wx.SendFiles(who=step["friend"], filepath=step["payload"])
+        elif kind == "switch_chat":
+            wx.SwitchToChat()
+        elif kind == "switch_contact":
+            wx.SwitchToContact()
+        return None
+
+    def pump(self):
+        """执行所有已到期的步骤，然后为下一个步骤安排执行；锁只在取出步骤与记录结果时持有"""
+        if not self._pump_lock.acquire(blocking=False):
+            return  # 另一轮正在执行，它结束时会重新安排
+        offline = False
+        try:
+            with self._lock:
+                self._pump_job = None
+            while True:
+                with self._lock:
+                    if not self._steps or self._steps[0]["due"] > time.time():
+                        break
+                    if not self.bot.wx:
+                        offline = True  # 步骤已到期但客户端未就绪：退避后再查，避免立即重排形成空转
+                        break
+                    step = self._steps.pop(0)
+                error = None
+                try:
+                    remark = self._execute(step)
+                except Exception as e:
+                    error, detail = e, traceback.format_exc()
+                with self._lock:
+                    if error is None:
+                        self.counters["done"] += 1
+                        self._done_times.append(time.time())
+                        if remark:
+                            self._plan_welcome(remark, time.time() + ACCEPT_DELAY)
+                    else:
+                        step["attempts"] += 1
+                        if step["attempts"] < MAX_ATTEMPTS and step["kind"] != "accept":
+                            step["due"] = time.time() + RETRY_DELAY
+                            self._steps.append(step)
+                            self._steps.sort(key=lambda s: s["due"])
+                            self.counters["retried"] += 1
+                            log("WARNING", f"新好友接待步骤 {step['kind']}（{step['friend']}）失败，{RETRY_DELAY}s 后重试: {error}")
+                        else:
+                            self.counters["failed"] += 1
+                            log("ERROR", f"处理新好友 {step['friend']} 失败: {error}")
+                            log("ERROR", detail)
+                    self._save()
+        finally:
+            self._pump_lock.release()
+        self.schedule_pump(time.time() + OFFLINE_RETRY if offline else None)
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"steps": self._steps, "handles": self._handles})
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            while self._done_times and now - self._done_times[0] > THROUGHPUT_WINDOW:
+                self._done_times.popleft()
+            oldest = min((s["due"] for s in self._steps), default=None)
+            return {
+                **self.counters,
+                "backlog": len(self._steps),
+                "backlog_friends": len({s["friend"] for s in self._steps}),
+                "oldest_due_age": round(max(0.0, now - oldest), 1) if oldest else 0,
+                "steps_per_min": round(len(self._done_times) * 60 / THROUGHPUT_WINDOW, 2),
+            }
@@ -0,0 +1,332 @@
+# outbound.py
+# 统一的消息发送通道：长消息按条目/行边界切分 + 单线程流水线发送 + 自适应节流
+# - split_message：优先在空行（条目之间）切分，其次按行，单行过长才在空白处硬切
+# - send_text：切分后放入该聊天的发送队列立即返回，只有第一段 @ 发送者
+# - 发送线程按聊天轮询发送，间隔根据实际发送耗时与失败情况自适应调整
+# - 传入 ctx（context.Context）时，上下文已取消/超时的回复不再发送（含尚未发出的后续段）
+# - 回复合并（按需启用）：调用方传入 coalesce 键的回复，同一聊天在 window 秒内相同键的回复合并为一次发送并
+#   @ 所有请求者；这类回复先等待 hold 秒以便合并，原回复已发出时后续请求者改为收到一条简短的「同上」提醒；
+#   未传 coalesce 键的回复（关键词回复等）不受影响，也不会被延迟；transient=True 的过渡提示（「正在查询…」）
+#   只合并尚未发出的那一条，已发出后再来的请求者直接略去，不发「同上」
+# 主程序与插件均可复用：from outbound import send_text
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import memstats
+from logger import log
+
+DEFAULT_MAX_LEN = 2000    # 单条消息最大长度（可由 config.json 的 outbound_max_len 覆盖）
+MIN_GAP = 0.2             # 同一聊天两段之间的最小间隔（秒）
+MAX_GAP = 5.0             # 发送失败后退避的最大间隔（秒）
+MAX_RETRY = 2             # 单段发送失败的重试次数
+
+_settings = {"max_len": DEFAULT_MAX_LEN}
+
+# 回复合并默认关闭（插件工作进程等独立使用本模块时不额外延迟），由主程序按 config.json 的 reply_coalesce 段开启
+COALESCE_DEFAULTS = {
+    "enabled": False,
+    "window": 60,            # 合并窗口（秒）：窗口内相同回复只完整发送一次
+    "hold": 2.0,             # 带合并键的回复发出前等待的秒数，期间到达的相同回复直接合并进同一次发送
+    "ref_text": "↑ 同上",    # 原回复已发出后，后续请求者收到的提醒
+}
+
+
+def configure(max_len=None, coalesce=None):
+    """更新发送参数（主程序加载/热更新配置时调用）"""
+    if max_len:
+        _settings["max_len"] = max(50, int(max_len))
+    if coalesce is not None:
+        sender.configure_coalesce(coalesce)
+
+
+def _hard_split(line, limit):
+    """单行超长：尽量在空白处切开，不把 URL 切成两半"""
+    parts = []
+    while len(line) > limit:
+        cut = line.rfind(" ", 0, limit)
+        if cut <= limit // 2:
+            # 没有合适空白：若切点落在 URL 中间，则在 URL 之前切
+            cut = limit
+            for m in re.finditer(r"https?://\S+", line):
+                if m.start() < limit < m.end():
+                    if m.start() > 0:
+                        cut = m.start()
+                    break
+        parts.append(line[:cut].rstrip())
+        line = line[cut:].lstrip()
+    if line:
+        parts.append(line)
+    return parts
+
+
+def split_message(text, limit=None):
+    """
+    按边界切分长消息，返回各段文本
+    优先级：空行分隔的条目 > 单行 > 空白/URL 边界 > 硬切
+    """
+    limit = limit or _settings["max_len"]
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return [text] if text else []
+    units = []
+    for item in re.split(r"\n\s*\n", text):
+        if len(item) <= limit:
+            units.append((item, "\n\n"))
+            continue
+        for line in item.split("\n"):
+            for piece in (_hard_split(line, limit) if len(line) > limit else [line]):
+                units.append((piece, "\n"))
+        units[-1] = (units[-1][0], "\n\n")
+    parts, buf = [], ""
+    for unit, sep in units:
+        if not buf:
+            buf = unit
+        elif len(buf) + len(joiner) + len(unit) <= limit:
+            buf = buf + joiner + unit
+        else:
+            parts.append(buf)
+            buf = unit
+        joiner = sep
+    if buf:
+        parts.append(buf)
+    return [p.strip() for p in parts if p.strip()]
+
+
+class _Reply:
+    """一条待发回复（切分后的各段共享）：合并时追加 @ 对象与上下文"""
+    __slots__ = ("chat", "text", "at", "ctxs", "created", "not_before", "started", "ref")
+
+    def __init__(self, chat, text, at, ctx, now, hold=0.0):
+        self.chat = chat
+        self.text = text
+        self.at = [at] if isinstance(at, str) and at else list(at or [])
+        self.ctxs = [ctx]
+        self.created = now
+        self.not_before = now + hold
+        self.started = False   # 第一段已开始发送，之后不能再追加 @
+        self.ref = None        # 原回复发出后，合并后续请求者的「同上」提醒
+
+    def merge(self, at, ctx):
+        for name in ([at] if isinstance(at, str) else at or []):
+            if name and name not in self.at:
+                self.at.append(name)
+        self.ctxs.append(ctx)
+
+    @property
+    def done(self):
+        """所有请求者的上下文都已取消/超时（未传 ctx 的请求视为一直有效）"""
+        return all(ctx is not None and ctx.done for ctx in self.ctxs)
+
+    @property
+    def at_arg(self):
+        if not self.at:
+            return None
+        return self.at[0] if len(self.at) == 1 else list(self.at)
+
+
+class OutboundSender:
+    """
+    发送流水线：每个聊天一个 FIFO 队列，单个后台线程轮询各聊天发送
+    （UI 自动化不宜并发，串行发送更稳定；不同聊天之间交替发送，互不长时间阻塞）
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()   # chat_key -> deque[(_Reply, 段序号, 段文本)]
+        self._gaps = {}                # chat_key -> 当前间隔
+        self._next_at = {}             # chat_key -> 下次允许发送的时间
+        self._thread = None
+        self._recent = OrderedDict()   # (chat_key, 合并键) -> _Reply，按创建时间排列，超过窗口即清理
+        self.counters = {"messages": 0, "parts": 0, "sent": 0, "failed": 0, "retried": 0, "dropped": 0,
+                         "coalesced": 0, "referenced": 0}
+        self._latency_ewma = 0.0
+        self.monitor = None            # 卡死检测（hang_watch.Watchdog），由主程序设置
+        self.configure_coalesce()
+
+    def configure_coalesce(self, config=None):
+        cfg = {**COALESCE_DEFAULTS, **(config or {})}
+        with self._cond:
+            self.coalesce_enabled = bool(cfg["enabled"])
+            self.coalesce_window = max(0.0, float(cfg["window"]))
+            self.coalesce_hold = max(0.0, float(cfg["hold"]))
+            self.coalesce_ref_text = str(cfg["ref_text"] or COALESCE_DEFAULTS["ref_text"])
+            if not self.coalesce_enabled:
+                self._recent.clear()
+
+    @staticmethod
+    def _key(chat):
+        return getattr(chat, "who", None) or id(chat)
+
+    def send(self, chat, text, at=None, limit=None, ctx=None, coalesce=None, transient=False):
+        """
+        切分并入队，立即返回新入队的段数；只有第一段 @ 指定成员；ctx 已取消/超时则丢弃
+        coalesce：合并键，只有给出合并键的回复参与合并（并等待 hold 秒），其余回复立即入队
+        transient：过渡提示，原提示已发出时不再发送（也不发「同上」），真正的结果由后续回复合并
+        """
+        if ctx is not None and ctx.done:
+            with self._cond:
+                self.counters["dropped"] += 1
+            return 0
+        parts = split_message(text, limit)
+        if not parts:
+            return 0
+        key = self._key(chat)
+        now = time.time()
+        with self._cond:
+            ckey = None
+            if self.coalesce_enabled and coalesce:
+                ckey = (key, coalesce)
+                merged = self._coalesce(ckey, chat, at, ctx, now, transient)
+                if merged is not None:
+                    return merged
+            reply = _Reply(chat, parts[0], at, ctx, now, self.coalesce_hold if ckey else 0.0)
+            if ckey is not None:
+                self._recent.pop(ckey, None)  # 重新插入到末尾，保持按创建时间排列
+                self._recent[ckey] = reply
+            self._enqueue(key, reply, parts)
+        return len(parts)
+
+    def _enqueue(self, key, reply, parts):
+        """调用方持锁"""
+        q = self._queues.get(key)
+        if q is None:
+            q = self._queues[key] = deque()
+        for i, part in enumerate(parts):
+            q.append((reply, i, part))
+        self.counters["messages"] += 1
+        self.counters["parts"] += len(parts)
+        self._ensure_worker()
+        self._cond.notify()
+
+    def _coalesce(self, ckey, chat, at, ctx, now, transient=False):
+        """
+        尝试合并到窗口内的相同回复（调用方持锁）：返回新入队的段数，无可合并的回复返回 None
+        原回复尚未发出时追加 @；已发出时改为「同上」提醒（提醒本身也会合并），过渡提示则直接略去
+        """
+        while self._recent:
+            k, r = next(iter(self._recent.items()))
+            if now - r.created <= self.coalesce_window:
+                break
+            del self._recent[k]
+        reply = self._recent.get(ckey)
+        if reply is None or reply.done:
+            return None
+        if not reply.started:
+            reply.merge(at, ctx)
+            self.counters["coalesced"] += 1
+            return 0
+        if transient or not at:
+            # 过渡提示已过时，或没有需要提醒的人：原回复刚发过，直接略去
+            self.counters["coalesced"] += 1
+            return 0
+        ref = reply.ref
+        if ref is not None and not ref.started and not ref.done:
+            ref.merge(at, ctx)
+            self.counters["coalesced"] += 1
+            return 0
+        ref = reply.ref = _Reply(chat, self.coalesce_ref_text, at, ctx, now, self.coalesce_hold)
+        self.counters["referenced"] += 1
+        self._enqueue(ckey[0], ref, [ref.text])
+        return 1
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="outbound-sender", daemon=True)
+            self._thread.start()
+
+    def _pick(self):
+        """挑选一个已到发送时间的聊天（轮询），返回 (key, item) 或等待时长"""
+        now = time.time()
+        wait = None
+        for key in list(self._queues.keys()):
+            q = self._queues[key]
+            if not q:
+                del self._queues[key]
+                continue
+            ready = max(self._next_at.get(key, 0), q[0][0].not_before)
+            if ready <= now:
+                self._queues.move_to_end(key)  # 轮转，其他聊天下次优先
+                item = q.popleft()
+                item[0].started = True
+                return key, item, None
+            wait = ready - now if wait is None else min(wait, ready - now)
+        return None, None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key, item, wait = self._pick()
+                if item is None:
+                    if wait is None and not self._queues:
+                        self._cond.wait(timeout=60)
+                        if not self._queues:
+                            self._thread = None
+                            return
+                    else:
+                        self._cond.wait(timeout=wait)
+                    continue
+            if self.monitor is not None:
+                with self.monitor.track("outbound", str(key)):
+                    self._deliver(key, item)
+            else:
+                self._deliver(key, item)
+
+    def _deliver(self, key, item):
+        reply, index, text = item
+        chat = reply.chat
+        if reply.done:
+            with self._cond:
+                self.counters["dropped"] += 1
+            return
+        at = reply.at_arg if index == 0 else None
+        gap = self._gaps.get(key, MIN_GAP)
+        for attempt in range(MAX_RETRY + 1):
+            t0 = time.time()
+            try:
+                if at:
+                    chat.SendMsg(msg=text, at=at)
+                else:
+                    chat.SendMsg(text)
+                cost = time.time() - t0
+                self._latency_ewma = cost if not self._latency_ewma else self._latency_ewma * 0.8 + cost * 0.2
+                # 成功：间隔向 max(最小间隔, 平均发送耗时的一半) 收敛
+                gap = max(MIN_GAP, min(gap * 0.7, MAX_GAP), self._latency_ewma * 0.5)
+                self.counters["sent"] += 1
+                break
+            except Exception as e:
+                gap = min(MAX_GAP, gap * 2)
+                if attempt >= MAX_RETRY:
+                    self.counters["failed"] += 1
+                    log("ERROR", f"消息发送失败（{key}）: {e}")
+                else:
+                    self.counters["retried"] += 1
+                    time.sleep(gap)
+        with self._cond:
+            self._gaps[key] = gap
+            self._next_at[key] = time.time() + gap
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._cond:
+            return memstats.measure({"queues": self._queues, "coalesce": self._recent})
+
+    def stats(self):
+        with self._cond:
+            backlog = sum(len(q) for q in self._queues.values())
+            coalescing = len(self._recent)
+        return {**self.counters, "backlog": backlog, "coalescing": coalescing,
+                "avg_send_ms": round(self._latency_ewma * 1000, 1)}
+
+
+# 全局发送器（主程序与插件共用，保证同一聊天的消息顺序）
+sender = OutboundSender()
+
+
+def send_text(chat, text, at=None, limit=None, ctx=None, coalesce=None, transient=False):
+    """
+    发送文本（自动切分、只在第一段 @、排队流水线发送），返回新入队的段数；ctx 取消/超时后不再发送
+    coalesce：合并键（如 "weather:北京"），窗口内发往同一聊天、键相同的回复合并为一次发送并 @ 所有请求者
+    transient：与 coalesce 同用，标记「正在查询…」之类的过渡提示，原提示已发出后不再重复、也不发「同上」
+    """
+    return sender.send(chat, text, at=at, limit=limit, ctx=ctx, coalesce=coalesce, transient=transient)
@@ -4,24 +4,34 @@
 功能说明：
 - 触发指令：全网搜 / 搜资源 / 搜剧 / 搜索 / 看 / 搜 （支持空格与不带空格）
 - 调用 API：http://103.38.82.182:2296/api/Tool/Qsearch
-- 搜索结果：展示所有 data 条目，格式化排版，带表情
+- 搜索结果：首页展示前 RESULT_PAGE_SIZE 条，完整结果按聊天缓存（TTL），回复「下一页/更多」翻页
 - 提示语：开始搜索提示语（随机），结果头表情、资源表情
 - 广告：ad_switch=1 时展示广告（随机一条模板）
+- 请求策略：单次搜索总预算 SEARCH_DEADLINE；超过 p95 延迟仍未返回时向另一端点发对冲请求，先返回者胜出；
+  失败按抖动退避在剩余预算内重试；SEARCH_API_URLS 可配置多个上游，按延迟加权选择
 - 搜索失败/超时：友好提示（带表情，建议换关键词）
 - 用户取用提示：20 条随机文案（可选开关，随机一条）
 - 插件开关：SEARCH_ENABLED = 1/0
+- 可调设置：超时、重试、并发、缓存时长、分页等见 SETTINGS，可在 config.json 的 plugins.search_plugin 中覆盖（保存后热更新）
 - 群聊 @ 用户，若 sender=self 则忽略
-- 日志：插件日志写入 plugins/logs/search_plugin_xx.log，同时调用主程序 log()
+- 日志：写入统一日志系统（模块名 plugins.search_plugin）
 """
 
 import time
 import json
 import re
+import heapq
 import random
 import requests
-import os
-import logging
-from datetime import datetime
+import threading
+import unicodedata
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from context import Cancelled, Context
+from logger import get_logger
+from outbound import send_text, split_message
 
 # -------------------------------
 # 插件配置
@@ -30,39 +40,53 @@ SEARCH_ENABLED = 1  # 插件总开关（1=启用，0=禁用）
 
 MIN_WAIT_TIME = 30
 MAX_WAIT_TIME = 90
-SEARCH_TIMEOUT = 120       # API 超时时间
-SEARCH_RETRY_COUNT = 2     # 重试次数
+SEARCH_TIMEOUT = 120       # 单个请求的超时上限（实际取剩余预算与该值的较小者）
+SEARCH_RETRY_COUNT = 2     # 失败后的最多重试次数（仍受 SEARCH_DEADLINE 约束）
+SEARCH_DEADLINE = MAX_WAIT_TIME + 10  # 单次搜索的总时间预算（秒），与提示语中承诺的等待时间一致
+HEDGE_PERCENTILE = 95      # 对冲延迟取历史成功延迟的该分位数
+HEDGE_DEFAULT_DELAY = MAX_WAIT_TIME * 0.6  # 样本不足时的对冲延迟（秒）
+HEDGE_MIN_DELAY = 2.0      # 对冲延迟下限（秒）
+RETRY_BACKOFF_BASE = 1.0   # 退避基数（秒），第 n 次重试等待 base*2^n 内随机
+RETRY_BACKOFF_MAX = 15.0   # 单次退避上限（秒）
 AD_URL = "66oo.cc"         # 广告网址
 ad_switch = 1              # 广告开关：1=显示广告，0=不显示
 SHOW_EXTRACTION_TIP = 1    # 是否显示用户提取提示（1=显示，0=关闭）
 
 SEARCH_API_URL = "http://103.38.82.182:2296/api/Tool/Qsearch"
+SEARCH_API_URLS = [SEARCH_API_URL]  # 上游端点列表（可追加镜像），按延迟加权选择
+
+RESULT_PAGE_SIZE = 5       # 每页展示的结果条数（首页立即发送，其余回复「下一页」获取）
+CURSOR_TTL = 600           # 结果游标缓存有效期（秒）
+CURSOR_CACHE_SIZE = 200    # 最多缓存多少个聊天的结果游标（超出淘汰最久未用）
+HTTP_CONCURRENCY = 8       # 上游请求线程池大小（含对冲请求）
+NEXT_PAGE_COMMANDS = ("下一页", "更多", "下页", "继续")
+RESULT_TOP_K = 50          # 去重后按相关度最多保留的结果条数
+TRACKING_PARAMS = ("utm_", "spm", "from", "share", "timestamp")  # 归一化网址时去掉的跟踪参数（前缀）
 
 # -------------------------------
 # 提示语 / 表情 / 模板
 # -------------------------------
 SEARCH_PROMPTS = [
-    f"🔍 收到！正在全网捕捉「{{keyword}}」的踪迹～ 大约 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒后回来！",
-    f"🚀 搜索引擎已点火！星际搜寻「{{keyword}}」，预计 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒～",
-    f"🕵️‍♀️ 侦探出动！正在寻找「{{keyword}}」的蛛丝马迹，请稍等 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒！",
-    f"🧙‍♂️ 魔法阵启动，召唤「{{keyword}}」出现中～ {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒后揭晓！",
-    f"🐶 搜索汪嗅探「{{keyword}}」的气味，{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒后带回来！",
-    f"📡 宇宙信号锁定「{{keyword}}」，正在解码中（约 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）...",
-    f"🧩 正在拼凑「{{keyword}}」的碎片，还差最后几块拼图（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）...",
-    f"🏁 搜索马拉松起跑！全力冲向「{{keyword}}」终点（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）！",
-    f"🎭 剧本搜寻中：「{{keyword}}」即将开演，预计 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒～",
-    f"🔮 水晶球显示「{{keyword}}」的踪迹，画面逐渐清晰（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）...",
-    f"🐰 小兔叽跳跳跳去找「{{keyword}}」啦～ {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒后回来！",
-    f"🚗 小车车出发！前往「{{keyword}}」的路上，约 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒到达～",
-    f"🌐 正在全网漫游寻找「{{keyword}}」，预计 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒～",
-    f"🐱 搜索喵出动，悄咪咪找「{{keyword}}」，{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒后汇报！",
-    f"🚁 直升机升空，侦查「{{keyword}}」位置中（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）...",
-    f"🔬 实验室解析「{{keyword}}」相关数据，预计 {MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒～",
-    f"📖 翻阅全网资料库，检索「{{keyword}}」中（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）...",
-    f"🧭 导航设定目的地「{{keyword}}」，规划最佳路线中（{MIN_WAIT_TIME}-{MAX_WAIT_TIME} 秒）..."
+    "🔍 收到！正在全网捕捉「{keyword}」的踪迹～ 大约 {min_wait}-{max_wait} 秒后回来！",
+    "🚀 搜索引擎已点火！星际搜寻「{keyword}」，预计 {min_wait}-{max_wait} 秒～",
+    "🕵️‍♀️ 侦探出动！正在寻找「{keyword}」的蛛丝马迹，请稍等 {min_wait}-{max_wait} 秒！",
+    "🧙‍♂️ 魔法阵启动，召唤「{keyword}」出现中～ {min_wait}-{max_wait} 秒后揭晓！",
+    "🐶 搜索汪嗅探「{keyword}」的气味，{min_wait}-{max_wait} 秒后带回来！",
+    "📡 宇宙信号锁定「{keyword}」，正在解码中（约 {min_wait}-{max_wait} 秒）...",
+    "🧩 正在拼凑「{keyword}」的碎片，还差最后几块拼图（{min_wait}-{max_wait} 秒）...",
+    "🏁 搜索马拉松起跑！全力冲向「{keyword}」终点（{min_wait}-{max_wait} 秒）！",
+    "🎭 剧本搜寻中：「{keyword}」即将开演，预计 {min_wait}-{max_wait} 秒～",
+    "🔮 水晶球显示「{keyword}」的踪迹，画面逐渐清晰（{min_wait}-{max_wait} 秒）...",
+    "🐰 小兔叽跳跳跳去找「{keyword}」啦～ {min_wait}-{max_wait} 秒后回来！",
+    "🚗 小车车出发！前往「{keyword}」的路上，约 {min_wait}-{max_wait} 秒到达～",
+    "🌐 正在全网漫游寻找「{keyword}」，预计 {min_wait}-{max_wait} 秒～",
+    "🐱 搜索喵出动，悄咪咪找「{keyword}」，{min_wait}-{max_wait} 秒后汇报！",
+    "🚁 直升机升空，侦查「{keyword}」位置中（{min_wait}-{max_wait} 秒）...",
+    "🔬 实验室解析「{keyword}」相关数据，预计 {min_wait}-{max_wait} 秒～",
+    "📖 翻阅全网资料库，检索「{keyword}」中（{min_wait}-{max_wait} 秒）...",
+    "🧭 导航设定目的地「{keyword}」，规划最佳路线中（{min_wait}-{max_wait} 秒）..."
 ]
 
-RESOURCE_EMOJIS = ["📌", "🔖", "📝", "💾", "📂", "🎬", "📦", "🎁", "🔗", "📥", "📤", "📎", "📼", "💽", "🎥", "📀", "🔑"]
 RESULT_HEADER_EMOJIS = ["🎉", "✨", "🔍", "💫", "🌟", "🎊", "🔮", "💎", "🎁", "💡", "🎈", "🚀"]
 
 AD_TEMPLATES = [
@@ -111,49 +135,394 @@ USER_EXTRACTION_TIPS = [
 ]
 
 # -------------------------------
-# 日志配置（插件内 + 主程序 log）
+# 可调设置（config.json 的 plugins.search_plugin 段覆盖，主程序加载时及配置保存后调用 on_settings）
+# -------------------------------
+SETTINGS = {
+    "timeout": {"type": "float", "min": 1, "max": 600, "default": SEARCH_TIMEOUT},
+    "retries": {"type": "int", "min": 0, "max": 10, "default": SEARCH_RETRY_COUNT},
+    "min_wait": {"type": "int", "min": 0, "max": 600, "default": MIN_WAIT_TIME},
+    "max_wait": {"type": "int", "min": 1, "max": 600, "default": MAX_WAIT_TIME},
+    "deadline": {"type": "float", "min": 5, "max": 900, "default": SEARCH_DEADLINE},
+    "api_urls": {"type": "list", "default": SEARCH_API_URLS},
+    "concurrency": {"type": "int", "min": 1, "max": 64, "default": HTTP_CONCURRENCY},
+    "hedge_percentile": {"type": "int", "min": 50, "max": 99, "default": HEDGE_PERCENTILE},
+    "hedge_min_delay": {"type": "float", "min": 0.1, "max": 300, "default": HEDGE_MIN_DELAY},
+    "page_size": {"type": "int", "min": 1, "max": 50, "default": RESULT_PAGE_SIZE},
+    "top_k": {"type": "int", "min": 1, "max": 500, "default": RESULT_TOP_K},
+    "cursor_ttl": {"type": "int", "min": 10, "max": 86400, "default": CURSOR_TTL},
+    "cursor_cache_size": {"type": "int", "min": 1, "max": 10000, "default": CURSOR_CACHE_SIZE},
+}
+
+
+def on_settings(settings):
+    """应用设置：更新模块级参数，并发数变化时重建请求线程池"""
+    global SEARCH_TIMEOUT, SEARCH_RETRY_COUNT, MIN_WAIT_TIME, MAX_WAIT_TIME, SEARCH_DEADLINE
+    global SEARCH_API_URLS, HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY
+    global RESULT_PAGE_SIZE, RESULT_TOP_K, CURSOR_TTL, CURSOR_CACHE_SIZE, HTTP_CONCURRENCY, _executor
+    SEARCH_TIMEOUT = settings["timeout"]
+    SEARCH_RETRY_COUNT = settings["retries"]
+    MIN_WAIT_TIME = min(settings["min_wait"], settings["max_wait"])
+    MAX_WAIT_TIME = settings["max_wait"]
+    SEARCH_DEADLINE = settings["deadline"]
+    SEARCH_API_URLS = list(settings["api_urls"]) or [SEARCH_API_URL]
+    HEDGE_PERCENTILE = settings["hedge_percentile"]
+    HEDGE_MIN_DELAY = settings["hedge_min_delay"]
+    HEDGE_DEFAULT_DELAY = MAX_WAIT_TIME * 0.6
+    RESULT_PAGE_SIZE = settings["page_size"]
+    RESULT_TOP_K = settings["top_k"]
+    CURSOR_TTL = settings["cursor_ttl"]
+    CURSOR_CACHE_SIZE = settings["cursor_cache_size"]
+    if settings["concurrency"] != HTTP_CONCURRENCY:
+        HTTP_CONCURRENCY = settings["concurrency"]
+        old, _executor = _executor, ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY, thread_name_prefix="search-http")
+        old.shutdown(wait=False)  # 进行中的请求继续完成
+    plugin_log(f"搜索插件设置已更新：超时 {SEARCH_TIMEOUT}s，重试 {SEARCH_RETRY_COUNT} 次，"
+               f"预算 {SEARCH_DEADLINE}s，端点 {len(SEARCH_API_URLS)} 个，并发 {HTTP_CONCURRENCY}", "DEBUG")
+
+# -------------------------------
+# 日志（统一日志系统，模块名 plugins.search_plugin，级别可在 config.json 的 log_levels 中调整）
 # -------------------------------
-def init_logger():
-    log_dir = os.path.join(os.path.dirname(__file__), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"search_plugin_{datetime.now().strftime('%Y%m%d')}.log")
+search_logger = get_logger("plugins.search_plugin")
 
-    logger = logging.getLogger("search_plugin")
-    logger.setLevel(logging.DEBUG)
+def plugin_log(message, level="INFO"):
+    """写入统一日志（保留插件原有的 plugin_log(message, level) 调用方式）"""
+    search_logger.log(level, message)
 
-    fh = logging.FileHandler(log_file, encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fmt = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    fh.setFormatter(fmt)
+# -------------------------------
+# 结果游标缓存（按聊天保存完整结果，翻页不再调用 API）
+# -------------------------------
+_cursor_lock = threading.Lock()
+_cursors = OrderedDict()  # chat_name -> {'title', 'items', 'offset', 'expires'}
 
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(logging.StreamHandler())
 
-    return logger
+def _cursor_key(chat_info):
+    return (chat_info or {}).get("name") or ""
 
-search_logger = init_logger()
 
-def plugin_log(message, level="INFO"):
+def save_cursor(chat_info, title, items, offset):
+    with _cursor_lock:
+        key = _cursor_key(chat_info)
+        _cursors.pop(key, None)
+        if offset < len(items):
+            _cursors[key] = {"title": title, "items": items, "offset": offset, "expires": time.time() + CURSOR_TTL}
+            while len(_cursors) > CURSOR_CACHE_SIZE:
+                _cursors.popitem(last=False)
+
+
+def _live_cursor(key):
+    """未过期的游标，过期的顺带删除（调用方持锁）"""
+    cur = _cursors.get(key)
+    if cur is not None and cur["expires"] < time.time():
+        del _cursors[key]
+        return None
+    return cur
+
+
+def get_cursor(chat_info):
+    """返回未过期的游标（并刷新 LRU 顺序），没有返回 None"""
+    with _cursor_lock:
+        key = _cursor_key(chat_info)
+        cur = _live_cursor(key)
+        if cur is not None:
+            _cursors.move_to_end(key)
+        return cur
+
+
+# -------------------------------
+# 结果处理：去重（归一化网址 / 归一化标题）→ 相关度打分 → 堆取 Top-K
+# 每条结果只做常数次哈希与一次标题扫描，整体 O(n·标题长度 + n·log K)
+# -------------------------------
+_TITLE_TAG_RE = re.compile(r"[【\[(（<《][^】\])）>》]*[】\])）>》]")
+_TITLE_PUNCT_RE = re.compile(r"[\W_]+")
+
+
+def normalize_url(url):
+    """网址归一化：忽略协议、www、大小写、末尾斜杠、锚点、跟踪参数与参数顺序"""
+    url = (url or "").strip()
+    if not url:
+        return ""
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not parts.query:
+        return host + parts.path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith(TRACKING_PARAMS))
+    return host + parts.path.rstrip("/") + ("?" + urlencode(query) if query else "")
+
+
+def normalize_title(title):
+    """标题归一化：全半角统一、小写，去掉括号内的修饰（【高清】等）、标点与空白"""
+    text = unicodedata.normalize("NFKC", title or "").lower()
+    stripped = _TITLE_PUNCT_RE.sub("", _TITLE_TAG_RE.sub("", text))
+    return stripped or _TITLE_PUNCT_RE.sub("", text)  # 整个标题都在括号里时保留括号内文字
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def relevance(keyword_norm, keyword_grams, title_norm):
     """
-    同时写入插件日志文件 + 调用主程序 log()（若存在）
+    相关度（0~100）：完全一致 100；包含关键词 60~95（越靠前、标题越短越高）；
+    否则按关键词的二元组在标题中的命中比例给 0~50 分
     """
-    try:
-        from wxbot_class_only_V2 import log as main_log
-        main_log(message, level=level)
-    except Exception:
-        pass  # 主程序 log 不可用时忽略
-
-    if level == "ERROR":
-        search_logger.error(message)
+    if not title_norm or not keyword_norm:
+        return 0.0
+    if title_norm == keyword_norm:
+        return 100.0
+    pos = title_norm.find(keyword_norm)
+    if pos >= 0:
+        coverage = len(keyword_norm) / len(title_norm)
+        return 60.0 + 25.0 * coverage + (10.0 if pos == 0 else 0.0)
+    hits = sum(1 for g in keyword_grams if g in title_norm)
+    return 50.0 * hits / len(keyword_grams)
+
+
+def rank_results(keyword, items, k=None):
+    """去重并按相关度取前 k 条（同分保持接口原顺序），返回 (结果列表, 去掉的重复条数)"""
+    keyword_norm = normalize_title(keyword)
+    keyword_grams = _bigrams(keyword_norm)
+    seen_urls, seen_titles = set(), set()
+    candidates = []
+    duplicates = 0
+    for idx, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        url_key = normalize_url(item.get("url"))
+        title_key = normalize_title(item.get("title"))
+        if not url_key and not title_key:
+            continue
+        if (url_key and url_key in seen_urls) or (title_key and title_key in seen_titles):
+            duplicates += 1
+            continue
+        seen_urls.add(url_key)
+        seen_titles.add(title_key)
+        candidates.append((relevance(keyword_norm, keyword_grams, title_key), -idx, item))
+    top = heapq.nlargest(k or RESULT_TOP_K, candidates, key=lambda c: (c[0], c[1]))
+    return [item for _, _, item in top], duplicates
+
+
+def format_page(title, items, offset, first=False):
+    """格式化一页结果：首页带结果头、提示与广告，未发完时提示回复「下一页」"""
+    page = items[offset:offset + RESULT_PAGE_SIZE]
+    end = offset + len(page)
+    header = random.choice(RESULT_HEADER_EMOJIS)
+    if first:
+        formatted = f"\n{header} 搜索到与「{title}」相关的资源，共 {len(items)} 条"
     else:
-        search_logger.info(message)
+        formatted = f"\n{header}「{title}」的更多资源"
+    formatted += f"（第 {offset + 1}-{end} 条）：\n\n"
+
+    for idx, item in enumerate(page, start=offset + 1):
+        formatted += f"{idx}. {item.get('title','未知')}\n"
+        formatted += f"{item.get('url','无')}\n\n"
+
+    if end < len(items):
+        formatted += f"💬 还有 {len(items) - end} 条，回复「下一页」查看更多～\n"
+
+    if first and SHOW_EXTRACTION_TIP:
+        formatted += random.choice(USER_EXTRACTION_TIPS) + "\n"
+
+    if first and ad_switch:
+        formatted += "\n" + random.choice(AD_TEMPLATES)
+
+    return formatted.strip()
+
+
+def next_page(chat_info):
+    """
+    从游标缓存取下一页，没有可翻页的结果返回 None
+    读取与推进游标在同一次加锁内完成：同一聊天并发的「下一页」各取到不同的页
+    """
+    with _cursor_lock:
+        key = _cursor_key(chat_info)
+        cur = _live_cursor(key)
+        if cur is None:
+            return None
+        offset = cur["offset"]
+        del _cursors[key]
+        if offset + RESULT_PAGE_SIZE < len(cur["items"]):
+            _cursors[key] = {**cur, "offset": offset + RESULT_PAGE_SIZE, "expires": time.time() + CURSOR_TTL}
+    return format_page(cur["title"], cur["items"], offset)
 
 # -------------------------------
 # 工具函数
 # -------------------------------
-def split_long_text(text, chunk_size=2000):
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+def split_long_text(text, chunk_size=None):
+    """按条目/行边界切分长文本（保留旧接口，实际由 outbound.split_message 实现）"""
+    return split_message(text, chunk_size)
+
+# -------------------------------
+# 上游请求：截止时间预算 + 对冲请求 + 抖动退避 + 多端点延迟加权选择
+# -------------------------------
+class SearchTimeout(Exception):
+    """预算耗尽仍未得到结果"""
+
+
+class EndpointStats:
+    """端点延迟统计：最近成功延迟窗口（求分位数）+ EWMA（加权选择）+ 连续失败冷却"""
+    WINDOW = 50
+    COOLDOWN = 60  # 连续失败 3 次后暂停选择的时长（秒）
+
+    def __init__(self, url):
+        self.url = url
+        self.samples = deque(maxlen=self.WINDOW)
+        self.ewma = None
+        self.fail_streak = 0
+        self.cooldown_until = 0.0
+
+    def record(self, ok, latency):
+        if ok:
+            self.samples.append(latency)
+            self.ewma = latency if self.ewma is None else self.ewma * 0.7 + latency * 0.3
+            self.fail_streak = 0
+        else:
+            self.fail_streak += 1
+            if self.fail_streak >= 3:
+                self.cooldown_until = time.time() + self.COOLDOWN
+
+
+_endpoint_lock = threading.Lock()
+_endpoints = {}
+_executor = ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY, thread_name_prefix="search-http")
+
+
+def _endpoint(url):
+    with _endpoint_lock:
+        ep = _endpoints.get(url)
+        if ep is None:
+            ep = _endpoints[url] = EndpointStats(url)
+        return ep
+
+
+def pick_endpoint(exclude=()):
+    """按 1/EWMA 延迟加权随机选择端点；未测量过的端点优先尝试，冷却中的端点仅在别无选择时使用"""
+    now = time.time()
+    candidates = [_endpoint(u) for u in SEARCH_API_URLS if u not in exclude] or [_endpoint(u) for u in SEARCH_API_URLS]
+    healthy = [ep for ep in candidates if ep.cooldown_until <= now] or candidates
+    fresh = [ep for ep in healthy if ep.ewma is None]
+    if fresh:
+        return random.choice(fresh)
+    weights = [1.0 / max(ep.ewma, 0.01) for ep in healthy]
+    return random.choices(healthy, weights=weights)[0]
+
+
+def hedge_delay():
+    """对冲延迟：所有端点最近成功延迟的 p95，样本不足时用默认值"""
+    with _endpoint_lock:
+        samples = sorted(x for ep in _endpoints.values() for x in ep.samples)
+    if len(samples) < 10:
+        return HEDGE_DEFAULT_DELAY
+    idx = min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))
+    return max(HEDGE_MIN_DELAY, samples[idx])
+
+
+def _post(url, title, deadline, ctx=None):
+    """向单个端点发请求并记录延迟；非 2xx 抛 HTTPError，ctx 取消时抛 Cancelled"""
+    ep = _endpoint(url)
+    timeout = min(SEARCH_TIMEOUT, deadline - time.time())
+    if timeout <= 0:
+        raise SearchTimeout()
+    t0 = time.time()
+    post = ctx.post if ctx is not None else requests.post
+    try:
+        response = post(url, data={"title": title},
+                        headers={"User-Agent": "Mozilla/5.0"}, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+    except Cancelled:
+        raise  # 主动取消不计入端点失败
+    except Exception:
+        ep.record(False, time.time() - t0)
+        raise
+    ep.record(True, time.time() - t0)
+    search_logger.debug("搜索端点 %s 响应 %.2fs", url, time.time() - t0)
+    return result
+
+
+def _hedged_post(title, deadline, ctx=None):
+    """
+    先发主请求，超过对冲延迟仍未返回则向另一端点再发一次，取先成功者
+    每个请求使用独立的子上下文：有结果、出错或预算耗尽后，未完成的请求立即取消（关闭连接、归还线程池）
+    """
+    attempts = {}  # future -> 该请求的上下文
+
+    def launch(url):
+        sub = ctx.child() if ctx is not None else Context()
+        fut = _executor.submit(_post, url, title, deadline, sub)
+        attempts[fut] = sub
+        return fut
+
+    primary = pick_endpoint()
+    pending = {launch(primary.url)}
+    hedged = False
+    error = None
+    try:
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise SearchTimeout()
+            timeout = remaining if hedged else min(remaining, hedge_delay())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    return fut.result()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    error = e
+            if not hedged and not done:
+                # 主请求超过对冲延迟仍未返回：向另一个端点补发
+                hedged = True
+                backup = pick_endpoint(exclude=(primary.url,))
+                search_logger.debug("搜索请求对冲：%s -> %s", primary.url, backup.url)
+                pending.add(launch(backup.url))
+        raise error or SearchTimeout()
+    finally:
+        for fut, sub in attempts.items():
+            if not fut.done():
+                fut.cancel()  # 尚在线程池队列中的直接撤销
+                sub.cancel("搜索请求已结束")
+
+
+def _retryable(e):
+    """客户端错误（4xx，429 除外）不重试"""
+    resp = getattr(e, "response", None)
+    status = getattr(resp, "status_code", None)
+    return not (status and 400 <= status < 500 and status != 429)
+
+
+def fetch_search(title, budget=None, ctx=None):
+    """
+    在总预算内获取搜索结果：对冲请求 + 抖动退避重试，预算耗尽抛 SearchTimeout
+    ctx 为消息处理上下文：预算不超过其剩余时间，取消时中断请求并抛 Cancelled
+    """
+    budget = budget or SEARCH_DEADLINE
+    if ctx is not None and ctx.remaining() is not None:
+        budget = min(budget, ctx.remaining())
+    deadline = time.time() + budget
+    attempt = 0
+    while True:
+        try:
+            return _hedged_post(title, deadline, ctx)
+        except (SearchTimeout, Cancelled):
+            raise
+        except Exception as e:
+            if isinstance(e, requests.exceptions.Timeout) and deadline - time.time() <= 0:
+                raise SearchTimeout()
+            if attempt >= SEARCH_RETRY_COUNT or not _retryable(e):
+                raise
+            backoff = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+            if time.time() + backoff >= deadline:
+                raise SearchTimeout()
+            attempt += 1
+            plugin_log(f"搜索请求失败（{e}），{backoff:.1f}s 后第 {attempt} 次重试", "WARNING")
+            if ctx is not None:
+                ctx.sleep(backoff)
+            else:
+                time.sleep(backoff)
 
 # -------------------------------
 # 插件主逻辑
@@ -167,18 +536,22 @@ def search_resources_thread(chat, keyword, chat_info=None, is_group_chat=False,
         plugin_log("忽略自己消息，不触发搜索。", "DEBUG")
         return
 
+    at = sender if is_group_chat and sender else None
+
+    ctx = (chat_info or {}).get("ctx")
+
     # 发送提示语（随机一条）
-    prompt_msg = random.choice(SEARCH_PROMPTS).format(keyword=keyword)
+    prompt_msg = random.choice(SEARCH_PROMPTS).format(keyword=keyword, min_wait=MIN_WAIT_TIME, max_wait=MAX_WAIT_TIME)
     try:
-        if is_group_chat and sender:
-            chat.SendMsg(msg=prompt_msg, at=sender)
-        else:
-            chat.SendMsg(prompt_msg)
+        send_text(chat, prompt_msg, at=at, ctx=ctx)
     except Exception as e:
         plugin_log(f"发送搜索提示语失败: {e}", "ERROR")
 
     # 调用 API 搜索
     result_msg = search_resources(keyword, chat_info)
+    if ctx is not None and ctx.done:
+        plugin_log(f"搜索「{keyword}」已取消或超过截止时间，不再回复", "DEBUG")
+        return
 
     # 结果处理
     if not result_msg:
@@ -186,57 +559,35 @@ def search_resources_thread(chat, keyword, chat_info=None, is_group_chat=False,
     else:
         reply_msg = result_msg
 
-    # 发送结果
+    # 发送结果（超长时按条目边界切分，只在第一段 @ 发送者）
     try:
-        if len(reply_msg) > 2000:
-            for seg in split_long_text(reply_msg):
-                chat.SendMsg(seg)
-                time.sleep(1)
-        else:
-            if is_group_chat and sender:
-                chat.SendMsg(msg=reply_msg, at=sender)
-            else:
-                chat.SendMsg(reply_msg)
+        send_text(chat, reply_msg, at=at, ctx=ctx)
     except Exception as e:
         plugin_log(f"搜索插件发送消息失败: {e}", "ERROR")
 
 def search_resources(title, chat_info=None):
-    """调用 API 搜索并返回格式化结果"""
-    for attempt in range(SEARCH_RETRY_COUNT + 1):
-        try:
-            response = requests.post(
-                SEARCH_API_URL,
-                data={"title": title},
-                headers={"User-Agent": "Mozilla/5.0"},
-                timeout=SEARCH_TIMEOUT
-            )
-            response.raise_for_status()
-            result = response.json()
-            data_list = result.get("data", [])
-            if not data_list:
-                return None
-
-            header = random.choice(RESULT_HEADER_EMOJIS)
-            formatted = f"\n{header} 搜索到与「{title}」相关的资源，共 {len(data_list)} 条：\n\n"
-
-            for idx, item in enumerate(data_list, start=1):
-                emo = random.choice(RESOURCE_EMOJIS)
-                formatted += f"{emo} 第{idx}条：{item.get('title','未知')}\n"
-                formatted += f"🔗 链接：{item.get('url','无')}\n\n"
-
-            if SHOW_EXTRACTION_TIP:
-                formatted += random.choice(USER_EXTRACTION_TIPS) + "\n"
-
-            if ad_switch:
-                formatted += "\n" + random.choice(AD_TEMPLATES)
-
-            return formatted.strip()
-        except requests.exceptions.Timeout:
-            if attempt >= SEARCH_RETRY_COUNT:
-                return random.choice(SEARCH_TIMEOUT_TEMPLATES)
-        except Exception as e:
-            plugin_log(f"搜索异常: {e}", "ERROR")
-            return f"❌ 搜索「{title}」时发生未知错误，请再试一次吧。"
+    """调用 API 搜索并返回格式化结果（总耗时不超过 SEARCH_DEADLINE）"""
+    try:
+        result = fetch_search(title, ctx=(chat_info or {}).get("ctx"))
+    except Cancelled:
+        return None
+    except (SearchTimeout, requests.exceptions.Timeout):
+        return random.choice(SEARCH_TIMEOUT_TEMPLATES)
+    except Exception as e:
+        plugin_log(f"搜索异常: {e}", "ERROR")
+        return f"❌ 搜索「{title}」时发生未知错误，请再试一次吧。"
+    data_list = result.get("data", []) if isinstance(result, dict) else []
+    if not data_list:
+        return None
+    total = len(data_list)
+    data_list, duplicates = rank_results(title, data_list, RESULT_TOP_K)
+    plugin_log(f"搜索「{title}」返回 {total} 条，去重 {duplicates} 条，保留 {len(data_list)} 条", "DEBUG")
+    if not data_list:
+        return None
+
+    # 首页立即返回，完整结果存入该聊天的游标缓存供翻页
+    save_cursor(chat_info, title, data_list, RESULT_PAGE_SIZE)
+    return format_page(title, data_list, 0, first=True)
 
 # -------------------------------
 # 指令检测
@@ -282,7 +633,7 @@ PLUGIN_PRIORITY = 100  # 优先级（数值越大越先执行）
 def check(msg, chat, chat_info):
     """
     主程序调用：判断是否为搜索指令
-    返回 (True, keyword) 表示匹配，(False, None) 表示不匹配
+    返回 (True, keyword) 表示匹配，(True, {"action": "next_page"}) 表示翻页，(False, None) 表示不匹配
     """
     try:
         # 忽略自己发送的消息
@@ -296,6 +647,10 @@ def check(msg, chat, chat_info):
         if not content:
             return (False, None)
 
+        # 翻页指令：仅当该聊天有未过期的结果游标时才匹配
+        if content in NEXT_PAGE_COMMANDS and get_cursor(chat_info) is not None:
+            return (True, {"action": "next_page"})
+
         # 检测是否为搜索指令（调用现有 is_search_command 函数）
         # 群聊中可能需要处理 @ 机器人的情况（此处简化处理，可根据实际需求扩展）
         matched, keyword = is_search_command(content)
@@ -310,19 +665,25 @@ def check(msg, chat, chat_info):
 def handle(msg, chat, chat_info, data):
     """
     主程序调用：处理搜索逻辑
-    data 为 check 函数返回的 keyword
+    data 为 check 函数返回的 keyword（或翻页指令）
     """
     try:
-        keyword = data  # data 是 check 传递的关键词
-        if not keyword:
-            return
-
         # 判断是否为群聊，以及获取发送者（用于 @ 提醒）
         is_group = chat_info.get("type") == "group"
         sender = chat_info.get("sender", "")
 
+        # 翻页：直接从缓存取下一页，不调用 API
+        if isinstance(data, dict) and data.get("action") == "next_page":
+            page = next_page(chat_info)
+            if page:
+                send_text(chat, page, at=sender if is_group and sender else None, ctx=chat_info.get("ctx"))
+            return True
+
+        keyword = data  # data 是 check 传递的关键词
+        if not keyword:
+            return
+
         # 启动搜索线程（复用现有 search_resources_thread 函数）
-        import threading  # 确保导入 threading 模块
         threading.Thread(
             target=search_resources_thread,
             args=(chat, keyword),
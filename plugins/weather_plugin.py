@@ -6,23 +6,43 @@
 - 调用天气API获取实时天气
 - 支持城市名自动提取
 - 友好的结果展示格式
+- 可调设置见 SETTINGS，可在 config.json 的 plugins.weather_plugin 中覆盖（保存后热更新）
+- 提供 check_batch：积压的消息成批到达时，用一次正则扫描筛出含天气关键词的消息
 """
 
 import time
 import re
+import bisect
 import random
 import requests
-import os
-import logging
-from datetime import datetime
 import threading
 
+from context import Cancelled
+from logger import get_logger
+from outbound import send_text
+
 # -------------------------------
 # 插件配置
 # -------------------------------
 WEATHER_ENABLED = 1  # 插件总开关（1=启用，0=禁用）
 WEATHER_API_KEY = "03e026a2b5e80e8bccea7ba69d5618dc"  # 需要自行申请
 WEATHER_API_URL = "https://restapi.amap.com/v3/weather/weatherInfo"  # 高德天气API示例
+WEATHER_TIMEOUT = 10  # 请求超时（秒），仍受消息处理截止时间约束
+
+# 可调设置（config.json 的 plugins.weather_plugin 段覆盖）
+SETTINGS = {
+    "timeout": {"type": "float", "min": 1, "max": 120, "default": WEATHER_TIMEOUT},
+    "api_url": {"type": "str", "default": WEATHER_API_URL},
+    "api_key": {"type": "str", "default": WEATHER_API_KEY},
+}
+
+
+def on_settings(settings):
+    """主程序加载插件及配置保存后调用"""
+    global WEATHER_TIMEOUT, WEATHER_API_URL, WEATHER_API_KEY
+    WEATHER_TIMEOUT = settings["timeout"]
+    WEATHER_API_URL = settings["api_url"] or SETTINGS["api_url"]["default"]
+    WEATHER_API_KEY = settings["api_key"]
 
 # -------------------------------
 # 提示语 / 表情配置
@@ -51,49 +71,21 @@ ERROR_MESSAGES = [
 
 
 # -------------------------------
-# 日志配置
+# 日志（统一日志系统，模块名 plugins.weather_plugin，级别可在 config.json 的 log_levels 中调整）
 # -------------------------------
-def init_logger():
-    log_dir = os.path.join(os.path.dirname(__file__), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"weather_plugin_{datetime.now().strftime('%Y%m%d')}.log")
-
-    logger = logging.getLogger("weather_plugin")
-    logger.setLevel(logging.DEBUG)
-
-    fh = logging.FileHandler(log_file, encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fmt = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    fh.setFormatter(fmt)
-
-    if not logger.handlers:
-        logger.addHandler(fh)
-
-    return logger
-
-
-weather_logger = init_logger()
+weather_logger = get_logger("plugins.weather_plugin")
 
 
 def plugin_log(message, level="INFO"):
-    """同时写入插件日志和主程序日志"""
-    try:
-        from wxbot_class_only_V2 import log as main_log
-        main_log(message, level=level)
-    except Exception:
-        pass
-
-    if level == "ERROR":
-        weather_logger.error(message)
-    else:
-        weather_logger.info(message)
+    """写入统一日志（保留插件原有的 plugin_log(message, level) 调用方式）"""
+    weather_logger.log(level, message)
 
 
 # -------------------------------
 # 天气查询核心函数
 # -------------------------------
-def get_weather(city):
-    """调用天气API获取天气信息"""
+def get_weather(city, ctx=None):
+    """调用天气API获取天气信息；ctx 已取消/超时返回 None（不再回复）"""
     if not WEATHER_API_KEY:
         return "⚠️ 天气API未配置，请联系管理员"
 
@@ -105,7 +97,10 @@ def get_weather(city):
             "output": "json"
         }
 
-        response = requests.get(WEATHER_API_URL, params=params, timeout=10)
+        if ctx is not None:
+            response = ctx.get(WEATHER_API_URL, params=params, timeout=WEATHER_TIMEOUT)
+        else:
+            response = requests.get(WEATHER_API_URL, params=params, timeout=WEATHER_TIMEOUT)
         data = response.json()
 
         if data.get("status") != "1":
@@ -142,6 +137,9 @@ def get_weather(city):
 
         return result
 
+    except Cancelled as e:
+        plugin_log(f"天气查询已取消（{city}）: {e}", "DEBUG")
+        return None
     except Exception as e:
         plugin_log(f"天气查询API调用失败: {str(e)}", "ERROR")
         return f"❌ 查询天气时发生错误：{str(e)}"
@@ -150,28 +148,27 @@ def get_weather(city):
 # -------------------------------
 # 指令处理线程
 # -------------------------------
-def weather_query_thread(chat, city, is_group_chat=False, sender=None):
-    """天气查询线程"""
+def weather_query_thread(chat, city, is_group_chat=False, sender=None, ctx=None):
+    """天气查询线程（ctx 为消息处理上下文，机器人停止或超时后不再查询/回复）"""
+    at = sender if is_group_chat and sender else None
+
     # 发送查询提示
     prompt = random.choice(QUERY_PROMPTS).format(city=city)
     try:
-        if is_group_chat and sender:
-            chat.SendMsg(msg=prompt, at=sender)
-        else:
-            chat.SendMsg(prompt)
+        # 过渡提示：并发请求合并进同一条，已发出后再来的请求者不再提示（结果会合并 @ 他们）
+        send_text(chat, prompt, at=at, ctx=ctx, coalesce=f"weather-prompt:{city}", transient=True)
     except Exception as e:
         plugin_log(f"发送查询提示失败: {e}", "ERROR")
         return
 
     # 获取天气信息
-    weather_info = get_weather(city)
+    weather_info = get_weather(city, ctx)
+    if weather_info is None:
+        return
 
     # 发送结果
     try:
-        if is_group_chat and sender:
-            chat.SendMsg(msg=weather_info, at=sender)
-        else:
-            chat.SendMsg(weather_info)
+        send_text(chat, weather_info, at=at, ctx=ctx, coalesce=f"weather:{city}")
     except Exception as e:
         plugin_log(f"发送天气信息失败: {e}", "ERROR")
 
@@ -179,16 +176,16 @@ def weather_query_thread(chat, city, is_group_chat=False, sender=None):
 # -------------------------------
 # 模糊指令匹配
 # -------------------------------
+# 天气相关关键词
+WEATHER_KEYWORD_RE = re.compile(r"天气|气温|温度|预报")
+
+
 def extract_city(content):
     """从消息中提取城市名和判断是否为天气查询指令"""
     content = content.strip()
 
-    # 天气相关关键词
-    weather_keywords = ["天气", "气温", "温度", "预报"]
-
     # 检查是否包含天气相关关键词
-    has_weather_keyword = any(keyword in content for keyword in weather_keywords)
-    if not has_weather_keyword:
+    if not WEATHER_KEYWORD_RE.search(content):
         return False, None
 
     # 移除指令关键词，提取城市名
@@ -240,6 +237,36 @@ def check(msg, chat, chat_info):
         return (False, None)
 
 
+def check_batch(batch):
+    """
+    批量检查（主程序批量模式调用）：batch 为 [(msg, chat, chat_info), ...]，返回等长的 [(matched, city)]
+    所有文本拼接后只做一次关键词正则扫描，命中的消息再提取城市名，结果与逐条 check 一致
+    """
+    results = [(False, None)] * len(batch)
+    try:
+        texts, owners, offsets = [], [], []
+        pos = 0
+        for i, (msg, chat, chat_info) in enumerate(batch):
+            if getattr(msg, "attr", "") == "self" or getattr(msg, "type", "") != "text":
+                continue
+            content = (getattr(msg, "content", "") or "").strip()
+            if not content:
+                continue
+            texts.append(content)
+            owners.append(i)
+            offsets.append(pos)
+            pos += len(content) + 1
+        # 命中位置按起始偏移映射回消息
+        hits = {bisect.bisect_right(offsets, m.start()) - 1 for m in WEATHER_KEYWORD_RE.finditer("\n".join(texts))}
+        for j in hits:
+            matched, city = extract_city(texts[j])
+            if matched and city:
+                results[owners[j]] = (True, city)
+    except Exception as e:
+        plugin_log(f"check_batch函数异常: {e}", "ERROR")
+    return results
+
+
 def handle(msg, chat, chat_info, data):
     """处理天气查询"""
     try:
@@ -255,7 +282,7 @@ def handle(msg, chat, chat_info, data):
         threading.Thread(
             target=weather_query_thread,
             args=(chat, city),
-            kwargs={"is_group_chat": is_group, "sender": sender},
+            kwargs={"is_group_chat": is_group, "sender": sender, "ctx": chat_info.get("ctx")},
             daemon=True
         ).start()
 
@@ -0,0 +1,176 @@
+# ratelimit.py
+# 令牌桶限流：按发送者 / 按聊天 / 按插件三级限流，在插件分发前拦截刷屏
+# - 键表按最近访问排序，超出容量或空闲过久的键被淘汰，内存有上限
+# - 可选「慢一点」提示（同一发送者在 notify_interval 内只提示一次）
+# - 统计各级被限流的消息数
+import threading
+import time
+from collections import OrderedDict
+
+import memstats
+
+# 默认配置（config.json 的 rate_limit 段，缺省字段用这里的值）
+DEFAULTS = {
+    "enabled": True,
+    "sender": {"rate": 0.2, "burst": 5},      # 每个发送者：每秒 0.2 条，突发 5 条
+    "chat": {"rate": 1.0, "burst": 20},       # 每个聊天：每秒 1 条，突发 20 条
+    "plugin_default": {"rate": 0.5, "burst": 10},
+    "plugins": {},                            # 插件名 -> {"rate", "burst"}，覆盖 plugin_default
+    "max_keys": 5000,                         # 每级最多跟踪的键数
+    "idle_seconds": 600,                      # 键空闲多久后淘汰
+    "notify": True,
+    "notify_msg": "🐢 消息太频繁啦，请稍后再试～",
+    "notify_interval": 60,
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.stamp = now
+
+
+class KeyedRateLimiter:
+    """按键限流，键表大小有上限（LRU + 空闲淘汰）"""
+    def __init__(self, rate, burst, max_keys=5000, idle_seconds=600):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+
+    def _evict(self, now):
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_keys or now - bucket.stamp > self.idle_seconds:
+                del self._buckets[key]
+                self.evicted += 1
+            else:
+                break
+
+    def allow(self, key, cost=1.0):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            else:
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.stamp) * self.rate)
+                bucket.stamp = now
+                self._buckets.move_to_end(key)
+            self._evict(now)
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                self.allowed += 1
+                return True
+            self.throttled += 1
+            return False
+
+    def refund(self, key, cost=1.0):
+        """退回 allow 扣除的令牌（后续检查拒绝时调用，不计入放行数）"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.tokens = min(self.burst, bucket.tokens + cost)
+                self.allowed -= 1
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"buckets": self._buckets})
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed,
+                    "throttled": self.throttled, "evicted": self.evicted}
+
+
+class MessageRateLimiter:
+    """消息级限流：发送者、聊天、插件三级令牌桶，配置可热更新"""
+    def __init__(self, config=None):
+        self._lock = threading.Lock()
+        self.configure(config)
+
+    def configure(self, config=None):
+        cfg = {**DEFAULTS, **(config or {})}
+        if cfg == getattr(self, "cfg", None):
+            return  # 配置未变化，保留现有令牌桶状态
+        max_keys, idle = int(cfg["max_keys"]), float(cfg["idle_seconds"])
+
+        def make(scope):
+            spec = {**DEFAULTS[scope], **(cfg.get(scope) or {})}
+            return KeyedRateLimiter(spec["rate"], spec["burst"], max_keys, idle)
+
+        with self._lock:
+            self.cfg = cfg
+            self.enabled = bool(cfg["enabled"])
+            self.sender = make("sender")
+            self.chat = make("chat")
+            self.plugin_default = {**DEFAULTS["plugin_default"], **(cfg.get("plugin_default") or {})}
+            self.plugin_specs = cfg.get("plugins") or {}
+            self.plugin = {}
+            # 提示限流：每个发送者 notify_interval 秒内最多提示一次
+            interval = max(1.0, float(cfg["notify_interval"]))
+            self._notified = KeyedRateLimiter(1.0 / interval, 1, max_keys, idle)
+
+    def allow_message(self, chat_name, sender):
+        """
+        发送者级与聊天级检查，返回 (是否放行, 被哪一级拦截)
+        先查发送者：被限流的发送者不消耗聊天的令牌，单个刷屏者不会挤占群内其他人的额度；
+        聊天级拒绝时退回发送者的令牌
+        """
+        if not self.enabled:
+            return True, None
+        sender_key = f"{chat_name}/{sender}" if sender else None
+        if sender_key and not self.sender.allow(sender_key):
+            return False, "sender"
+        if not self.chat.allow(chat_name):
+            if sender_key:
+                self.sender.refund(sender_key)
+            return False, "chat"
+        return True, None
+
+    def allow_plugin(self, plugin_name):
+        if not self.enabled:
+            return True
+        with self._lock:
+            limiter = self.plugin.get(plugin_name)
+            if limiter is None:
+                spec = {**self.plugin_default, **(self.plugin_specs.get(plugin_name) or {})}
+                limiter = self.plugin[plugin_name] = KeyedRateLimiter(
+                    spec.get("rate", 0), spec.get("burst", 1), 1, float(self.cfg["idle_seconds"]))
+        return limiter.allow(plugin_name)
+
+    def should_notify(self, chat_name, sender):
+        """是否需要回复「慢一点」提示"""
+        return bool(self.cfg.get("notify")) and self._notified.allow(f"{chat_name}/{sender}")
+
+    @property
+    def notify_msg(self):
+        return self.cfg.get("notify_msg") or DEFAULTS["notify_msg"]
+
+    def memory_stats(self):
+        """各级令牌桶键表的大小（供 /api/memory 使用）"""
+        return {"sender": self.sender.memory_stats()["buckets"], "chat": self.chat.memory_stats()["buckets"]}
+
+    def stats(self):
+        with self._lock:
+            plugins = {name: lim.stats()["throttled"] for name, lim in self.plugin.items()}
+        sender, chat = self.sender.stats(), self.chat.stats()
+        return {
+            "enabled": self.enabled,
+            "sender": sender,
+            "chat": chat,
+            "plugins_throttled": plugins,
+            "throttled_total": sender["throttled"] + chat["throttled"] + sum(plugins.values()),
+        }
@@ -0,0 +1,784 @@
+#!/usr/bin/env python3
+# remote_plugins.py
+# 远程插件执行：把重型插件放到其他机器（或本机其他进程）上的插件工作进程执行，避免与 UI 自动化争抢 CPU/网络
+# - 传输：TCP（tcp://host:port）或 Unix 套接字（unix:///path），帧格式为 4 字节长度 + 1 字节类型 + 紧凑 JSON（大包 zlib 压缩）
+# - 流程：主程序本机执行 check（不在入站线程上做网络往返）→ 限流准入 → RUN（工作进程执行 handle）
+#   handle 中的发送（chat.SendMsg / outbound.send_text）作为 ACTION 帧流式传回，由主程序经 outbound 发到真实聊天
+#   handle 启动的线程也计入该任务：全部结束后才回 RESULT，期间 CANCEL 可取消、负载统计包含这些线程
+# - 心跳：主程序定期 PING，工作进程回 PONG（附当前负载），超时断开并按退避重连
+# - 路由：按（进行中任务 / 容量 + 系统负载 + 往返延迟）选择最空闲的工作进程，同一聊天优先回到上次的进程（会话状态在进程内）
+# - 回退：没有可用工作进程、连接失败、RUN 确认超时或工作进程繁忙时，在本机执行 handle；
+#   确认超时的工作进程暂停分配一段时间，慢而未断开的进程不会拖慢每条消息
+# 启动工作进程（与主程序使用相同的插件文件）：
+#   python remote_plugins.py --listen tcp://0.0.0.0:9500 --plugins-dir ./plugins --token 密钥
+#   python remote_plugins.py --listen unix:///tmp/wxbot-worker.sock --concurrency 8
+# 主程序在 config.json 的 remote_plugins 段配置工作进程地址与需要远程执行的插件
+import argparse
+import hmac
+import itertools
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import outbound
+import memstats
+from logger import get_logger
+
+_log = get_logger("remote_plugins")
+
+PROTOCOL_VERSION = 2
+
+# 帧类型（CHECK / CHECKED / DROP 为协议 v1 的远程 check 所用，保留编号）
+HELLO, WELCOME, PING, PONG, CHECK, CHECKED, RUN, ACCEPTED, DROP, ACTION, RESULT, CANCEL, BUSY, ERROR = range(1, 15)
+_COMPRESSED = 0x80           # 类型字节最高位：正文经 zlib 压缩
+_HEADER = struct.Struct(">IB")
+COMPRESS_MIN = 1024          # 正文超过该字节数时压缩
+MAX_FRAME = 16 * 1024 * 1024
+
+DEFAULTS = {
+    "enabled": False,
+    "workers": [],              # 工作进程地址列表：tcp://host:port 或 unix:///path
+    "plugins": [],              # 远程执行的插件（文件名或 PLUGIN_NAME）
+    "token": "",                # 共享密钥，与工作进程 --token 一致
+    "ack_timeout": 2.0,         # RUN 等待确认的最长时间（秒），超时回退本机执行，该工作进程暂停分配 2 个心跳间隔
+    "heartbeat": 5.0,           # 心跳间隔（秒），3 个间隔无响应视为断开
+    "connect_timeout": 3.0,
+    "affinity_size": 2000,      # 记录「聊天 -> 工作进程」的最大条数
+}
+
+TASK_MAX_SECONDS = 600  # 无截止时间的任务最多等待其线程结束的时长（秒）
+
+# 传给工作进程的消息 / chat_info 字段
+MSG_FIELDS = ("type", "attr", "content", "sender", "sender_remark")
+CHAT_INFO_FIELDS = ("type", "name", "member_count", "sender", "sender_remark", "is_admin", "msg_time")
+
+
+# ====== 帧编解码 ======
+def encode_frame(ftype, body):
+    raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > COMPRESS_MIN:
+        raw = zlib.compress(raw, 1)
+        ftype |= _COMPRESSED
+    return _HEADER.pack(len(raw), ftype) + raw
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        try:
+            chunk = sock.recv(n - len(buf))
+        except socket.timeout:
+            continue  # 读超时只用于让线程有机会检查关闭，连接存活由心跳判断
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """读取一帧，返回 (类型, 正文)"""
+    length, ftype = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if length > MAX_FRAME:
+        raise ConnectionError(f"帧过大: {length}")
+    raw = _recv_exact(sock, length)
+    if ftype & _COMPRESSED:
+        raw = zlib.decompress(raw)
+        ftype &= ~_COMPRESSED
+    return ftype, json.loads(raw.decode("utf-8"))
+
+
+def parse_address(address):
+    """tcp://host:port / host:port -> (AF_INET, (host, port))；unix:///path -> (AF_UNIX, path)"""
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    host, _, port = address[len("tcp://"):].rpartition(":") if address.startswith("tcp://") else address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _system_load():
+    """归一化的系统负载（1 分钟平均负载 / CPU 数），平台不支持时为 0"""
+    try:
+        return round(os.getloadavg()[0] / (os.cpu_count() or 1), 3)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+# ====== 主程序侧 ======
+class _Run:
+    """一次远程执行：从 RUN 被确认到收到 RESULT（或过期）期间，接收工作进程传回的发送动作"""
+    __slots__ = ("link", "chat", "ctx", "expires", "cancel_handle")
+
+    def __init__(self, link, chat, ctx, expires):
+        self.link = link
+        self.chat = chat
+        self.ctx = ctx
+        self.expires = expires
+        self.cancel_handle = None
+
+
+class WorkerLink:
+    """到一个工作进程的连接：写操作加锁，读线程分发回复/动作"""
+    def __init__(self, pool, address):
+        self.pool = pool
+        self.address = address
+        self.sock = None
+        self.alive = False
+        self.name = address
+        self.plugins = set()
+        self.capacity = 1
+        self.inflight = 0
+        self.load = 0.0
+        self.rtt = 0.0
+        self.last_pong = 0.0
+        self.next_retry = 0.0
+        self.backoff = 1.0
+        self.slow_until = 0.0   # RUN 确认超时后暂停分配到该时间
+        self.counters = {"runs": 0, "failures": 0, "busy": 0, "slow": 0, "disconnects": 0}
+        self._wlock = threading.Lock()
+        self._waiters = {}  # rid -> [Event, (类型, 正文)]
+        self._lock = threading.Lock()
+
+    # ---------- 连接 ----------
+    def connect(self):
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.pool.connect_timeout)
+        try:
+            sock.connect(addr)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(encode_frame(HELLO, {"version": PROTOCOL_VERSION, "token": self.pool.token}))
+            ftype, body = recv_frame(sock)
+            if ftype != WELCOME:
+                raise ConnectionError(body.get("error", "握手失败") if isinstance(body, dict) else "握手失败")
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(max(self.pool.heartbeat, 1.0))
+        with self._lock:
+            self.sock = sock
+            self.inflight = 0
+            self.alive = True
+        self.name = body.get("name") or self.address
+        self.plugins = set(body.get("plugins") or [])
+        self.capacity = max(1, int(body.get("capacity", 1)))
+        self.load = float(body.get("load", 0.0))
+        self.last_pong = time.time()
+        self.slow_until = 0.0
+        self.backoff = 1.0
+        threading.Thread(target=self._reader, args=(sock,), name=f"remote-{self.name}", daemon=True).start()
+        _log.info("已连接插件工作进程 %s（%s，容量 %d，插件 %d 个）", self.address, self.name,
+                  self.capacity, len(self.plugins))
+
+    def close(self, reason=""):
+        with self._lock:
+            if not self.alive:
+                return
+            self.alive = False
+            sock, self.sock = self.sock, None
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+        self.counters["disconnects"] += 1
+        self.next_retry = time.time() + self.backoff
+        self.backoff = min(60.0, self.backoff * 2)
+        try:
+            sock.close()
+        except Exception:
+            pass
+        for w in waiters:
+            w[0].set()  # 等待中的请求得到 None，回退本机执行
+        self.pool._forget(self)
+        _log.warning("插件工作进程 %s 已断开：%s", self.address, reason or "-")
+
+    def send(self, ftype, body):
+        sock = self.sock
+        if not self.alive or sock is None:
+            raise ConnectionError("未连接")
+        frame = encode_frame(ftype, body)
+        try:
+            with self._wlock:
+                sock.sendall(frame)
+        except OSError as e:
+            self.close(f"发送失败: {e}")
+            raise ConnectionError(str(e))
+
+    def request(self, ftype, body, timeout):
+        """发送并等待同一 id 的回复，返回 (类型, 正文)；失败或超时返回 None"""
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._waiters[body["id"]] = waiter
+        try:
+            self.send(ftype, body)
+        except ConnectionError:
+            with self._lock:
+                self._waiters.pop(body["id"], None)
+            return None
+        if not waiter[0].wait(timeout):
+            with self._lock:
+                self._waiters.pop(body["id"], None)
+            self.counters["failures"] += 1
+            return None
+        return waiter[1]
+
+    def _reader(self, sock):
+        try:
+            while True:
+                ftype, body = recv_frame(sock)
+                if ftype == PONG:
+                    self.last_pong = time.time()
+                    self.rtt = self.last_pong - body.get("t", self.last_pong)
+                    self._update_load(body)
+                elif ftype == ACTION:
+                    self.pool._on_action(body)
+                elif ftype == RESULT:
+                    self._update_load(body)
+                    self.pool._on_result(self, body)
+                else:  # ACCEPTED / BUSY / ERROR：唤醒等待者
+                    with self._lock:
+                        waiter = self._waiters.pop(body.get("id"), None)
+                    if waiter is not None:
+                        waiter[1] = (ftype, body)
+                        waiter[0].set()
+        except Exception as e:
+            if self.sock is sock:
+                self.close(str(e))
+
+    def _update_load(self, body):
+        if "load" in body:
+            self.load = float(body["load"])
+
+    # ---------- 进行中任务（RUN 预占，RESULT / 过期 / 回退时释放，各只一次） ----------
+    def reserve(self):
+        with self._lock:
+            self.inflight += 1
+
+    def release(self):
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+
+    def available(self, now):
+        with self._lock:
+            return self.alive and self.slow_until <= now
+
+    def has_room(self):
+        with self._lock:
+            return self.inflight < self.capacity
+
+    def score(self):
+        """越小越空闲"""
+        with self._lock:
+            inflight = self.inflight
+        return (inflight + 1) / self.capacity + self.load + self.rtt
+
+    def info(self):
+        with self._lock:
+            inflight = self.inflight
+        return {"address": self.address, "name": self.name, "alive": self.alive, "capacity": self.capacity,
+                "inflight": inflight, "load": self.load, "rtt_ms": round(self.rtt * 1000, 1),
+                "slow": self.slow_until > time.time(), "plugins": sorted(self.plugins), **self.counters}
+
+
+class RemotePluginPool:
+    """
+    工作进程池（主程序侧）
+    PluginManager.dispatch 对远程插件照常在本机调用 check，匹配并准入后调用
+    run(p, msg, chat, chat_info, data)，返回 False 时本机执行 handle
+    """
+    def __init__(self, config=None):
+        self._lock = threading.Lock()
+        self._links = {}                 # 地址 -> WorkerLink
+        self._affinity = OrderedDict()   # 聊天 -> 地址
+        self._pending = {}               # rid -> _Run：RUN 确认后到 RESULT 之间，接收工作进程传回的动作
+        self._ids = itertools.count(1)
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = {"remote_runs": 0, "fallbacks": 0, "actions": 0, "errors": 0}
+        self.configure(config)
+
+    def configure(self, config=None):
+        cfg = {**DEFAULTS, **(config or {})}
+        self.enabled = bool(cfg["enabled"])
+        self.plugins = set(cfg.get("plugins") or [])
+        self.token = str(cfg.get("token") or "")
+        self.ack_timeout = max(0.1, float(cfg["ack_timeout"]))
+        self.heartbeat = max(0.5, float(cfg["heartbeat"]))
+        self.connect_timeout = max(0.1, float(cfg["connect_timeout"]))
+        self.affinity_size = max(1, int(cfg["affinity_size"]))
+        addresses = list(dict.fromkeys(cfg.get("workers") or [])) if self.enabled else []
+        with self._lock:
+            removed = [link for addr, link in self._links.items() if addr not in addresses]
+            self._links = {addr: self._links.get(addr) or WorkerLink(self, addr) for addr in addresses}
+        for link in removed:
+            link.close("已从配置中移除")
+        if self._links:
+            self.start()
+        else:
+            self.stop()
+
+    def handles(self, p):
+        return self.enabled and bool(self._links) and (p["key"] in self.plugins or p["name"] in self.plugins)
+
+    # ---------- 路由 ----------
+    def _pick(self, plugin_key, chat_name, exclude):
+        now = time.time()
+        with self._lock:
+            links = list(self._links.values())
+            preferred = self._links.get(self._affinity.get(chat_name))
+        links = [l for l in links if l not in exclude and plugin_key in l.plugins and l.available(now)]
+        if not links:
+            return None
+        if preferred in links and preferred.has_room():
+            return preferred
+        return min(links, key=WorkerLink.score)
+
+    def _remember(self, chat_name, link):
+        with self._lock:
+            self._affinity[chat_name] = link.address
+            self._affinity.move_to_end(chat_name)
+            while len(self._affinity) > self.affinity_size:
+                self._affinity.popitem(last=False)
+
+    # ---------- 分发 ----------
+    def run(self, p, msg, chat, chat_info, data):
+        """把已匹配的消息交给工作进程执行 handle；返回 False 表示需本机执行"""
+        try:
+            json.dumps(data)
+        except (TypeError, ValueError):
+            _log.debug("插件 %s 的 check 结果无法序列化，本机执行", p["key"])
+            self.counters["fallbacks"] += 1
+            return False
+        ctx = chat_info.get("ctx")
+        body = {
+            "plugin": p["key"],
+            "msg": {k: getattr(msg, k, "") for k in MSG_FIELDS},
+            "chat_info": {k: chat_info.get(k) for k in CHAT_INFO_FIELDS},
+            "data": data,
+            "timeout": ctx.remaining() if ctx is not None else None,
+        }
+        expires = ctx.deadline if ctx is not None and ctx.deadline else time.time() + TASK_MAX_SECONDS
+        tried = set()
+        while True:
+            link = self._pick(p["key"], chat_info.get("name"), tried)
+            if link is None:
+                self.counters["fallbacks"] += 1
+                return False
+            tried.add(link)
+            rid = body["id"] = next(self._ids)
+            entry = _Run(link, chat, ctx, expires)
+            with self._lock:
+                self._pending[rid] = entry
+            link.reserve()
+            reply = link.request(RUN, body, self.ack_timeout)
+            if reply is not None and reply[0] == ACCEPTED:
+                break
+            self._finish(rid)
+            if reply is None:
+                if link.alive:
+                    # 慢而未断开：暂停分配，并让工作进程放弃这次（可能稍后才收到的）RUN
+                    link.slow_until = time.time() + 2 * self.heartbeat
+                    link.counters["slow"] += 1
+                    self._cancel(link, rid)
+                    _log.warning("工作进程 %s 未在 %.1f 秒内确认，暂停分配", link.address, self.ack_timeout)
+            elif reply[0] == BUSY:
+                link.counters["busy"] += 1
+            else:
+                self.counters["errors"] += 1
+                _log.warning("工作进程 %s 拒绝执行 %s：%s", link.address, p["key"], reply[1].get("error"))
+        link.counters["runs"] += 1
+        self.counters["remote_runs"] += 1
+        self._remember(chat_info.get("name"), link)
+        if ctx is not None:
+            handle = ctx.token.on_cancel(lambda: self._cancel(link, rid))
+            with self._lock:
+                if rid in self._pending:
+                    entry.cancel_handle = handle
+                    handle = None
+            if handle is not None:
+                ctx.token.remove_callback(handle)  # 确认前已收到 RESULT
+        return True
+
+    def _finish(self, rid):
+        """结束一次远程执行：释放工作进程的预占并注销取消回调（重复调用无效果）"""
+        with self._lock:
+            entry = self._pending.pop(rid, None)
+        if entry is None:
+            return
+        entry.link.release()
+        if entry.cancel_handle is not None:
+            entry.ctx.token.remove_callback(entry.cancel_handle)
+
+    def _forget(self, link):
+        """连接断开：该连接上进行中的执行全部结束"""
+        with self._lock:
+            rids = [rid for rid, e in self._pending.items() if e.link is link]
+        for rid in rids:
+            self._finish(rid)
+
+    def _cancel(self, link, rid):
+        try:
+            link.send(CANCEL, {"id": rid})
+        except ConnectionError:
+            pass
+
+    # ---------- 工作进程回传 ----------
+    def _on_action(self, body):
+        with self._lock:
+            entry = self._pending.get(body.get("id"))
+        if entry is None:
+            return
+        self.counters["actions"] += 1
+        if body.get("kind") == "file":
+            threading.Thread(target=self._send_file, args=(entry.chat, body.get("path")), daemon=True).start()
+        else:
+            outbound.send_text(entry.chat, body.get("text", ""), at=body.get("at"), ctx=entry.ctx)
+
+    @staticmethod
+    def _send_file(chat, path):
+        try:
+            chat.SendFiles(path)
+        except Exception as e:
+            _log.error("发送工作进程返回的文件失败（%s）: %s", path, e)
+
+    def _on_result(self, link, body):
+        self._finish(body.get("id"))
+        if body.get("error"):
+            self.counters["errors"] += 1
+            _log.error("工作进程 %s 执行 handle 出错: %s", link.address, body["error"])
+
+    # ---------- 心跳与重连 ----------
+    def _maintain(self, stop):
+        while not stop.wait(self.heartbeat):
+            now = time.time()
+            for link in list(self._links.values()):
+                if not link.alive:
+                    if now >= link.next_retry:
+                        try:
+                            link.connect()
+                        except Exception as e:
+                            link.next_retry = now + link.backoff
+                            link.backoff = min(60.0, link.backoff * 2)
+                            _log.debug("连接插件工作进程 %s 失败: %s", link.address, e)
+                    continue
+                if now - link.last_pong > 3 * self.heartbeat:
+                    link.close("心跳超时")
+                    continue
+                try:
+                    link.send(PING, {"t": now})
+                except ConnectionError:
+                    pass
+            with self._lock:
+                expired = [rid for rid, e in self._pending.items() if e.expires < now]
+            for rid in expired:
+                self._finish(rid)
+
+    def start(self):
+        if self._thread and self._thread.is_alive() and not self._stop.is_set():
+            return
+        self._stop = threading.Event()
+        for link in self._links.values():
+            if not link.alive:
+                try:
+                    link.connect()
+                except Exception as e:
+                    link.next_retry = time.time() + link.backoff
+                    _log.warning("连接插件工作进程 %s 失败: %s", link.address, e)
+        self._thread = threading.Thread(target=self._maintain, args=(self._stop,), name="remote-plugins", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"pending": self._pending})
+
+    def stats(self):
+        with self._lock:
+            links = list(self._links.values())
+            pending = len(self._pending)
+        return {"enabled": self.enabled, "plugins": sorted(self.plugins), "pending": pending,
+                **self.counters, "workers": [l.info() for l in links]}
+
+
+# ====== 工作进程侧 ======
+_task_local = threading.local()
+_thread_start = None
+# 常驻复用的基础设施线程（线程池、发送队列、调度器、日志等）不计入任务，否则任务永远不会结束
+UNTRACKED_MODULES = ("concurrent.futures.thread", "outbound", "scheduler", "logger", "remote_plugins")
+
+
+class _Task:
+    """一次 handle 及其启动的线程（含线程再启动的线程），计数归零即任务结束"""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.threads = 0
+
+    def enter(self):
+        with self._cond:
+            self.threads += 1
+
+    def exit(self):
+        with self._cond:
+            self.threads -= 1
+            self._cond.notify_all()
+
+    def wait(self, ctx, limit):
+        """等待任务的线程全部结束；上下文取消/超时或超过 limit 秒时不再等待"""
+        end = time.time() + limit
+        with self._cond:
+            while self.threads > 0 and not ctx.done:
+                left = end - time.time()
+                if left <= 0:
+                    return False
+                self._cond.wait(min(1.0, left))
+        return self.threads == 0
+
+
+def _install_thread_tracking():
+    """
+    工作进程内：handle 执行期间启动的线程计入当前任务（插件常在 handle 中起线程后立即返回）
+    目标函数属于 UNTRACKED_MODULES 的线程不计入
+    """
+    global _thread_start
+    if _thread_start is not None:
+        return
+    _thread_start = threading.Thread.start
+
+    def start(thread):
+        task = getattr(_task_local, "task", None)
+        target = getattr(thread, "_target", None)
+        if task is None or getattr(target, "__module__", "") in UNTRACKED_MODULES:
+            return _thread_start(thread)
+        run = thread.run
+
+        def tracked():
+            _task_local.task = task
+            try:
+                run()
+            finally:
+                task.exit()
+        task.enter()
+        thread.run = tracked
+        try:
+            return _thread_start(thread)
+        except Exception:
+            task.exit()
+            raise
+
+    threading.Thread.start = start
+
+
+class RemoteMessage:
+    """工作进程中的消息对象（只含插件常用属性）"""
+    def __init__(self, fields):
+        for k in MSG_FIELDS:
+            setattr(self, k, fields.get(k, ""))
+
+
+class RemoteChat:
+    """工作进程中的聊天对象：发送操作转为 ACTION 帧传回主程序"""
+    def __init__(self, conn, rid, chat_info):
+        self.conn = conn
+        self.rid = rid
+        self.who = chat_info.get("name")
+        self._info = chat_info
+
+    def SendMsg(self, msg, at=None):
+        self.conn.send(ACTION, {"id": self.rid, "kind": "text", "text": msg, "at": at})
+
+    def SendFiles(self, filepath):
+        # 文件路径在主程序所在机器上解析（需共享存储或相同路径）
+        self.conn.send(ACTION, {"id": self.rid, "kind": "file", "path": filepath})
+
+    def ChatInfo(self):
+        info = {"chat_type": self._info.get("type"), "chat_name": self.who}
+        if self._info.get("type") == "group":
+            info["group_member_count"] = self._info.get("member_count")
+        return info
+
+
+class _WorkerConn:
+    def __init__(self, sock):
+        self.sock = sock
+        self._wlock = threading.Lock()
+
+    def send(self, ftype, body):
+        frame = encode_frame(ftype, body)
+        with self._wlock:
+            self.sock.sendall(frame)
+
+
+class PluginWorker:
+    """插件工作进程：加载插件目录，执行主程序发来的 handle（连同其启动的线程）"""
+    def __init__(self, listen, plugins_dir="./plugins", concurrency=4, token="", name=None, settings=None):
+        from wxbot_class_only_V2 import PluginManager
+        from state_store import StateStore
+        _install_thread_tracking()
+        self.listen = listen
+        self.token = token or ""
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.capacity = max(1, int(concurrency))
+        self.state_store = StateStore()
+        self.manager = PluginManager(plugins_dir, state_store=self.state_store, settings=settings)
+        self.plugins = {}
+        for p in self.manager.plugins:
+            if p["enabled"]:
+                self.plugins[p["key"]] = p
+                self.plugins.setdefault(p["name"], p)
+        self._executor = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix="plugin-worker")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._contexts = {}  # (连接, rid) -> Context
+        self._server = None
+
+    def _load(self):
+        with self._lock:
+            inflight = self._inflight
+        return {"inflight": inflight, "capacity": self.capacity, "load": _system_load()}
+
+    def serve_forever(self):
+        family, addr = parse_address(self.listen)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(addr):
+                os.unlink(addr)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(addr)
+        server.listen(16)
+        self._server = server
+        _log.success("插件工作进程 %s 已启动：%s（插件 %s，并发 %d）", self.name, self.listen,
+                     ", ".join(p["key"] for p in self.manager.plugins if p["enabled"]), self.capacity)
+        try:
+            while True:
+                sock, peer = server.accept()
+                threading.Thread(target=self._serve, args=(sock, peer), name="worker-conn", daemon=True).start()
+        except OSError:
+            pass  # shutdown() 关闭了监听套接字
+        finally:
+            server.close()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _serve(self, sock, peer):
+        conn = _WorkerConn(sock)
+        try:
+            ftype, body = recv_frame(sock)
+            if ftype != HELLO or not hmac.compare_digest(str(body.get("token", "")), self.token):
+                conn.send(ERROR, {"error": "认证失败"})
+                _log.warning("拒绝连接 %s：认证失败", peer)
+                return
+            if body.get("version") != PROTOCOL_VERSION:
+                conn.send(ERROR, {"error": f"协议版本不一致（工作进程 v{PROTOCOL_VERSION}）"})
+                _log.warning("拒绝连接 %s：协议版本 %s", peer, body.get("version"))
+                return
+            conn.send(WELCOME, {"name": self.name, "version": PROTOCOL_VERSION, "plugins": sorted(self.plugins),
+                                **self._load()})
+            _log.info("主程序已连接：%s", peer or "unix")
+            while True:
+                ftype, body = recv_frame(sock)
+                if ftype == PING:
+                    conn.send(PONG, {"t": body.get("t"), **self._load()})
+                elif ftype == RUN:
+                    self._run(conn, body)
+                elif ftype == CANCEL:
+                    with self._lock:
+                        ctx = self._contexts.get((conn, body["id"]))
+                    if ctx is not None:
+                        ctx.cancel("主程序已取消")
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            _log.error("工作进程连接处理出错: %s", e)
+        finally:
+            with self._lock:
+                contexts = [self._contexts[k] for k in self._contexts if k[0] is conn]
+            for ctx in contexts:
+                ctx.cancel("主程序连接已断开")
+            sock.close()
+
+    def _run(self, conn, body):
+        from context import Context
+        rid = body["id"]
+        p = self.plugins.get(body.get("plugin"))
+        if p is None:
+            conn.send(ERROR, {"id": rid, "error": f"工作进程未加载插件 {body.get('plugin')}"})
+            return
+        info = dict(body.get("chat_info") or {})
+        ctx = Context.with_timeout(body.get("timeout"))
+        with self._lock:
+            busy = self._inflight >= self.capacity
+            if not busy:
+                self._inflight += 1
+                self._contexts[(conn, rid)] = ctx
+        if busy:
+            conn.send(BUSY, {"id": rid, **self._load()})
+            return
+        chat_info = {**info, "ctx": ctx,
+                     "state": self.state_store.scope(p["name"], info.get("name"), info.get("sender"))}
+        conn.send(ACCEPTED, {"id": rid})
+        self._executor.submit(self._handle, conn, rid, p, RemoteMessage(body.get("msg") or {}), chat_info,
+                              body.get("data"))
+
+    def _handle(self, conn, rid, p, msg, chat_info, data):
+        """执行 handle 并等待其启动的线程结束，之后才释放并发名额、回 RESULT"""
+        ctx = chat_info["ctx"]
+        task = _Task()
+        error = None
+        result = None
+        _task_local.task = task
+        try:
+            result = p["module"].handle(msg, RemoteChat(conn, rid, chat_info), chat_info, data)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            _log.error("插件 %s 执行 handle 出错: %s\n%s", p["name"], e, traceback.format_exc())
+        finally:
+            _task_local.task = None
+        try:
+            rem = ctx.remaining()
+            if not task.wait(ctx, TASK_MAX_SECONDS if rem is None else max(0.0, rem)):
+                _log.warning("插件 %s 的任务线程在截止时间内未结束（%d 个），不再等待", p["name"], task.threads)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._contexts.pop((conn, rid), None)
+        try:
+            conn.send(RESULT, {"id": rid, "handled": result is not None, "error": error, **self._load()})
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WXBot 插件工作进程")
+    parser.add_argument("--listen", required=True, help="监听地址：tcp://0.0.0.0:9500 或 unix:///tmp/wxbot-worker.sock")
+    parser.add_argument("--plugins-dir", default="./plugins", help="插件目录（与主程序相同的插件文件）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的 handle 数")
+    parser.add_argument("--token", default=os.environ.get("WXBOT_WORKER_TOKEN", ""), help="共享密钥")
+    parser.add_argument("--name", help="工作进程名称（默认 主机名:进程号）")
+    parser.add_argument("--config", help="读取其中的 plugins 段作为插件设置")
+    args = parser.parse_args(argv)
+    settings = None
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            settings = json.load(f).get("plugins")
+    worker = PluginWorker(args.listen, args.plugins_dir, args.concurrency, args.token, args.name, settings)
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        worker.shutdown()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
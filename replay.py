@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# replay.py
+# 压测回放工具：在 wxsim 模拟后端上运行完整的 WXBot，按 N 倍速回放录制或合成的消息轨迹，
+# 统计端到端吞吐量与回复延迟（p50/p90/p99）
+# 用法：
+#   python replay.py --synthetic 2000 --rate 100                    # 合成轨迹：2000 条，平均每秒 100 条
+#   python replay.py trace.jsonl --speed 10                           # 录制轨迹按 10 倍速回放
+#   python replay.py --synthetic 500 --latency 0.1 --failure-rate 0.05 --save-trace out.jsonl
+# 轨迹格式（JSONL，每行一条）：
+#   {"t": 相对秒, "chat": 聊天名, "chat_type": "friend|group", "sender": 发送人, "content": 内容,
+#    "type": "text", "expect_reply": true}
+# 回复延迟 = 消息投递到该聊天下一次发送成功的时间；expect_reply 缺省时按关键词字典是否命中判断
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import outbound
+from wxbot_class_only_V2 import WXBot
+
+# 合成轨迹使用的关键词字典（命中即自动回复）
+SYNTHETIC_KEYWORDS = {
+    "价格": "💰 价格表：基础版 99 元，专业版 199 元",
+    "地址": "📍 地址：XX 市 XX 路 88 号",
+    "营业时间": "⏰ 营业时间：每天 9:00 - 21:00",
+    "=帮助": "📖 回复「价格」「地址」「营业时间」获取信息",
+}
+CHATTER = ["哈哈", "好的", "收到", "今天天气不错", "有人吗", "晚上吃什么", "👍", "明天见"]
+
+
+# ====== 轨迹 ======
+def load_trace(path):
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    events.sort(key=lambda e: e.get("t", 0))
+    return events
+
+
+def save_trace(events, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for e in events:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+
+def synthetic_trace(count, rate, friends=20, groups=5, hit_ratio=0.5, seed=None):
+    """按泊松到达生成轨迹：私聊/群聊混合，hit_ratio 比例的消息命中关键词"""
+    rng = random.Random(seed)
+    keywords = [k.lstrip("=^") for k in SYNTHETIC_KEYWORDS]
+    events, t = [], 0.0
+    for _ in range(count):
+        t += rng.expovariate(rate)
+        hit = rng.random() < hit_ratio
+        content = rng.choice(keywords) if hit else rng.choice(CHATTER)
+        if rng.random() < groups / float(friends + groups):
+            chat = f"压测群{rng.randrange(groups)}"
+            events.append({"t": round(t, 4), "chat": chat, "chat_type": "group",
+                           "sender": f"群成员{rng.randrange(200)}", "content": content, "expect_reply": hit})
+        else:
+            chat = f"压测好友{rng.randrange(friends)}"
+            events.append({"t": round(t, 4), "chat": chat, "chat_type": "friend",
+                           "sender": chat, "content": content, "expect_reply": hit})
+    return events
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# ====== 回放 ======
+class Replay:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="wxbot_replay_")
+        self._lock = threading.Lock()
+        self._pending = defaultdict(deque)  # 聊天 -> 等待回复的投递时间
+        self.latencies = []
+        self.sends = 0
+        self.bot = None
+
+    def _write_config(self):
+        config = {}
+        if self.args.config:
+            with open(self.args.config, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        config.update({
+            "backend": "sim",
+            "sim": {"latency": self.args.latency, "jitter": self.args.jitter,
+                    "failure_rate": self.args.failure_rate, "seed": self.args.seed},
+            "log_levels": {"": self.args.log_level},
+            "new_friend_switch": False,
+        })
+        if not self.args.config:
+            config.update({"chat_keyword_switch": True, "group_keyword_switch": True,
+                           "group_switch": True, "keyword_dict": SYNTHETIC_KEYWORDS})
+        if not self.args.rate_limit:
+            config["rate_limit"] = {**config.get("rate_limit", {}), "enabled": False}
+        path = os.path.join(self.workdir, "config.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        return path
+
+    def _on_send(self, chat_name, kind, content, at, ts):
+        with self._lock:
+            self.sends += 1
+            q = self._pending.get(chat_name)
+            if q:
+                self.latencies.append(ts - q.popleft())
+
+    def start_bot(self):
+        plugins_dir = os.path.abspath(self.args.plugins_dir) if self.args.plugins_dir else os.path.join(self.workdir, "plugins")
+        config_file = self._write_config()
+        os.chdir(self.workdir)  # 日志、接待队列等运行时文件写到临时目录
+        self.bot = WXBot(config_file=config_file, plugins_dir=plugins_dir)
+        threading.Thread(target=self.bot.main, name="wxbot-main", daemon=True).start()
+        deadline = time.time() + 30
+        while self.bot.scheduler is None or self.bot.wx is None:
+            if time.time() > deadline:
+                raise RuntimeError("机器人启动超时")
+            time.sleep(0.05)
+        self.bot.wx.on_send = self._on_send
+
+    def run(self, events):
+        self.start_bot()
+        bot, wx = self.bot, self.bot.wx
+        for chat in sorted({e["chat"] for e in events}):
+            wx.AddListenChat(nickname=chat, callback=bot.message_handle_callback)
+        speed = max(self.args.speed, 1e-6)
+        expected = 0
+        start = time.time()
+        for e in events:
+            delay = start + e.get("t", 0) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            expect = e.get("expect_reply")
+            if expect is None:
+                expect = bot.keyword_engine.match(e.get("content", "")) is not None
+            if expect:
+                expected += 1
+                with self._lock:
+                    self._pending[e["chat"]].append(time.time())
+            wx.inject(e["chat"], e.get("content", ""), sender=e.get("sender", ""),
+                      chat_type=e.get("chat_type", "friend"), type=e.get("type", "text"),
+                      attr=e.get("attr", "friend"))
+        inject_done = time.time()
+        # 等待入站与发送队列排空
+        deadline = inject_done + self.args.drain_timeout
+        while time.time() < deadline:
+            with self._lock:
+                waiting = sum(len(q) for q in self._pending.values())
+            if (waiting == 0 and wx.stats()["backlog"] == 0 and bot.inbound.stats()["backlog"] == 0
+                    and outbound.sender.stats()["backlog"] == 0):
+                break
+            time.sleep(0.05)
+        end = time.time()
+        report = self.report(events, expected, start, inject_done, end)
+        bot.stop()
+        return report
+
+    def report(self, events, expected, start, inject_done, end):
+        inbound = self.bot.inbound.stats()
+        processed = sum(c["processed"] for c in inbound["classes"].values())
+        shed = sum(c["shed"] for c in inbound["classes"].values())
+        ob = outbound.sender.stats()
+        lat_ms = [x * 1000 for x in self.latencies]
+        duration = max(end - start, 1e-6)
+        return {
+            "messages": len(events),
+            "speed": self.args.speed,
+            "inject_seconds": round(inject_done - start, 3),
+            "total_seconds": round(duration, 3),
+            "processed": processed,
+            "shed": shed,
+            "throughput_msg_s": round(processed / duration, 2),
+            "expected_replies": expected,
+            "replies": len(self.latencies),
+            "unanswered": expected - len(self.latencies),
+            "sends": self.sends,
+            "send_failed": ob["failed"],
+            "send_retried": ob["retried"],
+            "ui_failures": self.bot.wx.counters["ui_failures"],
+            "reply_latency_ms": {
+                "p50": round(percentile(lat_ms, 50), 1),
+                "p90": round(percentile(lat_ms, 90), 1),
+                "p99": round(percentile(lat_ms, 99), 1),
+                "max": round(max(lat_ms), 1) if lat_ms else 0.0,
+            },
+            "workdir": self.workdir,
+        }
+
+
+def print_report(r):
+    lat = r["reply_latency_ms"]
+    print("=" * 48)
+    print(f"消息数        {r['messages']}（{r['speed']}x 回放，投递耗时 {r['inject_seconds']}s）")
+    print(f"已处理        {r['processed']}（丢弃 {r['shed']}），总耗时 {r['total_seconds']}s")
+    print(f"吞吐量        {r['throughput_msg_s']} 条/秒")
+    print(f"回复          {r['replies']}/{r['expected_replies']}（未回复 {r['unanswered']}）")
+    print(f"发送          {r['sends']} 次，失败 {r['send_failed']}，重试 {r['send_retried']}，UI 失败注入 {r['ui_failures']}")
+    print(f"回复延迟(ms)  p50={lat['p50']}  p90={lat['p90']}  p99={lat['p99']}  max={lat['max']}")
+    print(f"运行目录      {r['workdir']}")
+    print("=" * 48)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='WXBot 压测回放（wxsim 模拟后端）')
+    parser.add_argument('trace', nargs='?', help='轨迹文件（JSONL）；不指定时使用 --synthetic 生成')
+    parser.add_argument('--synthetic', type=int, default=0, help='生成合成轨迹的消息数')
+    parser.add_argument('--rate', type=float, default=50.0, help='合成轨迹的平均到达速率（条/秒）')
+    parser.add_argument('--hit-ratio', type=float, default=0.5, help='合成轨迹中命中关键词的比例')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟 UI 调用平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.02, help='模拟 UI 调用延迟抖动（秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='模拟 UI 调用失败概率')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    parser.add_argument('--config', help='基础配置文件（默认使用合成关键词配置）')
+    parser.add_argument('--plugins-dir', help='加载的插件目录（默认不加载插件）')
+    parser.add_argument('--rate-limit', action='store_true', help='保留限流（默认关闭以测量极限吞吐）')
+    parser.add_argument('--log-level', default='WARNING', help='回放期间的日志级别')
+    parser.add_argument('--drain-timeout', type=float, default=60.0, help='投递结束后等待排空的最长时间（秒）')
+    parser.add_argument('--save-trace', help='保存本次使用的轨迹')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args(argv)
+    if not args.trace and not args.synthetic:
+        parser.error('需要指定轨迹文件或 --synthetic N')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        events = load_trace(args.trace)
+    else:
+        events = synthetic_trace(args.synthetic, args.rate, hit_ratio=args.hit_ratio, seed=args.seed)
+    if args.save_trace:
+        save_trace(events, os.path.abspath(args.save_trace))
+    report = Replay(args).run(events)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+# scheduler.py
+# 定时任务调度器：基于最小堆的计时器，替代各处的轮询 + 计数器写法
+# - 支持 间隔任务(every) / 一次性任务(after/at) / cron 任务(cron)
+# - 错过执行（misfire）策略：skip 跳过 / once 补跑一次 / all 逐次补跑
+# - 支持随机抖动 jitter，避免多个任务同时触发
+# - 线程空闲时一直睡到下一个任务到期，新增/取消任务时立即唤醒
+# 主程序、web 服务与插件均可复用
+import heapq
+import itertools
+import random
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import memstats
+from logger import log
+
+MISFIRE_POLICIES = ("skip", "once", "all")
+# misfire=all 时单次最多补跑的次数，防止长时间休眠后瞬间刷屏
+MAX_CATCHUP_RUNS = 100
+
+
+# ====== cron 表达式 ======
+class CronSpec:
+    """
+    5 段 cron 表达式：分 时 日 月 周（周日为 0 或 7）
+    每段支持 *、*/n、a、a-b、a-b/n 以及逗号分隔的组合
+    """
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron 表达式需要 5 段: {expr}")
+        self.expr = expr
+        fields = [self._parse(p, lo, hi) for p, (lo, hi) in zip(parts, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months, dows = fields
+        self.dows = {d % 7 for d in dows}
+        self.dom_any = parts[2] == "*"
+        self.dow_any = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field, lo, hi):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_s = part.split("/", 1)
+                step = int(step_s)
+                if step <= 0:
+                    raise ValueError(f"cron 步长非法: {field}")
+            if part == "*":
+                a, b = lo, hi
+            elif "-" in part:
+                a_s, b_s = part.split("-", 1)
+                a, b = int(a_s), int(b_s)
+            else:
+                a = int(part)
+                b = hi if step > 1 else a
+            if a < lo or b > hi or a > b:
+                raise ValueError(f"cron 字段越界: {field}")
+            values.update(range(a, b + 1, step))
+        return values
+
+    def _day_match(self, dt):
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.dows
+        if self.dom_any and self.dow_any:
+            return True
+        if self.dom_any:
+            return dow
+        if self.dow_any:
+            return dom
+        return dom or dow  # 与 crontab 一致：日与周同时限定时取并集
+
+    def next_after(self, ts: float) -> float:
+        """返回严格晚于 ts 的下一个触发时间（时间戳）"""
+        dt = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_match(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt.timestamp()
+        raise ValueError(f"cron 表达式无可用触发时间: {self.expr}")
+
+
+# ====== 任务 ======
+class Job:
+    """调度任务（由 Scheduler 创建，外部只读）"""
+    __slots__ = ("id", "name", "func", "args", "kwargs", "kind", "interval", "cron",
+                 "base", "next_run", "misfire", "grace", "jitter", "tag", "threaded",
+                 "cancelled", "runs", "missed", "last_run", "last_error")
+
+    def __init__(self, jid, name, func, args, kwargs, kind, interval=None, cron=None,
+                 misfire="skip", grace=1.0, jitter=0.0, tag=None, threaded=False):
+        if misfire not in MISFIRE_POLICIES:
+            raise ValueError(f"未知的 misfire 策略: {misfire}")
+        self.id = jid
+        self.name = name or getattr(func, "__name__", "job")
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.kind = kind
+        self.interval = interval
+        self.cron = cron
+        self.base = 0.0       # 不含抖动的理论触发时间
+        self.next_run = 0.0   # 实际触发时间（含抖动）
+        self.misfire = misfire
+        self.grace = grace
+        self.jitter = jitter
+        self.tag = tag
+        self.threaded = threaded
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+        self.last_run = None
+        self.last_error = None
+
+    def _following(self, base):
+        """base 之后的下一个理论触发时间，一次性任务返回 None"""
+        if self.kind == "interval":
+            return base + self.interval
+        if self.kind == "cron":
+            return self.cron.next_after(base)
+        return None
+
+    def _set_base(self, base):
+        self.base = base
+        self.next_run = base + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "kind": self.kind,
+            "tag": self.tag,
+            "next_run": datetime.fromtimestamp(self.next_run).strftime("%Y-%m-%d %H:%M:%S") if not self.cancelled else None,
+            "runs": self.runs,
+            "missed": self.missed,
+            "last_error": self.last_error,
+        }
+
+
+# ====== 调度器 ======
+class Scheduler:
+    """
+    最小堆调度器
+    用法：
+        sched = Scheduler("wxbot")
+        sched.every(10, check_online)
+        sched.cron("0 8 * * *", start_bot, misfire="skip", grace=300)
+        sched.after(5, flush)
+        sched.start()            # 后台线程运行；或 sched.run() 在当前线程阻塞运行
+    """
+    def __init__(self, name: str = "scheduler"):
+        self.name = name
+        self._heap = []
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.monitor = None  # 卡死检测（hang_watch.Watchdog），设置后每次执行任务登记心跳
+
+    # ---------- 注册 ----------
+    def _add(self, job, first_base):
+        job._set_base(first_base)
+        with self._cond:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.next_run, job.id, job))
+            self._cond.notify()
+        return job
+
+    def every(self, seconds, func, *args, name=None, first_delay=None, jitter=0.0,
+              misfire="once", grace=None, tag=None, threaded=False, **kwargs):
+        """每隔 seconds 秒执行一次；first_delay 为首次延迟（默认等于间隔）"""
+        if seconds <= 0:
+            raise ValueError("间隔必须大于 0")
+        job = Job(next(self._ids), name, func, args, kwargs, "interval", interval=float(seconds),
+                  misfire=misfire, grace=seconds if grace is None else grace,
+                  jitter=jitter, tag=tag, threaded=threaded)
+        return self._add(job, time.time() + (seconds if first_delay is None else first_delay))
+
+    def after(self, delay, func, *args, name=None, jitter=0.0, tag=None, threaded=False, **kwargs):
+        """delay 秒后执行一次"""
+        job = Job(next(self._ids), name, func, args, kwargs, "once", misfire="once",
+                  jitter=jitter, tag=tag, threaded=threaded)
+        return self._add(job, time.time() + max(0.0, delay))
+
+    def at(self, when, func, *args, name=None, misfire="once", grace=60.0, tag=None, threaded=False, **kwargs):
+        """在指定时间（datetime 或时间戳）执行一次"""
+        ts = when.timestamp() if isinstance(when, datetime) else float(when)
+        job = Job(next(self._ids), name, func, args, kwargs, "once", misfire=misfire,
+                  grace=grace, tag=tag, threaded=threaded)
+        return self._add(job, ts)
+
+    def cron(self, expr, func, *args, name=None, jitter=0.0, misfire="skip", grace=60.0,
+             tag=None, threaded=False, **kwargs):
+        """按 cron 表达式执行（本地时间）"""
+        spec = CronSpec(expr)
+        job = Job(next(self._ids), name, func, args, kwargs, "cron", cron=spec, misfire=misfire,
+                  grace=grace, jitter=jitter, tag=tag, threaded=threaded)
+        return self._add(job, spec.next_after(time.time()))
+
+    def cancel(self, job):
+        """取消任务（惰性删除，堆中残留项在出堆时丢弃）"""
+        with self._cond:
+            job.cancelled = True
+            self._jobs.pop(job.id, None)
+            self._cond.notify()
+
+    def cancel_tag(self, tag):
+        with self._cond:
+            for job in [j for j in self._jobs.values() if j.tag == tag]:
+                job.cancelled = True
+                self._jobs.pop(job.id, None)
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear()
+            self._heap.clear()
+            self._cond.notify()
+
+    def jobs(self):
+        with self._cond:
+            return [j.info() for j in sorted(self._jobs.values(), key=lambda j: j.next_run)]
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._cond:
+            return memstats.measure({"jobs": self._jobs})
+
+    # ---------- 执行 ----------
+    def _execute(self, job):
+        job.runs += 1
+        job.last_run = time.time()
+        try:
+            if self.monitor is not None:
+                with self.monitor.track("scheduler", job.name):
+                    job.func(*job.args, **job.kwargs)
+            else:
+                job.func(*job.args, **job.kwargs)
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            log("ERROR", f"[{self.name}] 定时任务 {job.name} 执行出错: {e}")
+            log("ERROR", traceback.format_exc())
+
+    def _run_job(self, job):
+        if job.threaded:
+            threading.Thread(target=self._execute, args=(job,), name=f"{self.name}-{job.name}", daemon=True).start()
+        else:
+            self._execute(job)
+
+    def _due(self, job, now):
+        """按 misfire 策略计算本次需要执行的次数，并推进到下一个触发时间"""
+        late = now - job.next_run
+        times = 1
+        if late > job.grace:
+            if job.kind == "once":
+                times = 0 if job.misfire == "skip" else 1
+            else:
+                # 统计错过的触发次数
+                missed = 0
+                base = job.base
+                nxt = job._following(base)
+                while nxt is not None and nxt <= now and missed < MAX_CATCHUP_RUNS:
+                    missed += 1
+                    base = nxt
+                    nxt = job._following(base)
+                job.base = base
+                job.missed += missed
+                times = {"skip": 0, "once": 1, "all": missed + 1}[job.misfire]
+                if times == 0:
+                    log("WARNING", f"[{self.name}] 定时任务 {job.name} 错过执行（延迟 {late:.0f}s），已跳过")
+        nxt = job._following(job.base)
+        if nxt is not None:
+            while nxt <= now:  # 超过补跑上限的剩余部分直接跳过
+                nxt = job._following(nxt)
+            job._set_base(nxt)
+        return times
+
+    def run(self):
+        """在当前线程运行调度循环，直到 stop() 被调用；空闲时睡到下一个任务到期"""
+        log("INFO", f"[{self.name}] 调度器已启动")
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.time()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopped:
+                    break
+                _, _, job = heapq.heappop(self._heap)
+                now = time.time()
+                times = self._due(job, now)
+                if job.kind == "once":
+                    self._jobs.pop(job.id, None)
+                else:
+                    heapq.heappush(self._heap, (job.next_run, job.id, job))
+            for _ in range(times):
+                if job.cancelled and job.kind != "once":
+                    break
+                self._run_job(job)
+        log("INFO", f"[{self.name}] 调度器已停止")
+
+    def start(self):
+        """在后台守护线程中运行调度器（重复调用无副作用）"""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return self._thread
+            self._stopped = False
+            self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
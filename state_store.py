@@ -0,0 +1,232 @@
+# state_store.py
+# 插件会话状态存储：按「插件 / 聊天 / 发送者」隔离，供插件实现多步交互（例如确认、分步填写）
+# - 值以紧凑 JSON 字符串保存（占用可精确统计，读取得到副本，不会被外部修改）
+# - 每条记录有 TTL；总条数与总字节数有上限，超出按最近最少使用（LRU）淘汰
+# - 可选快照到磁盘（原子写入），重启后恢复未过期的记录
+# - 按插件统计条数与占用字节
+# 插件通过 chat_info['state'] 访问（由 PluginManager 在调用 check/handle 前注入）：
+#   state = chat_info['state']
+#   state.set("step", 2, ttl=300)      # 当前聊天 + 当前发送者
+#   state.get("step")                  # -> 2，不存在或已过期返回 default
+#   state.chat.set("topic", "电影")    # 整个聊天共享（群内所有人）
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import memstats
+from logger import log
+
+SNAPSHOT_FILE = "state_store.json"
+
+DEFAULTS = {
+    "max_entries": 10000,       # 全部插件合计最多条数
+    "max_bytes": 8 * 1024 * 1024,  # 全部插件合计最多字节（按序列化后的值计算）
+    "default_ttl": 3600,        # 默认有效期（秒）
+    "snapshot": False,          # 是否定期快照到磁盘
+    "snapshot_interval": 300,   # 快照间隔（秒）
+}
+
+_ENTRY_OVERHEAD = 64  # 每条记录的键与元数据的估算开销（字节）
+
+
+class _Entry:
+    __slots__ = ("data", "expires", "size")
+
+    def __init__(self, data, expires, size):
+        self.data = data
+        self.expires = expires
+        self.size = size
+
+
+class StateStore:
+    """全局状态存储，键为 (插件, 聊天, 发送者, 键名)，发送者为 "" 表示聊天级"""
+    def __init__(self, config=None, snapshot_file=SNAPSHOT_FILE):
+        self.snapshot_file = snapshot_file
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._plugins = {}  # 插件 -> [条数, 字节]
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "evicted": 0, "expired": 0}
+        self.configure(config)
+
+    def configure(self, config=None):
+        cfg = {**DEFAULTS, **(config or {})}
+        with self._lock:
+            self.max_entries = max(1, int(cfg["max_entries"]))
+            self.max_bytes = max(1024, int(cfg["max_bytes"]))
+            self.default_ttl = float(cfg["default_ttl"])
+            self.snapshot_enabled = bool(cfg["snapshot"])
+            self.snapshot_interval = max(10.0, float(cfg["snapshot_interval"]))
+            self._evict(time.time())
+
+    # ---------- 内部 ----------
+    def _account(self, key, entry, sign):
+        usage = self._plugins.setdefault(key[0], [0, 0])
+        usage[0] += sign
+        usage[1] += sign * entry.size
+        self._bytes += sign * entry.size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._account(key, entry, -1)
+        return entry
+
+    def _evict(self, now):
+        """先清理表头的过期记录，再按 LRU 淘汰到上限以内（调用方持锁）"""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires <= now:
+                self._remove(key)
+                self.counters["expired"] += 1
+            elif len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(key)
+                self.counters["evicted"] += 1
+            else:
+                break
+
+    # ---------- 读写 ----------
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= now:
+                if entry is not None:
+                    self._remove(key)
+                    self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            data = entry.data
+        return json.loads(data)
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        size = len(data.encode("utf-8")) + sum(len(str(k)) for k in key) + _ENTRY_OVERHEAD
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else float(ttl)
+        with self._lock:
+            self._remove(key)
+            entry = _Entry(data, now + ttl, size)
+            self._entries[key] = entry
+            self._account(key, entry, 1)
+            self.counters["sets"] += 1
+            self._evict(now)
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key) is not None
+
+    def clear(self, plugin=None, chat=None, sender=None):
+        """按插件 / 聊天 / 发送者批量删除，参数为 None 表示不限"""
+        with self._lock:
+            keys = [k for k in self._entries
+                    if (plugin is None or k[0] == plugin) and (chat is None or k[1] == chat)
+                    and (sender is None or k[2] == sender)]
+            for k in keys:
+                self._remove(k)
+        return len(keys)
+
+    def scope(self, plugin, chat, sender=""):
+        return StateScope(self, plugin, chat, sender or "")
+
+    # ---------- 快照 ----------
+    def snapshot(self, path=None):
+        """将未过期的记录写入磁盘（先写临时文件再替换）"""
+        path = path or self.snapshot_file
+        now = time.time()
+        with self._lock:
+            rows = [[*k, e.data, e.expires] for k, e in self._entries.items() if e.expires > now]
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:
+            log("ERROR", f"保存状态快照失败: {e}")
+        return len(rows)
+
+    def restore(self, path=None):
+        """从快照恢复未过期的记录（按原先的使用顺序）"""
+        path = path or self.snapshot_file
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception as e:
+            log("ERROR", f"读取状态快照失败: {e}")
+            return 0
+        now = time.time()
+        with self._lock:
+            for plugin, chat, sender, name, data, expires in rows:
+                if expires <= now:
+                    continue
+                key = (plugin, chat, sender, name)
+                self._remove(key)
+                entry = _Entry(data, expires, len(data.encode("utf-8")) + sum(len(str(k)) for k in key) + _ENTRY_OVERHEAD)
+                self._entries[key] = entry
+                self._account(key, entry, 1)
+            self._evict(now)
+            restored = len(self._entries)
+        if restored:
+            log("INFO", f"已恢复插件状态 {restored} 条")
+        return restored
+
+    def schedule_snapshot(self, scheduler):
+        """启用快照时注册定时任务（机器人 _setup_jobs 调用）"""
+        if self.snapshot_enabled:
+            scheduler.every(self.snapshot_interval, self.snapshot, name="state_snapshot")
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"entries": self._entries})
+
+    def stats(self):
+        with self._lock:
+            self._evict(time.time())
+            plugins = {p: {"entries": u[0], "bytes": u[1]} for p, u in self._plugins.items() if u[0]}
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+                    **self.counters, "plugins": plugins}
+
+
+class StateScope:
+    """某插件在某聊天（可选某发送者）下的状态视图"""
+    __slots__ = ("store", "plugin", "chat_name", "sender")
+
+    def __init__(self, store, plugin, chat_name, sender=""):
+        self.store = store
+        self.plugin = plugin
+        self.chat_name = chat_name
+        self.sender = sender
+
+    def _key(self, name):
+        return (self.plugin, self.chat_name, self.sender, name)
+
+    def get(self, name, default=None):
+        return self.store.get(self._key(name), default)
+
+    def set(self, name, value, ttl=None):
+        self.store.set(self._key(name), value, ttl)
+
+    def pop(self, name, default=None):
+        value = self.get(name, default)
+        self.store.delete(self._key(name))
+        return value
+
+    def delete(self, name):
+        return self.store.delete(self._key(name))
+
+    def clear(self):
+        """清除本视图下的全部记录"""
+        return self.store.clear(self.plugin, self.chat_name, self.sender)
+
+    @property
+    def chat(self):
+        """聊天级视图（同一聊天内所有发送者共享）"""
+        return StateScope(self.store, self.plugin, self.chat_name, "")
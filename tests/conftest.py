@@ -0,0 +1,28 @@
+# 测试直接导入仓库根目录下的模块；日志文件写到临时目录，不污染工作区
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger  # noqa: E402
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _log_to_tmp(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("logs"))
+    for sink in logger.sinks:
+        if isinstance(sink, logger.FileSink):
+            sink.path = path
+    yield
+
+
+def load_plugin(name):
+    """按文件加载 plugins/ 下的插件模块（与 PluginManager 一样不经过包导入）"""
+    import importlib.util
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", name + ".py")
+    spec = importlib.util.spec_from_file_location(f"test_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,95 @@
+# config_schema：字段校验与嵌套配置段
+import pytest
+
+import hang_watch
+import inbound
+import outbound
+import ratelimit
+import remote_plugins
+import state_store
+from config_schema import coerce_fields, merge_fields, validate_fields
+
+
+@pytest.mark.parametrize("key, defaults", [
+    ("rate_limit", ratelimit.DEFAULTS),
+    ("inbound", inbound.DEFAULTS),
+    ("reply_coalesce", outbound.COALESCE_DEFAULTS),
+    ("state_store", state_store.DEFAULTS),
+    ("watchdog", hang_watch.DEFAULTS),
+    ("remote_plugins", remote_plugins.DEFAULTS),
+])
+def test_module_defaults_pass_validation(key, defaults):
+    assert validate_fields({key: defaults}) == {key: defaults}
+
+
+def test_scalar_fields_are_converted():
+    out = validate_fields({"outbound_max_len": "300", "group_welcome_random": "0.5", "everyday_start_bot_time": "8:05"})
+    assert out["outbound_max_len"] == 300
+    assert out["group_welcome_random"] == 0.5
+
+
+@pytest.mark.parametrize("value, message", [
+    (True, "需要数字"),
+    ("abc", "需要数字"),
+    (float("inf"), "需要有限的数字"),
+    (float("nan"), "需要有限的数字"),
+    ("1e999", "需要有限的数字"),
+])
+def test_numbers_reject_bool_and_non_finite(value, message):
+    with pytest.raises(ValueError, match=message):
+        validate_fields({"outbound_max_len": value})
+    with pytest.raises(ValueError, match=message):
+        validate_fields({"group_welcome_random": value})
+
+
+def test_numbers_are_clamped_to_range():
+    assert validate_fields({"group_welcome_random": 5})["group_welcome_random"] == 1.0
+
+
+def test_nested_errors_name_the_path():
+    with pytest.raises(ValueError, match="rate_limit: sender: rate: 需要数字"):
+        validate_fields({"rate_limit": {"sender": {"rate": "abc"}}})
+    with pytest.raises(ValueError, match=r"shed_classes: \[0\]"):
+        validate_fields({"inbound": {"shed_classes": ["bogus"]}})
+    with pytest.raises(ValueError, match="plugins: weather_plugin: rate_limit: burst"):
+        validate_fields({"plugins": {"weather_plugin": {"rate_limit": {"rate": 1, "burst": "x"}}}})
+
+
+def test_worker_addresses_are_checked():
+    ok = ["127.0.0.1:9000", "tcp://host:9001", "unix:///tmp/w.sock"]
+    assert validate_fields({"remote_plugins": {"workers": ok}})["remote_plugins"]["workers"] == ok
+    with pytest.raises(ValueError, match="workers"):
+        validate_fields({"remote_plugins": {"workers": ["http://host"]}})
+
+
+def test_nested_undeclared_keys_and_nullable_are_kept():
+    out = validate_fields({"sim": {"seed": None, "extra": 1}})
+    assert out["sim"] == {"seed": None, "extra": 1}
+
+
+def test_errors_are_collected_across_fields():
+    with pytest.raises(ValueError) as e:
+        validate_fields({"outbound_max_len": "x", "reply_deadline": "y"})
+    assert "outbound_max_len" in str(e.value) and "reply_deadline" in str(e.value)
+
+
+def test_coerce_falls_back_to_current_then_default():
+    out = coerce_fields({"outbound_max_len": "x", "reply_deadline": "x", "custom": 1}, {"outbound_max_len": 500})
+    assert out == {"outbound_max_len": 500, "reply_deadline": 180, "custom": 1}
+
+
+def test_merge_keeps_unsent_nested_fields():
+    current = {"rate_limit": {"enabled": True, "sender": {"rate": 0.2, "burst": 5}, "chat": {"rate": 1, "burst": 20}},
+               "plugins": {"a_plugin": {"x": 1, "rate_limit": {"rate": 1, "burst": 2}}, "b_plugin": {"y": 2}},
+               "keyword_dict": {"旧": "回复"}}
+    merged = merge_fields({"rate_limit": {"enabled": False, "sender": {"burst": 3}},
+                           "plugins": {"a_plugin": {"x": 5}},
+                           "keyword_dict": {"新": "回复"}}, current)
+    assert merged["rate_limit"] == {"enabled": False, "sender": {"rate": 0.2, "burst": 3}, "chat": {"rate": 1, "burst": 20}}
+    assert merged["plugins"] == {"a_plugin": {"x": 5, "rate_limit": {"rate": 1, "burst": 2}}, "b_plugin": {"y": 2}}
+    assert merged["keyword_dict"] == {"新": "回复"}  # 非 dict 类型整体替换
+    assert current["rate_limit"]["enabled"] is True  # 不修改当前配置
+
+
+def test_merge_of_new_section_is_the_update():
+    assert merge_fields({"watchdog": {"enabled": True}}, {}) == {"watchdog": {"enabled": True}}
@@ -0,0 +1,131 @@
+# context：截止时间、子上下文、取消回调、可打断的 sleep 与 HTTP 请求
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from context import CancelToken, Cancelled, Context, DeadlineExceeded
+
+
+def test_deadline_and_remaining():
+    assert Context().remaining() is None
+    assert Context().timeout(3) == 3
+    ctx = Context.with_timeout(0.2)
+    assert 0 < ctx.remaining() <= 0.2
+    assert ctx.timeout(10) <= 0.2
+    assert ctx.timeout(0.05) == 0.05
+    assert not ctx.done
+    time.sleep(0.25)
+    assert ctx.expired and ctx.done and not ctx.cancelled
+    with pytest.raises(DeadlineExceeded):
+        ctx.check()
+
+
+def test_child_takes_the_earlier_deadline_and_follows_parent():
+    parent = Context.with_timeout(10)
+    assert parent.child().deadline == parent.deadline
+    assert parent.child(1).deadline < parent.deadline
+    assert parent.child(100).deadline == parent.deadline
+    assert Context().child(1).remaining() <= 1
+
+    child = parent.child()
+    grandchild = child.child()
+    child.cancel("子任务结束")
+    assert grandchild.cancelled and not parent.cancelled
+    other = parent.child()
+    parent.cancel("机器人已停止")
+    assert other.cancelled and other.token.reason == "机器人已停止"
+    # 父上下文取消后派生的子上下文一出生即取消
+    late = parent.child()
+    assert late.cancelled
+    with pytest.raises(Cancelled):
+        late.check()
+
+
+def test_cancel_callbacks():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("a"))
+    handle = token.on_cancel(lambda: calls.append("removed"))
+    token.on_cancel(lambda: 1 / 0)  # 回调异常不影响其他回调
+    token.on_cancel(lambda: calls.append("b"))
+    token.remove_callback(handle)
+    token.cancel("stop")
+    token.cancel("again")  # 重复取消无效
+    assert calls == ["a", "b"]
+    assert token.reason == "stop"
+    # 已取消时注册立即调用，返回 None
+    assert token.on_cancel(lambda: calls.append("late")) is None
+    assert calls == ["a", "b", "late"]
+
+
+def test_sleep_is_interrupted_by_cancel():
+    ctx = Context()
+    threading.Timer(0.1, ctx.cancel, args=("stop",)).start()
+    t0 = time.time()
+    with pytest.raises(Cancelled) as e:
+        ctx.sleep(5)
+    assert time.time() - t0 < 1
+    assert not isinstance(e.value, DeadlineExceeded)
+
+
+def test_sleep_stops_at_the_deadline():
+    ctx = Context.with_timeout(0.1)
+    t0 = time.time()
+    with pytest.raises(DeadlineExceeded):
+        ctx.sleep(5)
+    assert time.time() - t0 < 1
+    Context.with_timeout(5).sleep(0.01)  # 时间充足时正常返回
+
+
+@pytest.fixture
+def server():
+    """/slow 在收到 release 前不响应，其余路径立即返回 ok"""
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/slow":
+                release.wait(10)
+            body = b"ok"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_request_is_interrupted_by_cancel(server):
+    pytest.importorskip("requests")
+    ctx = Context.with_timeout(10)
+    assert ctx.get(server + "/fast").text == "ok"
+    assert not ctx.token._callbacks  # 请求结束后移除取消回调
+
+    threading.Timer(0.2, ctx.cancel, args=("机器人已停止",)).start()
+    t0 = time.time()
+    with pytest.raises(Cancelled) as e:
+        ctx.get(server + "/slow")
+    assert time.time() - t0 < 2
+    assert str(e.value) == "机器人已停止"
+
+
+def test_request_timeout_is_capped_by_deadline(server):
+    pytest.importorskip("requests")
+    ctx = Context.with_timeout(0.3)
+    t0 = time.time()
+    with pytest.raises(DeadlineExceeded):
+        ctx.get(server + "/slow", timeout=10)
+    assert time.time() - t0 < 2
+    with pytest.raises(DeadlineExceeded):
+        ctx.get(server + "/fast")  # 已超时不再发起请求
@@ -0,0 +1,51 @@
+# 入群欢迎：窗口期内入群的新成员合并为一条 @ 消息
+import time
+from types import SimpleNamespace
+
+from wxbot_class_only_V2 import GroupWelcomer
+
+
+class FakeChat:
+    def __init__(self):
+        self.sent = []
+
+    def SendMsg(self, msg, at=None):
+        self.sent.append((msg, at))
+
+
+def make_welcomer(window=0.2, scheduler=None):
+    config = SimpleNamespace(group_welcome_window=window, group_welcome_random=1.0, group_welcome_msg="欢迎")
+    return GroupWelcomer(SimpleNamespace(scheduler=scheduler, config=config))
+
+
+def test_joins_within_window_are_batched_without_scheduler():
+    welcomer = make_welcomer()
+    chat = FakeChat()
+    welcomer.add("群", chat, ["张三"])
+    welcomer.add("群", chat, ["李四", "张三"])
+    assert chat.sent == []  # 不在回调里立即发送
+    deadline = time.time() + 3
+    while not chat.sent and time.time() < deadline:
+        time.sleep(0.02)
+    time.sleep(0.1)
+    assert chat.sent == [("欢迎", ["张三", "李四"])]
+    assert welcomer.batches == 1 and welcomer.joiners == 2
+
+
+def test_clear_cancels_pending_timer():
+    welcomer = make_welcomer(window=0.1)
+    chat = FakeChat()
+    welcomer.add("群", chat, ["张三"])
+    timer = welcomer._pending["群"]["job"]
+    welcomer.clear()
+    timer.join(1)
+    assert chat.sent == [] and welcomer.batches == 0
+
+
+def test_large_batch_is_split_by_at_limit():
+    welcomer = make_welcomer(window=0)
+    chat = FakeChat()
+    names = [f"成员{i}" for i in range(GroupWelcomer.MAX_AT_PER_MSG + 5)]
+    welcomer._pending["群"] = {"chat": chat, "names": names, "job": None}
+    welcomer.flush("群")
+    assert [len(at) for _, at in chat.sent] == [GroupWelcomer.MAX_AT_PER_MSG, 5]
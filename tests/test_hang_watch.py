@@ -0,0 +1,169 @@
+# hang_watch：心跳登记、卡死判定（伪造时钟）、调用栈转储与监听重启
+import json
+import threading
+import time
+
+import pytest
+
+import hang_watch
+from hang_watch import Watchdog, dump_stacks
+
+
+class Recorder:
+    def __init__(self):
+        self.records = []
+
+    def _add(self, level, msg, *args):
+        self.records.append((level, msg % args if args else msg))
+
+    def error(self, msg, *args):
+        self._add("ERROR", msg, *args)
+
+    def warning(self, msg, *args):
+        self._add("WARNING", msg, *args)
+
+    def messages(self, level):
+        return [m for lv, m in self.records if lv == level]
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    rec = Recorder()
+    monkeypatch.setattr(hang_watch, "_log", rec)
+    return rec
+
+
+def busy(watchdog, component, detail=""):
+    """在后台线程中进入 track，返回 (线程, 结束事件)"""
+    entered, release = threading.Event(), threading.Event()
+
+    def work():
+        with watchdog.track(component, detail):
+            watchdog.note(f"{detail} 第二步")
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=work, name=f"busy-{component}")
+    t.start()
+    entered.wait(5)
+    return t, release
+
+
+def test_track_records_completion_and_restores_outer_beat():
+    wd = Watchdog()
+    wd.note("不在 track 中，忽略")
+    with wd.track("inbound", "外层") as outer:
+        with wd.track("scheduler", "内层"):
+            wd.note("内层详情")
+        assert wd._active[threading.get_ident()] is outer
+        wd.note("外层详情")
+        assert outer.detail == "外层详情"
+    assert not wd._active
+    comps = wd.stats()["components"]
+    assert comps["inbound"]["completed"] == 1 and comps["scheduler"]["completed"] == 1
+    assert comps["inbound"]["busy"] == 0
+
+
+def test_check_flags_only_long_running_work(recorder):
+    wd = Watchdog({"threshold": 10, "thresholds": {"outbound": 30}, "dump_stacks": False})
+    t1, r1 = busy(wd, "inbound", "插件 search.handle")
+    t2, r2 = busy(wd, "outbound", "发送")
+    try:
+        assert wd.check() == []
+        now = time.time()
+        fresh = wd.check(now + 11)
+        assert [b.component for b in fresh] == ["inbound"]
+        assert fresh[0].detail == "插件 search.handle 第二步"
+        assert wd.check(now + 12) == []  # 已判定的不重复报告
+        assert [b.component for b in wd.check(now + 31)] == ["outbound"]
+        assert {s["component"] for s in wd.stuck()} == {"inbound", "outbound"}
+        assert wd.stats()["stuck"] == 2
+    finally:
+        r1.set()
+        r2.set()
+        t1.join()
+        t2.join()
+    assert wd.stuck() == []
+    assert wd.counters["recovered"] == 2
+    assert [e["event"] for e in wd.events] == ["stuck", "stuck", "recovered", "recovered"]
+    assert any("inbound 已恢复" in m for m in recorder.messages("WARNING"))
+
+
+def test_stack_dump_with_cooldown(recorder):
+    wd = Watchdog({"threshold": 1, "dump_cooldown": 100})
+    t1, r1 = busy(wd, "callback", "消息回调")
+    try:
+        now = time.time()
+        wd.check(now + 2)
+        dumps = [m for m in recorder.messages("ERROR") if m.startswith("全部线程调用栈")]
+        assert len(dumps) == 1
+        assert "--- 线程 busy-callback [卡死] ---" in dumps[0]
+        assert "release.wait(5)" in dumps[0]
+        # 冷却期内新的卡死不再转储
+        t2, r2 = busy(wd, "inbound")
+        try:
+            assert len(wd.check(now + 50)) == 1
+        finally:
+            r2.set()
+            t2.join()
+        assert wd.counters["dumps"] == 1
+    finally:
+        r1.set()
+        t1.join()
+
+
+def test_dump_stacks_lists_all_threads():
+    text = dump_stacks()
+    assert f"--- 线程 {threading.current_thread().name} ---" in text
+    assert "test_dump_stacks_lists_all_threads" in text
+
+
+def test_on_stuck_errors_are_logged(recorder):
+    def boom(component, detail):
+        raise RuntimeError("回调失败")
+
+    wd = Watchdog({"threshold": 1, "dump_stacks": False}, on_stuck=boom)
+    t, r = busy(wd, "callback")
+    try:
+        assert len(wd.check(time.time() + 2)) == 1
+    finally:
+        r.set()
+        t.join()
+    assert any("回调失败" in m for m in recorder.messages("ERROR"))
+
+
+def test_stuck_callback_restarts_listener(tmp_path, recorder):
+    from wxbot_class_only_V2 import WXBot
+
+    config = {"backend": "sim", "admin": "管理员", "sim": {"latency": 0, "jitter": 0, "failure_rate": 0},
+              "watchdog": {"restart_listener": True, "threshold": 1, "dump_stacks": False}}
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    bot = WXBot(str(path), str(tmp_path / "plugins"))
+    try:
+        assert bot.init_wechat()
+        wx = bot.wx
+        assert wx._listen_gen == 1 and "管理员" in bot.listen_windows
+        wx._listeners.pop("管理员")  # 模拟卡住的监听
+        # 非监听回调的组件卡死不触发重启
+        t, r = busy(bot.watchdog, "inbound")
+        try:
+            assert len(bot.watchdog.check(time.time() + 2)) == 1
+            time.sleep(0.2)
+            assert wx._listen_gen == 1
+        finally:
+            r.set()
+            t.join()
+        t, r = busy(bot.watchdog, "callback", "消息回调")
+        try:
+            assert len(bot.watchdog.check(time.time() + 2)) == 1
+            deadline = time.time() + 5
+            while "管理员" not in wx._listeners and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            r.set()
+            t.join()
+        assert wx._listen_gen == 2
+        assert "管理员" in wx._listeners and "管理员" in bot.listen_windows
+    finally:
+        bot.stop()
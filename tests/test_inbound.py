@@ -0,0 +1,74 @@
+# inbound：加权轮询、积压丢弃、批量处理与启停
+import threading
+import time
+
+from inbound import InboundScheduler
+
+
+def wait_for(cond, timeout=2.0):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_weighted_round_robin_order():
+    seen = []
+    s = InboundScheduler(seen.append, {"weights": {"admin": 2, "group": 1}})
+    for i in range(4):
+        s.submit("group", f"g{i}")
+        s.submit("admin", f"a{i}")
+    s.start()
+    assert wait_for(lambda: len(seen) == 8)
+    s.stop()
+    assert seen[:6] == ["a0", "g0", "a1", "a2", "g1", "a3"]
+
+
+def test_unknown_class_falls_back_to_group():
+    s = InboundScheduler(lambda item: None)
+    s.submit("bogus", 1)
+    assert s.stats()["classes"]["group"]["backlog"] == 1
+
+
+def test_stale_low_priority_messages_are_shed():
+    s = InboundScheduler(lambda item: None, {"max_backlog": 2, "stale_seconds": 0})
+    s.submit("admin", "a")
+    s.submit("group", "g1")
+    time.sleep(0.01)
+    s.submit("group", "g2")
+    st = s.stats()["classes"]
+    assert st["admin"]["backlog"] == 1
+    assert st["group"]["shed"] >= 1
+
+
+def test_batches_are_handed_to_batch_handler():
+    batches = []
+    s = InboundScheduler(lambda item: batches.append([item]), {"batch_size": 3}, batch_handler=batches.append)
+    for i in range(5):
+        s.submit("group", i)
+    s.start()
+    assert wait_for(lambda: sum(len(b) for b in batches) == 5)
+    s.stop()
+    assert batches[0] == [0, 1, 2]
+
+
+def test_start_right_after_stop_resumes_busy_worker():
+    release = threading.Event()
+    seen = []
+
+    def handler(item):
+        if item == "slow":
+            release.wait(2)
+        seen.append(item)
+
+    s = InboundScheduler(handler, name="inbound-resume")
+    s.start()
+    s.submit("private", "slow")
+    time.sleep(0.05)
+    s.stop(drop=False)
+    s.start()   # 旧线程仍在处理 slow，应继续工作而不是再启动一个线程
+    s.submit("private", "next")
+    release.set()
+    assert wait_for(lambda: seen == ["slow", "next"])
+    assert [t.name for t in threading.enumerate()].count("inbound-resume") == 1
+    s.stop()
@@ -0,0 +1,102 @@
+# keyword_engine：匹配模式、多关键词命中时的选择与后台重建
+import threading
+import time
+
+from keyword_engine import Automaton, KeywordReplyEngine, parse_keyword
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return cond()
+
+
+def test_parse_keyword():
+    assert parse_keyword("=你好") == ("你好", "exact")
+    assert parse_keyword("^Help ") == ("help", "prefix")
+    assert parse_keyword("天气") == ("天气", "contains")
+    assert parse_keyword("天气", "prefix") == ("天气", "prefix")
+    assert parse_keyword("=") == ("=", "contains")  # 只有前缀符号时按字面处理
+
+
+def test_exact_match():
+    a = Automaton({"=你好": "你好呀"})
+    assert a.match("你好") == ("exact", 2, "你好呀")
+    assert a.match("  你好 ") == ("exact", 2, "你好呀")
+    assert a.match("你好啊") is None
+    assert a.match("说你好") is None
+
+
+def test_prefix_match():
+    a = Automaton({"^菜单": "功能列表"})
+    assert a.match("菜单") == ("prefix", 2, "功能列表")
+    assert a.match("菜单怎么用") == ("prefix", 2, "功能列表")
+    assert a.match("看看菜单") is None
+
+
+def test_contains_match_is_case_insensitive():
+    a = Automaton({"Python": "人生苦短"})
+    assert a.match("我在学 PYTHON 呢") == ("contains", 6, "人生苦短")
+    assert a.match("pyth") is None
+    assert a.match("") is None
+
+
+def test_longest_keyword_wins():
+    a = Automaton({"天气": "通用天气", "北京天气": "北京天气预报"})
+    assert a.match("北京天气怎么样")[2] == "北京天气预报"
+    assert a.match("上海天气怎么样")[2] == "通用天气"
+    # 较短的关键词是较长关键词的后缀/中间部分（依赖失败指针合并输出）
+    a = Automaton({"京天": "短", "北京天气预报": "长"})
+    assert a.match("北京天气预报一下")[2] == "长"
+    assert a.match("北京天晴")[2] == "短"
+
+
+def test_leftmost_keyword_wins_on_equal_length():
+    a = Automaton({"电影": "电影资源", "音乐": "音乐资源"})
+    assert a.match("想看电影和听音乐")[2] == "电影资源"
+    assert a.match("想听音乐和看电影")[2] == "音乐资源"
+
+
+def test_mode_priority_over_length():
+    a = Automaton({"=帮助": "精确", "^帮": "前缀", "帮助文档": "包含"})
+    assert a.match("帮助")[2] == "精确"
+    assert a.match("帮助文档在哪")[2] == "前缀"  # prefix 优先于更长的 contains
+    assert a.match("哪里有帮助文档")[2] == "包含"
+
+
+def test_default_mode_and_empty_replies():
+    a = Automaton({"你好": "hi", "空": "", "无": None}, default_mode="exact")
+    assert a.match("你好") == ("exact", 2, "hi")
+    assert a.match("你好啊") is None
+    assert a.size == 1
+    assert Automaton({"你好": "hi"}, default_mode="unknown").match("说你好")[0] == "contains"
+
+
+def test_rebuild_async_swaps_atomically_and_keeps_latest():
+    engine = KeywordReplyEngine({"旧": "旧回复"})
+    big = {f"关键词{i}": f"回复{i}" for i in range(20000)}
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        # 重建期间查询始终得到旧或新自动机的完整结果
+        while not stop.is_set():
+            res = engine.match("旧")
+            if res not in ("旧回复", None):
+                errors.append(res)
+
+    t = threading.Thread(target=reader)
+    t.start()
+    engine.rebuild_async(big)
+    engine.rebuild_async({**big, "新": "新回复"})
+    engine.rebuild_async({"新": "最新回复"})  # 构建期间的多次请求只保留最后一次
+    assert wait_for(lambda: engine.match("新") == "最新回复")
+    assert wait_for(lambda: engine._pending is None)
+    stop.set()
+    t.join()
+    assert not errors
+    assert engine.match("旧") is None
+    assert engine.stats()["keywords"] == 1
@@ -0,0 +1,111 @@
+# log_index：增量索引、追读新增内容与搜索过滤/分页
+from datetime import datetime
+
+from log_index import LogIndex, tokenize
+
+DAY1 = [
+    "[2025-01-01 09:00:00] [INFO] [wxbot] 插件 search_plugin 加载完成",
+    "[2025-01-01 09:05:00] [ERROR] [plugins.search_plugin] 搜索接口超时",
+    "Traceback (most recent call last):",
+    "  TimeoutError: read timed out",
+    "[2025-01-01 10:00:00] [WARNING] [weather_plugin] 天气接口限流",
+]
+DAY2 = [
+    "2025/01/02 08:00:00 [INFO] 机器人启动",
+    "[2025-01-02 12:00:00] [ERROR] [weather_plugin] 天气接口超时",
+]
+
+
+def write(path, lines, mode="w", newline="\n"):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        f.write("".join(line + newline for line in lines))
+
+
+def make_index(tmp_path):
+    write(tmp_path / "log_250101.txt", DAY1, newline="\r\n")
+    write(tmp_path / "log_250102.txt", DAY2)
+    (tmp_path / "other.txt").write_text("[2025-01-01 09:00:00] [INFO] 不是日志文件\n", encoding="utf-8")
+    return LogIndex(str(tmp_path))
+
+
+def test_tokenize():
+    assert tokenize("Search 超时了") == {"search", "超", "时", "了", "超时", "时了"}
+
+
+def test_refresh_is_incremental(tmp_path):
+    index = make_index(tmp_path)
+    assert index.refresh() == 5
+    stats = index.stats()
+    assert stats["files"] == 2 and stats["entries"] == 5
+    assert set(stats["plugins"]) == {"search_plugin", "weather_plugin"}
+    indexed = stats["indexed_bytes"]
+    assert indexed == sum(p.stat().st_size for p in tmp_path.glob("log_*.txt"))
+    assert index.refresh() == 0  # 没有新增内容时不重新读取
+    assert index.stats()["indexed_bytes"] == indexed
+
+
+def test_tail_appended_lines_and_partial_line(tmp_path):
+    index = make_index(tmp_path)
+    index.refresh()
+    path = tmp_path / "log_250102.txt"
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write("[2025-01-02 13:00:00] [INFO] 新增的一行\n[2025-01-02 13:01:00] [INFO] 写了一半")
+    assert index.refresh() == 1  # 半行等写完再索引
+    assert index.search("新增")["total"] == 1
+    assert index.search("一半")["total"] == 0
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write("的一行\n")
+    assert index.refresh() == 1
+    assert index.search("一半")["items"][0]["message"].endswith("写了一半的一行")
+    # 新文件
+    write(tmp_path / "log_250103.txt", ["[2025-01-03 00:00:00] [INFO] 第三天"])
+    assert index.search("第三天")["items"][0]["file"] == "log_250103.txt"
+
+
+def test_truncated_file_rebuilds_index(tmp_path):
+    index = make_index(tmp_path)
+    index.refresh()
+    write(tmp_path / "log_250101.txt", ["[2025-01-01 11:00:00] [INFO] 重写后的文件"])
+    result = index.search()
+    assert result["total"] == 3
+    assert index.search("超时")["items"][0]["file"] == "log_250102.txt"
+
+
+def test_search_text_and_continuation_lines(tmp_path):
+    index = make_index(tmp_path)
+    result = index.search("超时")
+    assert result["total"] == 2
+    # 结果按时间倒序，CRLF 行尾被去掉，续行（traceback）并入上一条
+    first, second = result["items"]
+    assert first["message"] == "[2025-01-02 12:00:00] [ERROR] [weather_plugin] 天气接口超时"
+    assert second["message"].startswith("[2025-01-01 09:05:00] [ERROR]")
+    assert second["message"].endswith("TimeoutError: read timed out")
+    assert "\r" not in second["message"]
+    assert index.search("TimeoutError")["total"] == 1
+    assert index.search("不存在的词")["total"] == 0
+
+
+def test_search_filters(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search(level="error")["total"] == 2
+    assert index.search(level="ERROR, warning")["total"] == 3
+    assert index.search(level="DEBUG")["total"] == 0
+    assert index.search(plugin="weather_plugin")["total"] == 2
+    assert index.search(plugin="nope")["total"] == 0
+    assert index.search("超时", plugin="search_plugin")["items"][0]["plugin"] == "search_plugin"
+    day2 = index.search(start=datetime(2025, 1, 2))
+    assert day2["total"] == 2 and {i["file"] for i in day2["items"]} == {"log_250102.txt"}
+    morning = index.search(start=datetime(2025, 1, 1, 9, 1), end=datetime(2025, 1, 1, 10))
+    assert [i["level"] for i in morning["items"]] == ["WARNING", "ERROR"]
+    assert index.search(end=int(datetime(2025, 1, 1, 9).timestamp()))["total"] == 1
+    assert index.search("接口", level="ERROR", plugin="weather_plugin", start=datetime(2025, 1, 2))["total"] == 1
+
+
+def test_search_paging(tmp_path):
+    index = make_index(tmp_path)
+    pages = [index.search(page=p, page_size=2) for p in (1, 2, 3, 4)]
+    assert [p["total"] for p in pages] == [5] * 4
+    assert [len(p["items"]) for p in pages] == [2, 2, 1, 0]
+    times = [i["time"] for p in pages for i in p["items"]]
+    assert times == sorted(times, reverse=True)
+    assert index.search(page=0, page_size=10000)["page_size"] == 500
@@ -0,0 +1,109 @@
+# onboarding：接待步骤的持久化与恢复、客户端未就绪时的退避
+import time
+from types import SimpleNamespace
+
+import onboarding
+from onboarding import OnboardingQueue
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = []
+
+    def after(self, delay, func, *args, name=None, **kwargs):
+        job = SimpleNamespace(delay=delay, func=func, name=name, cancelled=False)
+        self.jobs.append(job)
+        return job
+
+    def cancel(self, job):
+        job.cancelled = True
+
+    def pending(self):
+        return [j for j in self.jobs if not j.cancelled]
+
+
+class FakeWX:
+    def __init__(self, friends=()):
+        self.friends = [SimpleNamespace(name=n, accept=lambda remark=None, n=n: self.calls.append(("accept", n, remark)))
+                        for n in friends]
+        self.calls = []
+
+    def GetNewFriends(self, acceptable=True):
+        friends, self.friends = self.friends, []
+        return friends
+
+    def SendMsg(self, msg, who=None):
+        self.calls.append(("text", who, msg))
+
+    def SendFiles(self, filepath, who=None):
+        self.calls.append(("file", who, filepath))
+
+    def SwitchToChat(self):
+        self.calls.append(("switch_chat",))
+
+    def SwitchToContact(self):
+        self.calls.append(("switch_contact",))
+
+
+def make_bot(wx=None):
+    config = SimpleNamespace(new_friend_switch=True, new_friend_msg=["你好", "欢迎"])
+    return SimpleNamespace(wx=wx, config=config, scheduler=FakeScheduler())
+
+
+def test_pump_backs_off_while_client_is_offline(tmp_path):
+    bot = make_bot()
+    queue = OnboardingQueue(bot, str(tmp_path / "q.json"))
+    with queue._lock:
+        queue._push("张三", "text", "你好", time.time() - 1)
+    queue.pump()
+    jobs = bot.scheduler.pending()
+    assert len(jobs) == 1 and jobs[0].delay >= onboarding.OFFLINE_RETRY - 0.5
+    # 客户端就绪后按时执行
+    bot.wx = FakeWX()
+    jobs[0].func()
+    assert bot.wx.calls == [("text", "张三", "你好")]
+    assert queue.stats()["backlog"] == 0
+
+
+def test_steps_persist_and_resume_after_restart(tmp_path, monkeypatch):
+    path = str(tmp_path / "q.json")
+    monkeypatch.setattr(onboarding, "ACCEPT_DELAY", 3600)  # 欢迎步骤在「重启」前都不会到期
+    monkeypatch.setattr(onboarding, "SEND_GAP", (0, 0))
+    monkeypatch.setattr(onboarding, "SWITCH_GAP", 0)
+    bot = make_bot(FakeWX(["张三"]))
+    queue = OnboardingQueue(bot, path)
+    queue.poll()
+    # accept 步骤依赖申请对象，不会被恢复（重启后由 poll 重新发现）
+    assert queue.stats()["backlog"] == 1
+    assert OnboardingQueue(make_bot(), path).stats()["backlog"] == 0
+
+    queue.pump()
+    assert bot.wx.calls == [("accept", "张三", "张三_机器人备注")]
+    assert queue.stats()["backlog"] == 4
+
+    bot2 = make_bot(FakeWX())
+    restored = OnboardingQueue(bot2, path)
+    assert [s["kind"] for s in restored._steps] == ["text", "text", "switch_chat", "switch_contact"]
+    assert restored._seq == max(s["id"] for s in queue._steps)
+    with restored._lock:
+        for s in restored._steps:
+            s["due"] = time.time() - 1
+    restored.pump()
+    assert bot2.wx.calls == [("text", "张三_机器人备注", "你好"), ("text", "张三_机器人备注", "欢迎"),
+                             ("switch_chat",), ("switch_contact",)]
+    assert OnboardingQueue(make_bot(), path).stats()["backlog"] == 0  # 完成的步骤已从文件移除
+
+
+def test_failed_step_is_retried_and_persisted(tmp_path):
+    path = str(tmp_path / "q.json")
+    wx = FakeWX()
+    wx.SendMsg = lambda msg, who=None: 1 / 0
+    bot = make_bot(wx)
+    queue = OnboardingQueue(bot, path)
+    with queue._lock:
+        queue._push("张三", "text", "你好", time.time() - 1)
+    queue.pump()
+    restored = OnboardingQueue(make_bot(), path)
+    assert [(s["kind"], s["attempts"]) for s in restored._steps] == [("text", 1)]
+    assert restored._steps[0]["due"] > time.time() + onboarding.RETRY_DELAY - 5
+    assert queue.counters["retried"] == 1
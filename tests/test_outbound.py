@@ -0,0 +1,115 @@
+# outbound：长消息切分与回复合并
+import threading
+import time
+
+import pytest
+
+import outbound
+from context import Context
+from outbound import OutboundSender, split_message
+
+
+class FakeChat:
+    def __init__(self, who):
+        self.who = who
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def SendMsg(self, msg, at=None):
+        with self._lock:
+            self.sent.append((msg, at))
+
+
+def wait_sent(chat, count, timeout=3.0):
+    end = time.time() + timeout
+    while len(chat.sent) < count and time.time() < end:
+        time.sleep(0.01)
+    return chat.sent
+
+
+@pytest.fixture
+def sender():
+    s = OutboundSender()
+    s.configure_coalesce({"enabled": True, "window": 60, "hold": 0.2})
+    return s
+
+
+def test_split_keeps_short_text_whole():
+    assert split_message("  你好  ", limit=50) == ["你好"]
+    assert split_message("", limit=50) == []
+
+
+def test_split_prefers_blank_line_boundaries():
+    items = ["第%d条：" % i + "x" * 20 for i in range(6)]
+    parts = split_message("\n\n".join(items), limit=60)
+    assert all(len(p) <= 60 for p in parts)
+    assert "\n\n".join(parts) == "\n\n".join(items)
+
+
+def test_split_does_not_cut_urls():
+    url = "https://example.com/" + "a" * 30
+    parts = split_message("y" * 40 + url, limit=60)
+    assert url in parts
+
+
+def test_same_key_within_hold_is_sent_once_with_all_mentions(sender):
+    chat = FakeChat("群A")
+    assert sender.send(chat, "北京 晴", at="甲", coalesce="weather:北京") == 1
+    assert sender.send(chat, "北京 晴", at="乙", coalesce="weather:北京") == 0
+    assert wait_sent(chat, 1) == [("北京 晴", ["甲", "乙"])]
+    time.sleep(0.3)
+    assert len(chat.sent) == 1
+    assert sender.stats()["coalesced"] == 1
+
+
+def test_sends_without_key_are_not_held_or_merged(sender):
+    chat = FakeChat("群A")
+    t0 = time.time()
+    sender.send(chat, "同样的文本", at="甲")
+    sender.send(chat, "同样的文本", at="乙")
+    wait_sent(chat, 1)
+    assert time.time() - t0 < 0.15
+    assert wait_sent(chat, 2) == [("同样的文本", "甲"), ("同样的文本", "乙")]
+
+
+def test_late_requester_gets_reference_and_transient_is_dropped(sender):
+    chat = FakeChat("群A")
+    sender.send(chat, "查询中…", at="甲", coalesce="prompt", transient=True)
+    sender.send(chat, "北京 晴", at="甲", coalesce="weather:北京")
+    wait_sent(chat, 2)
+    assert sender.send(chat, "查询中…", at="乙", coalesce="prompt", transient=True) == 0
+    assert sender.send(chat, "北京 晴", at="乙", coalesce="weather:北京") == 1
+    assert sender.send(chat, "北京 晴", at="丙", coalesce="weather:北京") == 0
+    sent = wait_sent(chat, 3)
+    assert sent[2] == (sender.coalesce_ref_text, ["乙", "丙"])
+    time.sleep(0.4)
+    assert len(chat.sent) == 3
+
+
+def test_different_chats_are_not_merged(sender):
+    a, b = FakeChat("群A"), FakeChat("群B")
+    sender.send(a, "北京 晴", at="甲", coalesce="weather:北京")
+    sender.send(b, "北京 晴", at="乙", coalesce="weather:北京")
+    assert wait_sent(a, 1) == [("北京 晴", "甲")]
+    assert wait_sent(b, 1) == [("北京 晴", "乙")]
+
+
+def test_disabled_coalescing_sends_every_reply(sender):
+    sender.configure_coalesce({"enabled": False})
+    chat = FakeChat("群A")
+    sender.send(chat, "北京 晴", at="甲", coalesce="weather:北京")
+    sender.send(chat, "北京 晴", at="乙", coalesce="weather:北京")
+    assert len(wait_sent(chat, 2)) == 2
+
+
+def test_cancelled_context_is_dropped(sender):
+    chat = FakeChat("群A")
+    ctx = Context()
+    ctx.cancel()
+    assert sender.send(chat, "晚到的回复", ctx=ctx) == 0
+    assert sender.stats()["dropped"] == 1
+
+
+def test_module_defaults_keep_coalescing_off():
+    assert outbound.COALESCE_DEFAULTS["enabled"] is False
+    assert OutboundSender().coalesce_enabled is False
@@ -0,0 +1,77 @@
+# ratelimit：令牌桶与三级消息限流
+import time
+
+from ratelimit import KeyedRateLimiter, MessageRateLimiter
+
+
+def test_bucket_allows_burst_then_refills():
+    lim = KeyedRateLimiter(rate=20, burst=2)
+    assert lim.allow("a") and lim.allow("a")
+    assert not lim.allow("a")
+    time.sleep(0.06)
+    assert lim.allow("a")
+    assert lim.stats()["throttled"] == 1
+
+
+def test_zero_rate_means_unlimited():
+    lim = KeyedRateLimiter(rate=0, burst=1)
+    assert all(lim.allow("a") for _ in range(100))
+
+
+def test_keys_are_bounded():
+    lim = KeyedRateLimiter(rate=1, burst=1, max_keys=3)
+    for i in range(10):
+        lim.allow(i)
+    assert lim.stats()["keys"] == 3
+    assert lim.stats()["evicted"] == 7
+
+
+def test_refund_returns_token():
+    lim = KeyedRateLimiter(rate=0.001, burst=1)
+    assert lim.allow("a")
+    lim.refund("a")
+    assert lim.allow("a")
+    assert lim.stats()["allowed"] == 1
+
+
+def test_throttled_sender_does_not_drain_chat_bucket():
+    lim = MessageRateLimiter({"sender": {"rate": 0.001, "burst": 1}, "chat": {"rate": 0.001, "burst": 3}})
+    assert lim.allow_message("群", "刷屏者") == (True, None)
+    for _ in range(10):
+        assert lim.allow_message("群", "刷屏者") == (False, "sender")
+    assert lim.allow_message("群", "甲") == (True, None)
+    assert lim.allow_message("群", "乙") == (True, None)
+
+
+def test_chat_reject_refunds_sender():
+    lim = MessageRateLimiter({"sender": {"rate": 0.001, "burst": 1}, "chat": {"rate": 0.001, "burst": 1}})
+    assert lim.allow_message("群", "甲") == (True, None)
+    assert lim.allow_message("群", "乙") == (False, "chat")
+    # 乙的令牌已退回：聊天恢复额度后乙无需等待自己的桶回填
+    lim.chat.refund("群")
+    assert lim.allow_message("群", "乙") == (True, None)
+
+
+def test_plugin_override_and_disable():
+    lim = MessageRateLimiter({"plugin_default": {"rate": 0.001, "burst": 1},
+                              "plugins": {"fast": {"rate": 100, "burst": 50}}})
+    assert lim.allow_plugin("slow") and not lim.allow_plugin("slow")
+    assert all(lim.allow_plugin("fast") for _ in range(20))
+    lim.configure({"enabled": False})
+    assert lim.allow_plugin("slow")
+    assert lim.allow_message("群", "甲") == (True, None)
+
+
+def test_reconfigure_with_same_config_keeps_state():
+    cfg = {"sender": {"rate": 0.001, "burst": 1}}
+    lim = MessageRateLimiter(cfg)
+    lim.allow_message("群", "甲")
+    lim.configure(dict(cfg))
+    assert lim.allow_message("群", "甲") == (False, "sender")
+
+
+def test_notify_once_per_interval():
+    lim = MessageRateLimiter({"notify_interval": 60})
+    assert lim.should_notify("群", "甲")
+    assert not lim.should_notify("群", "甲")
+    assert lim.should_notify("群", "乙")
@@ -0,0 +1,220 @@
+# remote_plugins：本机 Unix 套接字上的工作进程（子进程）与主程序侧连接池
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from context import Context
+from remote_plugins import (CANCEL, ERROR, HELLO, PROTOCOL_VERSION, RUN, RemotePluginPool, encode_frame,
+                            recv_frame)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ECHO_PLUGIN = '''
+import threading
+import time
+from context import Cancelled
+
+PLUGIN_NAME = "echo"
+
+def check(msg, chat, chat_info):
+    return msg.content.startswith("echo "), msg.content[5:]
+
+def handle(msg, chat, chat_info, data):
+    ctx = chat_info["ctx"]
+    if data == "thread":
+        def work():
+            time.sleep(0.4)
+            chat.SendMsg("来自线程")
+        threading.Thread(target=work).start()
+        chat.SendMsg("已开始")
+    elif data.startswith("sleep:"):
+        _, seconds, marker = data.split(":", 2)
+        try:
+            ctx.sleep(float(seconds))
+            chat.SendMsg("睡醒了")
+        except Cancelled:
+            open(marker, "w").write("cancelled")
+    else:
+        chat.SendMsg(data)
+    return True
+'''
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="需要 Unix 套接字")
+
+
+class FakeChat:
+    def __init__(self, who):
+        self.who = who
+        self.sent = []
+
+    def SendMsg(self, msg, at=None):
+        self.sent.append(msg)
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.02)
+    return cond()
+
+
+@pytest.fixture
+def start_worker(tmp_path):
+    plugins = tmp_path / "plugins"
+    plugins.mkdir()
+    (plugins / "echo_plugin.py").write_text(ECHO_PLUGIN, encoding="utf-8")
+    procs = []
+
+    def start(concurrency=4, token="k"):
+        address = f"unix://{tmp_path}/w{len(procs)}.sock"
+        env = {**os.environ, "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")}
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "remote_plugins.py"), "--listen", address,
+                                 "--plugins-dir", str(plugins), "--token", token, "--name", f"w{len(procs)}",
+                                 "--concurrency", str(concurrency)],
+                                cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        procs.append(proc)
+        path = address[len("unix://"):]
+        assert wait_for(lambda: os.path.exists(path), 10), "工作进程未启动"
+        return address, proc
+
+    yield start
+    for proc in procs:
+        if proc.poll() is None:
+            os.kill(proc.pid, signal.SIGCONT)
+            proc.kill()
+            proc.wait()
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(address, **overrides):
+        cfg = {"enabled": True, "workers": [address], "plugins": ["echo_plugin"], "token": "k",
+               "heartbeat": 0.5, "ack_timeout": 0.5, **overrides}
+        pool = RemotePluginPool(cfg)
+        pools.append(pool)
+        return pool, pool._links[address]
+
+    yield make
+    for pool in pools:
+        pool.stop()
+        for link in list(pool._links.values()):
+            link.close("测试结束")
+
+
+PLUGIN = {"key": "echo_plugin", "name": "echo"}
+
+
+def run(pool, chat, data, timeout=10):
+    msg = SimpleNamespace(type="text", attr="friend", content="echo " + data, sender="甲", sender_remark="")
+    chat_info = {"type": "friend", "name": chat.who, "sender": "甲", "ctx": Context.with_timeout(timeout)}
+    return pool.run(PLUGIN, msg, chat, chat_info, data), chat_info["ctx"]
+
+
+def test_handshake(start_worker, make_pool):
+    address, _ = start_worker(concurrency=3)
+    pool, link = make_pool(address)
+    assert link.alive
+    assert link.plugins >= {"echo_plugin", "echo"}
+    assert link.capacity == 3
+    assert pool.handles(PLUGIN)
+
+
+def test_wrong_token_is_rejected(start_worker, make_pool):
+    address, _ = start_worker(token="k")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(address[len("unix://"):])
+        s.sendall(encode_frame(HELLO, {"version": PROTOCOL_VERSION, "token": "wrong"}))
+        ftype, body = recv_frame(s)
+    assert ftype == ERROR and "认证" in body["error"]
+    pool, link = make_pool(address, token="wrong")
+    assert not link.alive
+    chat = FakeChat("好友A")
+    assert run(pool, chat, "hi")[0] is False
+    assert pool.stats()["fallbacks"] == 1
+
+
+def test_run_streams_actions_and_result(start_worker, make_pool):
+    address, _ = start_worker()
+    pool, link = make_pool(address)
+    chat = FakeChat("好友A")
+    assert run(pool, chat, "你好")[0] is True
+    assert wait_for(lambda: chat.sent == ["你好"])
+    assert wait_for(lambda: pool.stats()["pending"] == 0)
+    assert link.info()["inflight"] == 0
+    assert pool.stats()["remote_runs"] == 1
+
+
+def test_threads_started_by_handle_belong_to_the_task(start_worker, make_pool):
+    address, _ = start_worker()
+    pool, link = make_pool(address)
+    chat = FakeChat("好友A")
+    assert run(pool, chat, "thread")[0] is True
+    assert wait_for(lambda: chat.sent == ["已开始"])
+    # handle 已返回，但其线程仍在运行：任务未结束，名额仍被占用
+    assert pool.stats()["pending"] == 1 and link.info()["inflight"] == 1
+    assert wait_for(lambda: chat.sent == ["已开始", "来自线程"])
+    assert wait_for(lambda: pool.stats()["pending"] == 0)
+    assert link.info()["inflight"] == 0
+
+
+def test_busy_worker_falls_back_to_local(start_worker, make_pool, tmp_path):
+    address, _ = start_worker(concurrency=1)
+    pool, link = make_pool(address)
+    chat = FakeChat("好友A")
+    assert run(pool, chat, f"sleep:1:{tmp_path}/m")[0] is True
+    # 工作进程唯一的名额被占用：回 BUSY，本机执行
+    assert run(pool, FakeChat("好友B"), "hi")[0] is False
+    assert link.counters["busy"] == 1
+    assert pool.stats()["fallbacks"] == 1
+    assert wait_for(lambda: chat.sent == ["睡醒了"])
+
+
+def test_ack_timeout_marks_worker_slow_and_cancels(start_worker, make_pool, tmp_path):
+    address, proc = start_worker()
+    pool, link = make_pool(address, heartbeat=5)
+    sent = []
+    original = link.send
+    link.send = lambda ftype, body: (sent.append(ftype), original(ftype, body))[1]
+    marker = tmp_path / "cancelled"
+    os.kill(proc.pid, signal.SIGSTOP)
+    try:
+        t0 = time.time()
+        assert run(pool, FakeChat("好友A"), f"sleep:5:{marker}")[0] is False
+        assert 0.4 < time.time() - t0 < 2
+        assert link.slow_until > time.time()
+        assert link.counters["slow"] == 1
+        # 暂停期间不再分配，直接回退
+        t0 = time.time()
+        assert run(pool, FakeChat("好友B"), "hi")[0] is False
+        assert time.time() - t0 < 0.2
+    finally:
+        os.kill(proc.pid, signal.SIGCONT)
+    assert sent.count(RUN) == 1 and CANCEL in sent
+    # 工作进程恢复后先收到 RUN 再收到 CANCEL：handle 被取消
+    assert wait_for(lambda: marker.exists())
+    assert link.alive
+
+
+def test_heartbeat_timeout_disconnects_and_reconnects(start_worker, make_pool):
+    address, proc = start_worker()
+    pool, link = make_pool(address)
+    assert link.alive
+    os.kill(proc.pid, signal.SIGSTOP)
+    try:
+        assert wait_for(lambda: not link.alive, 5)
+        assert link.counters["disconnects"] == 1
+        assert run(pool, FakeChat("好友A"), "hi")[0] is False
+    finally:
+        os.kill(proc.pid, signal.SIGCONT)
+    assert wait_for(lambda: link.alive, 8)
+    chat = FakeChat("好友A")
+    assert run(pool, chat, "又连上了")[0] is True
+    assert wait_for(lambda: chat.sent == ["又连上了"])
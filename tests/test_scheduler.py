@@ -0,0 +1,115 @@
+# scheduler：cron 解析、定时执行、取消与 misfire 策略
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronSpec, Job, Scheduler
+
+
+@pytest.fixture
+def sched():
+    s = Scheduler("test")
+    s.start()
+    yield s
+    s.stop()
+
+
+def wait_for(cond, timeout=2.0):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+def ts(*args):
+    return datetime(*args).timestamp()
+
+
+def test_cron_next_after():
+    assert CronSpec("30 8 * * *").next_after(ts(2026, 1, 1, 8, 0)) == ts(2026, 1, 1, 8, 30)
+    assert CronSpec("30 8 * * *").next_after(ts(2026, 1, 1, 8, 30)) == ts(2026, 1, 2, 8, 30)
+    assert CronSpec("*/15 * * * *").next_after(ts(2026, 1, 1, 8, 1)) == ts(2026, 1, 1, 8, 15)
+    # 日与周同时限定时取并集：2026-02-22 是周日，2026-03-10 是 10 号（周二）
+    assert CronSpec("0 9 10 * 0").next_after(ts(2026, 2, 16)) == ts(2026, 2, 22, 9, 0)
+    assert CronSpec("0 9 10 * 0").next_after(ts(2026, 3, 9, 12, 0)) == ts(2026, 3, 10, 9, 0)
+
+
+@pytest.mark.parametrize("expr", ["* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *"])
+def test_cron_rejects_invalid(expr):
+    with pytest.raises(ValueError):
+        CronSpec(expr)
+
+
+def test_after_runs_in_due_order(sched):
+    order = []
+    sched.after(0.15, order.append, "b")
+    sched.after(0.05, order.append, "a")
+    assert wait_for(lambda: len(order) == 2)
+    assert order == ["a", "b"]
+    assert sched.jobs() == []
+
+
+def test_every_repeats_until_cancelled(sched):
+    runs = []
+    job = sched.every(0.05, lambda: runs.append(time.time()), first_delay=0)
+    assert wait_for(lambda: len(runs) >= 3)
+    sched.cancel(job)
+    count = len(runs)
+    time.sleep(0.15)
+    assert len(runs) <= count + 1
+    assert sched.jobs() == []
+
+
+def test_cancel_tag_and_clear(sched):
+    hits = []
+    sched.after(0.1, hits.append, 1, tag="t")
+    sched.after(0.1, hits.append, 2, tag="t")
+    sched.after(0.1, hits.append, 3)
+    sched.cancel_tag("t")
+    assert [j["name"] for j in sched.jobs()] == ["append"]
+    sched.clear()
+    time.sleep(0.2)
+    assert hits == []
+
+
+def test_job_error_is_recorded_and_loop_continues(sched):
+    done = threading.Event()
+
+    def boom():
+        raise RuntimeError("坏了")
+
+    job = sched.after(0, boom)
+    sched.after(0.05, done.set)
+    assert done.wait(2)
+    assert job.runs == 1 and job.last_error == "坏了"
+
+
+def test_new_earlier_job_wakes_sleeping_loop(sched):
+    sched.after(60, lambda: None)
+    hit = threading.Event()
+    t0 = time.time()
+    sched.after(0.05, hit.set)
+    assert hit.wait(1)
+    assert time.time() - t0 < 0.5
+
+
+@pytest.mark.parametrize("policy, times", [("skip", 0), ("once", 1), ("all", 11)])
+def test_misfire_policies(policy, times):
+    s = Scheduler("test")
+    job = Job(1, "j", None, (), {}, "interval", interval=10.0, misfire=policy, grace=1.0)
+    job._set_base(1000.0)
+    assert s._due(job, 1105.0) == times
+    assert job.missed == 10
+    assert job.base == 1110.0
+
+
+def test_one_shot_past_grace_with_skip_is_dropped():
+    s = Scheduler("test")
+    job = Job(1, "j", None, (), {}, "once", misfire="skip", grace=5.0)
+    job._set_base(1000.0)
+    assert s._due(job, 1010.0) == 0
+    job = Job(2, "j", None, (), {}, "once", misfire="once", grace=5.0)
+    job._set_base(1000.0)
+    assert s._due(job, 1010.0) == 1
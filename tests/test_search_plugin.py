@@ -0,0 +1,126 @@
+# plugins/search_plugin：对冲请求与结果分页游标
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from conftest import load_plugin  # noqa: E402
+from context import Cancelled, Context  # noqa: E402
+
+search = load_plugin("search_plugin")
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    """slow 端点阻塞到被取消，fast 端点立即返回；主请求固定发往 slow"""
+    cancelled = threading.Event()
+
+    def fake_post(url, title, deadline, ctx):
+        if url == "fast":
+            return {"data": [url]}
+        if ctx.token.wait(deadline - time.time()):
+            cancelled.set()
+            raise Cancelled(ctx.token.reason)
+        raise search.SearchTimeout()
+
+    monkeypatch.setattr(search, "SEARCH_API_URLS", ["slow", "fast"])
+    monkeypatch.setattr(search, "_post", fake_post)
+    monkeypatch.setattr(search, "hedge_delay", lambda: 0.05)
+    monkeypatch.setattr(search, "pick_endpoint",
+                        lambda exclude=(): search._endpoint("fast" if "slow" in exclude else "slow"))
+    return cancelled
+
+
+def test_hedge_wins_and_loser_is_cancelled(endpoints):
+    t0 = time.time()
+    assert search._hedged_post("关键词", time.time() + 5) == {"data": ["fast"]}
+    assert time.time() - t0 < 1
+    assert endpoints.wait(1), "落后的主请求应被取消"
+
+
+def test_loser_is_cancelled_with_parent_context(endpoints):
+    ctx = Context.with_timeout(5)
+    assert search._hedged_post("关键词", time.time() + 5, ctx) == {"data": ["fast"]}
+    assert endpoints.wait(1)
+    assert not ctx.cancelled  # 只取消子上下文，不影响消息本身
+
+
+def test_deadline_cancels_outstanding_requests(monkeypatch, endpoints):
+    monkeypatch.setattr(search, "SEARCH_API_URLS", ["slow"])
+    monkeypatch.setattr(search, "pick_endpoint", lambda exclude=(): search._endpoint("slow"))
+    with pytest.raises(search.SearchTimeout):
+        search._hedged_post("关键词", time.time() + 0.2)
+    assert endpoints.wait(1)
+
+
+@pytest.fixture
+def cursors(monkeypatch):
+    monkeypatch.setattr(search, "_cursors", search.OrderedDict())
+    monkeypatch.setattr(search, "RESULT_PAGE_SIZE", 5)
+    return search._cursors
+
+
+def items(n):
+    return [{"title": f"资源{i}", "url": f"https://pan.example/{i}"} for i in range(1, n + 1)]
+
+
+def test_next_page_walks_the_results_then_drops_the_cursor(cursors):
+    chat = {"name": "张三"}
+    search.save_cursor(chat, "电影", items(12), 5)
+    page = search.next_page(chat)
+    assert "第 6-10 条" in page and "资源10" in page and "资源11" not in page
+    assert "还有 2 条" in page
+    page = search.next_page(chat)
+    assert "第 11-12 条" in page and "下一页" not in page
+    assert search.get_cursor(chat) is None
+    assert search.next_page(chat) is None
+
+
+def test_concurrent_next_page_never_repeats_a_page(cursors):
+    chat = {"name": "群聊"}
+    search.save_cursor(chat, "电影", items(5 * 41), 5)
+    pages = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        while True:
+            page = search.next_page(chat)
+            if page is None:
+                return
+            pages.append(page)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(pages) == 40
+    assert sorted(int(p.split("第 ")[1].split("-")[0]) for p in pages) == list(range(6, 5 * 41, 5))
+
+
+def test_expired_cursor_is_dropped(cursors, monkeypatch):
+    chat = {"name": "张三"}
+    monkeypatch.setattr(search, "CURSOR_TTL", -1)
+    search.save_cursor(chat, "电影", items(12), 5)
+    assert search.next_page(chat) is None
+    assert "张三" not in cursors
+    # 翻页会续期
+    monkeypatch.setattr(search, "CURSOR_TTL", 600)
+    search.save_cursor(chat, "电影", items(12), 5)
+    cursors["张三"]["expires"] = time.time() + 1
+    search.next_page(chat)
+    assert cursors["张三"]["expires"] > time.time() + 500
+
+
+def test_cursor_cache_evicts_least_recently_used(cursors, monkeypatch):
+    monkeypatch.setattr(search, "CURSOR_CACHE_SIZE", 3)
+    for name in "ABC":
+        search.save_cursor({"name": name}, name, items(20), 5)
+    search.get_cursor({"name": "A"})   # A 变为最近使用
+    search.next_page({"name": "B"})    # 翻页同样刷新顺序
+    search.save_cursor({"name": "D"}, "D", items(20), 5)
+    assert list(cursors) == ["A", "B", "D"]
+    assert search.get_cursor({"name": "C"}) is None
@@ -0,0 +1,102 @@
+# state_store：TTL、按条数/字节的 LRU 淘汰、按插件统计与快照恢复
+import time
+
+from state_store import StateStore
+
+
+def key(name, plugin="p", chat="群", sender="张三"):
+    return (plugin, chat, sender, name)
+
+
+def test_values_are_copies_and_expire():
+    store = StateStore({"default_ttl": 0.1})
+    value = {"step": 1, "items": ["a"]}
+    store.set(key("a"), value)
+    store.set(key("b"), 2, ttl=60)
+    value["items"].append("b")
+    got = store.get(key("a"))
+    assert got == {"step": 1, "items": ["a"]}
+    got["step"] = 9
+    assert store.get(key("a"))["step"] == 1
+    time.sleep(0.15)
+    assert store.get(key("a"), "默认") == "默认"
+    assert store.get(key("b")) == 2
+    stats = store.stats()
+    assert stats["entries"] == 1 and stats["expired"] == 1
+
+
+def test_lru_eviction_by_entries():
+    store = StateStore({"max_entries": 3})
+    for name in "abc":
+        store.set(key(name), name)
+    store.get(key("a"))  # a 变为最近使用
+    store.set(key("d"), "d")
+    assert store.get(key("b")) is None
+    assert [store.get(key(n)) for n in "acd"] == ["a", "c", "d"]
+    assert store.stats()["evicted"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    store = StateStore({"max_bytes": 1024})
+    big = "x" * 300
+    for name in "abc":
+        store.set(key(name), big)
+    assert store.stats()["entries"] == 2  # 三条超出 1024 字节，淘汰最久未用的 a
+    assert store.get(key("a")) is None
+    assert store.stats()["bytes"] <= 1024
+    # 收紧上限时立即淘汰
+    store.configure({"max_entries": 1, "max_bytes": 1024})
+    assert store.stats()["entries"] == 1 and store.get(key("c")) == big
+
+
+def test_per_plugin_accounting():
+    store = StateStore()
+    store.set(key("a", plugin="search"), "值")
+    store.set(key("b", plugin="search"), [1, 2, 3])
+    store.set(key("a", plugin="weather"), 1)
+    store.set(key("a", plugin="weather"), 2)  # 覆盖不重复计数
+    plugins = store.stats()["plugins"]
+    assert plugins["search"]["entries"] == 2 and plugins["weather"]["entries"] == 1
+    assert store.stats()["bytes"] == plugins["search"]["bytes"] + plugins["weather"]["bytes"]
+    assert store.clear(plugin="search") == 2
+    assert "search" not in store.stats()["plugins"]
+    assert store.delete(key("a", plugin="weather"))
+    assert store.stats()["bytes"] == 0 and store.stats()["plugins"] == {}
+
+
+def test_scopes_isolate_sender_and_chat():
+    store = StateStore()
+    alice = store.scope("p", "群", "张三")
+    bob = store.scope("p", "群", "李四")
+    alice.set("step", 2)
+    alice.chat.set("topic", "电影")
+    assert bob.get("step") is None
+    assert bob.chat.get("topic") == "电影"
+    assert alice.pop("step") == 2 and alice.get("step") is None
+    assert alice.chat.clear() == 1
+
+
+def test_snapshot_restore_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    store = StateStore()
+    store.set(key("a"), {"step": 1})
+    store.set(key("b", chat="私聊", sender=""), [1, "二"])
+    store.set(key("gone"), 1, ttl=0.05)
+    store.get(key("a"))  # a 最近使用
+    time.sleep(0.1)
+    assert store.snapshot(path) == 2
+
+    restored = StateStore({"max_entries": 1}, snapshot_file=path)
+    assert restored.restore() == 1  # 恢复时同样受上限约束，保留最近使用的记录
+    assert restored.get(key("a")) == {"step": 1}
+
+    restored = StateStore(snapshot_file=path)
+    assert restored.restore() == 2
+    assert restored.get(key("b", chat="私聊", sender="")) == [1, "二"]
+    assert restored.get(key("gone")) is None
+    sizes = [store._entries[k].size for k in (key("a"), key("b", chat="私聊", sender=""))]
+    assert restored.stats()["bytes"] == sum(sizes)
+
+
+def test_restore_without_snapshot_file(tmp_path):
+    assert StateStore(snapshot_file=str(tmp_path / "missing.json")).restore() == 0
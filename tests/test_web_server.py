@@ -0,0 +1,100 @@
+# web_server：配置接口（版本号 ETag、If-Match、增量更新）与机器人运行时的冷/热启停
+import json
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+
+import web_server  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    config = {"admin": "管理员", "keyword_dict": {f"关键词{i}": "回复" * 20 for i in range(50)},
+              "rate_limit": {"enabled": True, "sender": {"rate": 0.2, "burst": 5}, "chat": {"rate": 1.0, "burst": 20}}}
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(web_server, "CONFIG_FILE", str(path))
+    monkeypatch.setitem(web_server.serve_options, "gzip", True)  # --prod 模式
+    c = web_server.app.test_client()
+    with c.session_transaction() as s:
+        s["logged_in"] = True
+    return c
+
+
+def test_get_then_patch_with_if_match_in_prod_mode(client):
+    resp = client.get("/api/config", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers.get("Content-Encoding") == "gzip"
+    etag = resp.headers["ETag"]
+    resp = client.patch("/api/config", json={"admin": "新管理员"}, headers={"If-Match": etag})
+    assert resp.status_code == 200, resp.get_json()
+    new_etag = resp.headers["ETag"]
+    assert new_etag != etag
+    # 旧版本号再次提交返回 412
+    resp = client.patch("/api/config", json={"admin": "另一个"}, headers={"If-Match": etag})
+    assert resp.status_code == 412
+
+
+def test_routes_without_etag_get_one_per_encoding(client):
+    for i in range(50):
+        web_server.log("INFO", f"填充日志 {i}")
+    plain = client.get("/get_logs")
+    zipped = client.get("/get_logs", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers.get("Content-Encoding") == "gzip"
+    assert zipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+
+def test_patch_of_nested_section_keeps_other_fields(client):
+    resp = client.patch("/api/config", json={"rate_limit": {"enabled": False}})
+    assert resp.status_code == 200, resp.get_json()
+    config = client.get("/api/config").get_json()["config"]
+    assert config["rate_limit"] == {"enabled": False, "sender": {"rate": 0.2, "burst": 5},
+                                    "chat": {"rate": 1.0, "burst": 20}}
+    assert list(resp.get_json()["diff"]) == ["rate_limit"]
+
+
+def test_patch_of_one_plugin_keeps_other_plugins(client):
+    client.patch("/api/config", json={"plugins": {"weather_plugin": {"rate_limit": {"rate": 1, "burst": 2}},
+                                                  "search_plugin": {"page_size": 5}}})
+    client.patch("/api/config", json={"plugins": {"weather_plugin": {"rate_limit": {"burst": 4}}}})
+    plugins = client.get("/api/config").get_json()["config"]["plugins"]
+    assert plugins == {"weather_plugin": {"rate_limit": {"rate": 1.0, "burst": 4}}, "search_plugin": {"page_size": 5}}
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return cond()
+
+
+def test_bot_runtime_warm_start_reuses_instance(tmp_path, monkeypatch):
+    config = {"backend": "sim", "admin": "管理员", "sim": {"latency": 0, "jitter": 0, "failure_rate": 0}}
+    (tmp_path / "config.json").write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    (tmp_path / "plugins").mkdir()
+    monkeypatch.chdir(tmp_path)  # WXBot() 读取当前目录下的 config.json 与 ./plugins
+    runtime = web_server.BotRuntime()
+
+    assert runtime.start()
+    assert wait_for(lambda: runtime.bot is not None and runtime.bot.runs == 1)
+    assert not runtime.start()  # 已在运行
+    bot = runtime.bot
+    assert "管理员" in bot.listen_windows
+    assert runtime.stop() == (True, True)
+    assert wait_for(lambda: not runtime.running)
+    assert runtime.stop() == (False, False)
+
+    # 热启动：同一实例、同一运行线程，只重新添加监听
+    thread = runtime._thread
+    assert runtime.start()
+    assert wait_for(lambda: bot.runs == 2)
+    assert runtime.bot is bot and runtime._thread is thread
+    assert "管理员" in bot.listen_windows
+    assert [s["mode"] for s in bot.startups] == ["cold", "warm"]
+    assert runtime.stop() == (True, True)
+    assert wait_for(lambda: not runtime.running)
@@ -6,9 +6,13 @@
 机器人管理网页
 使用 Flask 框架开发，提供机器人控制、配置管理等功能
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g
 import json
 import os
+import gzip
+import hashlib
+import argparse
+from collections import deque
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import logging
@@ -18,7 +22,16 @@ import threading
 from wxbot_class_only_V2 import WXBot
 from logger import log
 import logger
-import pythoncom
+from log_index import log_index
+import memstats
+import outbound
+from scheduler import Scheduler
+from config_schema import (validate_fields, coerce_fields, merge_fields, config_version, diff_config,
+                           ConfigVersionConflict)
+try:
+    import pythoncom  # Windows COM（wxautox 后端需要）；其他平台只能使用模拟后端
+except ImportError:
+    pythoncom = None
 import webbrowser
 import time
 import socket
@@ -32,8 +45,8 @@ def resource_path(relative_path):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
-# 初始化 Flask 应用
-app = Flask(__name__, template_folder=resource_path('templates'))
+# 初始化 Flask 应用（模板与静态资源均通过 resource_path 定位，兼容 PyInstaller 单文件打包）
+app = Flask(__name__, template_folder=resource_path('templates'), static_folder=resource_path('static'))
 app.secret_key = 'your_very_long_and_random_secret_key_here'
 
 # 安全配置
@@ -64,7 +77,75 @@ LOG_COLORS = {
     'SUCCESS': 'text-success'
 }
 
-log_messages = []
+# ---------------------------------------------
+# 生产模式：gzip 压缩、静态资源缓存、请求耗时统计
+# ---------------------------------------------
+GZIP_MIN_SIZE = 1024                 # 超过该字节数才压缩
+GZIP_MIMETYPES = {'application/json', 'text/html', 'text/css', 'application/javascript', 'text/plain'}
+STATIC_MAX_AGE = 7 * 24 * 3600       # 静态资源缓存时间（秒）
+LATENCY_SAMPLES = 500                # 每个接口保留的耗时样本数（用于分位数）
+
+serve_options = {'gzip': False}
+_latency_lock = threading.Lock()
+_latency = {}  # endpoint -> {'count', 'total', 'max', 'samples': deque}
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _finish_request(response):
+    # 静态资源缓存头
+    if request.endpoint == 'static' and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+    elif (serve_options['gzip'] and response.status_code == 200 and not response.direct_passthrough
+          and response.mimetype in GZIP_MIMETYPES and 'Content-Encoding' not in response.headers):
+        data = response.get_data()
+        use_gzip = len(data) >= GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+        # 同一 URL 的压缩/未压缩两种表示都要声明 Vary，避免缓存把其中一种发给不支持的客户端
+        response.vary.add('Accept-Encoding')
+        # 内容未变化时返回 304（仪表盘/日志轮询等 GET 请求）；ETag 按编码区分，两种表示不能共用强校验值
+        # 接口自带 ETag 时（如 /api/config 的配置版本号，PATCH 的 If-Match 依赖它）保持原值
+        if request.method == 'GET' and not response.get_etag()[0]:
+            etag = hashlib.sha1(data).hexdigest()
+            response.set_etag(etag + '-gzip' if use_gzip else etag)
+            response.make_conditional(request)
+        # gzip 压缩 JSON/HTML 等文本响应
+        if response.status_code == 200 and use_gzip:
+            response.set_data(gzip.compress(data, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Content-Length'] = str(len(response.get_data()))
+    # 请求耗时统计
+    start = g.get('request_start')
+    if start is not None:
+        cost = (time.perf_counter() - start) * 1000
+        key = request.endpoint or 'unknown'
+        with _latency_lock:
+            st = _latency.get(key)
+            if st is None:
+                st = _latency[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=LATENCY_SAMPLES)}
+            st['count'] += 1
+            st['total'] += cost
+            st['max'] = max(st['max'], cost)
+            st['samples'].append(cost)
+    return response
+
+def latency_stats():
+    """各接口请求耗时统计（毫秒）"""
+    out = {}
+    with _latency_lock:
+        for key, st in _latency.items():
+            samples = sorted(st['samples'])
+            pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 2) if samples else 0
+            out[key] = {
+                'count': st['count'],
+                'avg_ms': round(st['total'] / st['count'], 2),
+                'p50_ms': pick(0.5),
+                'p95_ms': pick(0.95),
+                'max_ms': round(st['max'], 2),
+            }
+    return out
 
 def login_required(f):
     @wraps(f)
@@ -76,18 +157,9 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def log_server(level, msg):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_entry = {
-        'time': timestamp,
-        'level': level,
-        'message': msg,
-        'color': LOG_COLORS.get(level.upper(), 'text-dark')
-    }
-    log_messages.append(log_entry)
-    if len(log_messages) > 1000:
-        log_messages.pop(0)
-    print(f"[{timestamp}] [{level}] {msg}")
+def recent_logs(limit=50):
+    """最近日志（统一日志系统的内存缓存），附加前端颜色"""
+    return [{**e, 'color': LOG_COLORS.get(e['level'], 'text-dark')} for e in logger.get_recent_logs(limit)]
 
 # 读取配置文件
 def read_config():
@@ -169,97 +241,101 @@ def dashboard():
     config.setdefault('everyday_stop_bot_time', "23:00")
 
 
-    return render_template('dashboard.html', config=config, logs=log_messages[-50:])
+    return render_template('dashboard.html', config=config, logs=recent_logs())
 
 @app.route('/get_logs')
 @login_required
 def get_logs():
-    return jsonify({'logs': logger.log_messages[-50:]})
-
-def _coerce_bool_fields(merged_config):
-    boolean_fields = [
-        'AllListen_switch',
-        'group_switch',
-        'group_reply_at',
-        'group_welcome',
-        'new_friend_switch',
-        # —— 新增布尔字段 —— 
-        'chat_keyword_switch',
-        'group_keyword_switch',
-        'everyday_msg_switch',
-        'everyday_start_stop_bot_switch',   # 新增
-    ]
-    for field in boolean_fields:
-        if field in merged_config:
-            v = merged_config[field]
-            if isinstance(v, str):
-                merged_config[field] = (v.lower() in ('on', 'true', '1'))
-            else:
-                merged_config[field] = bool(v)
-
-def _coerce_list_fields(merged_config):
-    list_fields = ['listen_list', 'group', 'new_friend_msg', 'api_sdk_list']
-    for field in list_fields:
-        if field in merged_config and not isinstance(merged_config[field], list):
-            if isinstance(merged_config[field], str):
-                merged_config[field] = [merged_config[field]] if merged_config[field] else []
-            else:
-                merged_config[field] = []
-        if field in merged_config:
-            merged_config[field] = [item for item in merged_config[field] if str(item).strip()]
-
-def _coerce_float_fields(merged_config):
-    # 仅当前需要 group_welcome_random，限定 [0.0, 1.0]
-    if 'group_welcome_random' in merged_config:
+    # 附带卡死检测结果，网页端轮询日志时一并刷新告警
+    bot = runtime.bot
+    return jsonify({'logs': recent_logs(), 'stuck': bot.watchdog.stuck() if bot is not None else []})
+
+def _parse_search_time(value, end=False):
+    """解析日志检索的时间参数：支持 YYYY-MM-DD 与 YYYY-MM-DD HH:MM[:SS]"""
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
         try:
-            val = float(merged_config['group_welcome_random'])
-            if val < 0.0: val = 0.0
-            if val > 1.0: val = 1.0
-            merged_config['group_welcome_random'] = val
-        except (TypeError, ValueError):
-            # 若非法，则保持原值或回退默认
-            merged_config['group_welcome_random'] = float(read_config().get('group_welcome_random', 1.0))
-
-def _coerce_dict_fields(merged_config):
-    # keyword_dict 支持：dict / JSON字符串 / list[{key, value}]
-    if 'keyword_dict' in merged_config:
-        kd = merged_config['keyword_dict']
-        if isinstance(kd, dict):
-            return
-        if isinstance(kd, str):
-            try:
-                obj = json.loads(kd)
-                if isinstance(obj, dict):
-                    merged_config['keyword_dict'] = obj
-                    return
-            except Exception:
-                pass
-        if isinstance(kd, list):
-            out = {}
-            for item in kd:
-                if isinstance(item, dict):
-                    key = str(item.get('key', '')).strip()
-                    val = str(item.get('value', ''))
-                    if key:
-                        out[key] = val
-            merged_config['keyword_dict'] = out
-            return
-        # 其他情况回退空 dict
-        merged_config['keyword_dict'] = {}
+            t = datetime.strptime(value.strip(), fmt)
+            if fmt == '%Y-%m-%d' and end:
+                t = t + timedelta(days=1) - timedelta(seconds=1)
+            return t
+        except ValueError:
+            continue
+    raise ValueError(f'无法解析时间: {value}')
+
+@app.route('/api/logs/search')
+@login_required
+def search_logs():
+    """历史日志检索：q=文本 level=级别 start/end=日期范围 plugin=插件名 page/size=分页"""
+    try:
+        start = _parse_search_time(request.args.get('start'))
+        end = _parse_search_time(request.args.get('end'), end=True)
+        t0 = time.perf_counter()
+        res = log_index.search(
+            text=request.args.get('q', ''),
+            level=request.args.get('level') or None,
+            start=start,
+            end=end,
+            plugin=request.args.get('plugin') or None,
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('size', 50, type=int),
+        )
+        res['took_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        return jsonify({'status': 'success', **res})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        log('ERROR', f'日志检索失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# ---------------------------------------------
+# 配置写入：字段表校验（config_schema）+ 增量合并 + 版本号
+# ---------------------------------------------
+_config_lock = threading.Lock()
+
+def write_config(config_data):
+    """原子写入配置文件（先写临时文件再替换）"""
+    tmp = CONFIG_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(config_data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, CONFIG_FILE)
+
+def update_config(updates, strict=False, expected_version=None):
+    """
+    将 updates 合并进配置文件，只校验传入的字段，返回 (新版本号, 差异)
+    dict 类型的配置段按子字段合并（PATCH {"rate_limit": {"enabled": false}} 不会清掉 sender/chat 等）
+    strict=True 时非法值抛 ValueError，否则回退为当前值；expected_version 不一致抛 ConfigVersionConflict
+    """
+    with _config_lock:
+        current = read_config() or {}
+        if expected_version and expected_version != config_version(current):
+            raise ConfigVersionConflict(config_version(current))
+        updates = merge_fields(updates, current)
+        clean = validate_fields(updates) if strict else coerce_fields(updates, current)
+        diff = diff_config(current, clean)
+        if diff:
+            merged = {**current, **{k: v['new'] for k, v in diff.items()}}
+            write_config(merged)
+        else:
+            merged = current
+        return config_version(merged), diff
+
+def apply_config_change(diff):
+    """把配置差异推送给运行中的组件（定时启停、机器人热更新）"""
+    if not diff:
+        return
+    if 'log_levels' in diff:
+        logger.set_levels(diff['log_levels']['new'])  # 日志级别即时生效（机器人未运行时同样生效）
+    if any(k.startswith('everyday_start') or k.startswith('everyday_stop') for k in diff):
+        schedule_start_stop(reason='配置更新，')  # 更新定时启停任务
+    if runtime.bot is not None:
+        runtime.bot.apply_config_diff(diff)  # 关键词等配置热更新（停止期间同样生效，实例常驻）
 
 # 保存配置文件
 def save_config(config_data):
     try:
-        original_config = read_config() or {}
-        merged_config = {**original_config, **config_data}
-
-        _coerce_bool_fields(merged_config)
-        _coerce_list_fields(merged_config)
-        _coerce_float_fields(merged_config)
-        _coerce_dict_fields(merged_config)
-
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(merged_config, f, ensure_ascii=False, indent=4)
+        update_config(config_data)
         log('SUCCESS', '配置文件保存成功')
         return True
     except Exception as e:
@@ -267,7 +343,6 @@ def save_config(config_data):
         return False
 
 #   保存配置
-update_config_status = False # 记录是否更新了定时启停状态
 @app.route('/save_config', methods=['POST'])
 @login_required
 def save_config_route():
@@ -276,52 +351,139 @@ def save_config_route():
         if not config_data:
             return jsonify({'status': 'error', 'message': '无效的配置数据'})
 
-        current_config = read_config() or {}
-
-        # API Key 星号保留原值
+        # API Key 星号保留原值（不写入即保留）
         if 'api_key' in config_data and isinstance(config_data['api_key'], str) and config_data['api_key'].startswith('*'):
-            config_data['api_key'] = current_config.get('api_key', '')
-
-        merged_config = {**current_config, **config_data}
+            config_data.pop('api_key')
 
-        # 预处理（与 save_config 二次校验互补）
-        _coerce_bool_fields(merged_config)
-        _coerce_list_fields(merged_config)
-        _coerce_float_fields(merged_config)
-        _coerce_dict_fields(merged_config)
-
-        if save_config(merged_config):
-            global update_config_status
-            update_config_status = True # 执行了保存配置
-            return jsonify({'status': 'success', 'message': '配置保存成功'})
-        else:
-            return jsonify({'status': 'error', 'message': '配置保存失败'})
+        version, diff = update_config(config_data)
+        log('SUCCESS', f'配置文件保存成功，变更 {len(diff)} 项')
+        apply_config_change(diff)
+        return jsonify({'status': 'success', 'message': '配置保存成功', 'version': version})
     except Exception as e:
         log('ERROR', f'保存配置出错: {str(e)}')
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/config', methods=['GET'])
+@login_required
+def get_config_api():
+    """读取配置及版本号（ETag），配合 PATCH 的 If-Match 使用"""
+    config = read_config()
+    if config is None:
+        return jsonify({'status': 'error', 'message': '无法读取配置文件'}), 500
+    version = config_version(config)
+    resp = jsonify({'status': 'success', 'version': version, 'config': config})
+    resp.set_etag(version)
+    return resp
+
+@app.route('/api/config', methods=['PATCH'])
+@login_required
+def patch_config_api():
+    """
+    增量更新配置：请求体只包含变更字段，一次遍历完成校验
+    If-Match 头与当前版本不一致返回 412；返回新版本号与字段差异
+    """
+    updates = request.get_json(silent=True)
+    if not isinstance(updates, dict) or not updates:
+        return jsonify({'status': 'error', 'message': '请求体需为非空 JSON 对象'}), 400
+    if_match = request.headers.get('If-Match', '').strip()
+    expected = if_match.removeprefix('W/').strip('"') if if_match and if_match != '*' else None
+    try:
+        version, diff = update_config(updates, strict=True, expected_version=expected)
+    except ConfigVersionConflict as e:
+        return jsonify({'status': 'error', 'message': str(e), 'version': e.current_version}), 412
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'配置校验失败: {e}'}), 400
+    except Exception as e:
+        log('ERROR', f'增量更新配置出错: {str(e)}')
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if diff:
+        log('SUCCESS', f'配置增量更新：{", ".join(diff)}')
+        apply_config_change(diff)
+    resp = jsonify({'status': 'success', 'version': version, 'diff': diff})
+    resp.set_etag(version)
+    return resp
+
 # 启动/停止机器人
-bot = None
-bot_thread = None
+class BotRuntime:
+    """
+    长驻机器人运行时：WXBot 实例与运行线程在多次启停之间保留
+    - 首次启动为冷启动（读配置、加载插件、连接微信），之后的启动只重新添加监听（热启动）
+    - 运行线程常驻并持有 COM 初始化，微信 UI 对象始终在同一线程中使用
+    """
+    def __init__(self):
+        self.bot = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """请求启动，已在运行时返回 False"""
+        with self._lock:
+            if self.running:
+                log("WARNING", "状态：机器人已在运行")
+                return False
+            self._running = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="wxbot-runtime", daemon=True)
+                self._thread.start()
+            self._wake.set()
+            return True
+
+    def stop(self):
+        """停止机器人（实例保留），返回 (是否在运行, 是否停止成功)"""
+        with self._lock:
+            if not self.running or self.bot is None:
+                log('WARNING', '状态：机器人未运行')
+                return False, False
+            if self.bot.stop():
+                log('SUCCESS', '机器人已停止（实例保留，下次热启动）')
+                return True, True
+        log('ERROR', '停止机器人失败')
+        return True, False
+
+    def _run(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()  # 防止多线程调用COM组件时出错
+        try:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+                try:
+                    if self.bot is None:
+                        self.bot = WXBot()
+                    self.bot.main()
+                except Exception as e:
+                    log('ERROR', f'机器人运行出错: {str(e)}')
+                finally:
+                    self._running = False
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()  # 释放COM组件
+
+runtime = BotRuntime()
+# web 端定时任务（定时启停等）
+scheduler = Scheduler("web")
+
+def launch_bot():
+    """启动机器人（复用常驻实例），已在运行时返回 False"""
+    return runtime.start()
+
+def halt_bot():
+    """停止机器人，返回 (是否在运行, 是否停止成功)"""
+    return runtime.stop()
 
 @app.route('/start_bot', methods=['POST'])
 @login_required
 def start_bot():
     log('INFO', '机器人启动请求已接收')
-    global bot_thread
-    if bot_thread and bot_thread.is_alive():
-        log("WARNING", "状态：机器人已在运行")
-        return jsonify({'status': 'success', 'message': '机器人已在运行'})
-
-    def run_bot():
-        pythoncom.CoInitialize()
-        global bot
-        bot = WXBot()
-        bot.run()
-        pythoncom.CoUninitialize()
     try:
-        bot_thread = threading.Thread(target=run_bot, daemon=True)
-        bot_thread.start()
+        if not launch_bot():
+            return jsonify({'status': 'success', 'message': '机器人已在运行'})
     except Exception as e:
         log('ERROR', f'启动机器人失败: {str(e)}')
     return jsonify({'status': 'success', 'message': '机器人启动命令已发送'})
@@ -330,19 +492,138 @@ def start_bot():
 @login_required
 def stop_bot():
     log('INFO', '机器人停止请求已接收')
-    global bot_thread, bot
-    if bot_thread and bot_thread.is_alive():
-        if bot.stop_wxbot():
-            log('SUCCESS', '机器人已停止')
-            bot_thread = None
-            bot = None
-            return jsonify({'status': 'success', 'message': '机器人已停止'})
-        else:
-            log('ERROR', '停止机器人失败')
-            return jsonify({'status': 'error', 'message': '停止机器人失败'})
-    else:
-        log('WARNING', '状态：机器人未运行')
+    running, stopped = halt_bot()
+    if not running:
         return jsonify({'status': 'error', 'message': '机器人未运行'})
+    if stopped:
+        return jsonify({'status': 'success', 'message': '机器人已停止'})
+    return jsonify({'status': 'error', 'message': '停止机器人失败'})
+
+@app.route('/api/bot_status')
+@login_required
+def bot_status():
+    """机器人运行统计（调度任务、关键词、入群欢迎、新好友接待队列等）"""
+    bot = runtime.bot
+    return jsonify({'status': 'success', 'running': runtime.running,
+                    'stats': bot.stats() if bot is not None else None})
+
+@app.route('/api/plugins')
+@login_required
+def plugins_info():
+    """已加载插件及其可调设置（声明与当前生效值），修改通过 PATCH /api/config 的 plugins 字段"""
+    bot = runtime.bot
+    return jsonify({'status': 'success', 'plugins': bot.plugin_mgr.list_plugins() if bot is not None else [],
+                    'config': (read_config() or {}).get('plugins', {})})
+
+@app.route('/api/server_stats')
+@login_required
+def server_stats():
+    """web 服务自身的请求耗时统计"""
+    return jsonify({'status': 'success', 'gzip': serve_options['gzip'], 'latency': latency_stats()})
+
+# ---------------------------------------------
+# 内存诊断：RSS、tracemalloc 快照/差异、主要数据结构大小、按来源分组的线程
+# ---------------------------------------------
+def _prefixed(prefix, stats):
+    return {f"{prefix}_{name}": value for name, value in stats.items()}
+
+def _memory_structures():
+    """
+    进程内主要数据结构的大小：各组件通过 memory_stats() 自行持锁统计，
+    机器人未创建时只统计 web 端部分
+    """
+    with _latency_lock:
+        latency = memstats.measure({'web_latency': _latency})
+    structures = {
+        **logger.memory_stats(),
+        **latency,
+        **_prefixed('web', scheduler.memory_stats()),
+        **_prefixed('outbound', outbound.sender.memory_stats()),
+    }
+    bot = runtime.bot
+    if bot is not None:
+        structures.update({
+            'plugin_table': bot.plugin_mgr.memory_stats()['plugins'],
+            'chat_cache': bot.chat_cache.memory_stats()['entries'],
+            'state_store': bot.state_store.memory_stats()['entries'],
+            **_prefixed('rate_limit', bot.rate_limiter.memory_stats()),
+            **_prefixed('inbound', bot.inbound.memory_stats()),
+            **_prefixed('onboarding', bot.onboarding.memory_stats()),
+            **_prefixed('welcome', bot.welcomer.memory_stats()),
+            **_prefixed('remote', bot.remote.memory_stats()),
+        })
+        if bot.scheduler is not None:
+            structures.update(_prefixed('bot', bot.scheduler.memory_stats()))
+        # 插件模块级的容器变量（无上限的字典/列表是常见的泄漏来源）
+        modules = {}
+        for p in bot.plugin_mgr.plugins:
+            for name, value in vars(p['module']).items():
+                if not name.isupper() and isinstance(value, (dict, list, set, deque)):
+                    modules[f"plugin:{p['name']}.{name}"] = value
+        structures.update(memstats.measure(modules))
+    return structures
+
+def _plugin_modules():
+    bot = runtime.bot
+    return [p['module'].__name__ for p in bot.plugin_mgr.plugins] if bot is not None else []
+
+@app.route('/api/memory', methods=['GET'])
+@login_required
+def memory_report():
+    """
+    内存概览：RSS、tracemalloc 状态、数据结构大小、线程分组
+    ?top=N 且已开启追踪时附带当前占用最多的 N 个代码位置（group_by=lineno|filename）
+    """
+    report = {
+        'status': 'success',
+        'rss': memstats.rss_bytes(),
+        'tracemalloc': memstats.tracing_status(),
+        'structures': _memory_structures(),
+        'log_index': log_index.stats(),
+        'threads': memstats.threads_by_origin(_plugin_modules()),
+    }
+    top_n = request.args.get('top', type=int)
+    if top_n and report['tracemalloc']['tracing']:
+        report['top'] = memstats.top(limit=top_n, group_by=request.args.get('group_by', 'lineno'))
+    return jsonify(report)
+
+@app.route('/api/memory/tracemalloc', methods=['POST'])
+@login_required
+def memory_tracing():
+    """开启/关闭 tracemalloc：{"action": "start"|"stop", "frames": 1}"""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action == 'start':
+        return jsonify({'status': 'success', 'tracemalloc': memstats.start_tracing(data.get('frames', 1))})
+    if action == 'stop':
+        return jsonify({'status': 'success', 'tracemalloc': memstats.stop_tracing()})
+    return jsonify({'status': 'error', 'message': 'action 应为 start 或 stop'}), 400
+
+@app.route('/api/memory/snapshot', methods=['POST'])
+@login_required
+def memory_snapshot():
+    """保存一个 tracemalloc 快照（最多保留 memstats.MAX_SNAPSHOTS 个），返回快照 id 与 RSS"""
+    try:
+        sid = memstats.take_snapshot()
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    return jsonify({'status': 'success', 'id': sid, 'rss': memstats.rss_bytes()})
+
+@app.route('/api/memory/diff')
+@login_required
+def memory_diff():
+    """快照差异：?a=旧快照id&b=新快照id（缺省为当前）&limit=20&group_by=lineno|filename"""
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename'):
+        return jsonify({'status': 'error', 'message': 'group_by 应为 lineno 或 filename'}), 400
+    try:
+        stats = memstats.diff(request.args.get('a', type=int), request.args.get('b', type=int),
+                              limit=request.args.get('limit', 20, type=int), group_by=group_by)
+    except (KeyError, TypeError) as e:
+        return jsonify({'status': 'error', 'message': f'快照不存在: {e}'}), 404
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    return jsonify({'status': 'success', 'diff': stats})
 
 @app.route('/load_config')
 @login_required
@@ -354,82 +635,42 @@ def load_config():
         config['api_key_display'] = '*' * len(config['api_key'])
     return jsonify({'status': 'success', 'config': config})
 
+def _scheduled_start():
+    log('INFO', '到达预定启动时间，正在启动机器人')
+    try:
+        launch_bot()
+    except Exception as e:
+        log('ERROR', f'启动机器人失败: {str(e)}')
+
+def _scheduled_stop():
+    log('INFO', '到达预定停止时间，正在停止机器人')
+    halt_bot()
+
+def schedule_start_stop(reason=''):
+    """按配置（重新）注册每日定时启停任务，替代原先每 10 秒比对时分的轮询线程"""
+    scheduler.cancel_tag('start_stop')
+    time_config = read_config() or {}
+    if not time_config.get("everyday_start_stop_bot_switch"):
+        log('INFO', f'{reason}定时启停未启用')
+        return
+    try:
+        start_t = datetime.strptime(time_config.get("everyday_start_bot_time", "08:00"), "%H:%M")
+        stop_t = datetime.strptime(time_config.get("everyday_stop_bot_time", "23:00"), "%H:%M")
+    except (TypeError, ValueError) as e:
+        log('ERROR', f'定时启停时间格式错误: {str(e)}')
+        return
+    # 错过触发 5 分钟以上（如电脑休眠）则跳过当天，避免醒来后误启停
+    scheduler.cron(f"{start_t.minute} {start_t.hour} * * *", _scheduled_start,
+                   name='everyday_start_bot', tag='start_stop', misfire='skip', grace=300)
+    scheduler.cron(f"{stop_t.minute} {stop_t.hour} * * *", _scheduled_stop,
+                   name='everyday_stop_bot', tag='start_stop', misfire='skip', grace=300)
+    log('INFO', f'{reason}启动定时启停任务，启动时间：{start_t:%H:%M}，停止时间：{stop_t:%H:%M}')
+
 def time_start_stop():
     """定时启停"""
-    def is_target_time(target_hour, target_minute):
-        """
-        校验当前时间是否匹配指定的小时和分钟
-        """
-        # 获取当前本地时间
-        now = datetime.now()
-        # 比较小时和分钟是否匹配
-        return (now.hour == target_hour) and (now.minute == target_minute)
-    def time_check_thread():
-        """定时检查线程"""
-        global bot_thread, bot, update_config_status
-        # 读取配置文件
-        time_config = read_config()
-        everyday_start_stop_bot_switch = time_config.get("everyday_start_stop_bot_switch")
-        start_hour = datetime.strptime(time_config.get("everyday_start_bot_time"), "%H:%M").hour
-        start_minute = datetime.strptime(time_config.get("everyday_start_bot_time"), "%H:%M").minute
-        stop_hour = datetime.strptime(time_config.get("everyday_stop_bot_time"), "%H:%M").hour
-        stop_minute = datetime.strptime(time_config.get("everyday_stop_bot_time"), "%H:%M").minute
-        if everyday_start_stop_bot_switch:
-            log('INFO', f'启动定时启停线程，启动时间：{start_hour}:{start_minute}，停止时间：{stop_hour}:{stop_minute}')
-        else:
-            log('INFO', '定时启停未启用，未启用')
-
-        while True:
-            if update_config_status: # 保存配置后更新定时启停状态
-                update_config_status = False
-                time_config = read_config()
-                everyday_start_stop_bot_switch = time_config.get("everyday_start_stop_bot_switch")
-                start_hour = datetime.strptime(time_config.get("everyday_start_bot_time"), "%H:%M").hour
-                start_minute = datetime.strptime(time_config.get("everyday_start_bot_time"), "%H:%M").minute
-                stop_hour = datetime.strptime(time_config.get("everyday_stop_bot_time"), "%H:%M").hour
-                stop_minute = datetime.strptime(time_config.get("everyday_stop_bot_time"), "%H:%M").minute
-                if everyday_start_stop_bot_switch:
-                    log('INFO', f'配置更新，启动定时启停线程，启动时间：{start_hour}:{start_minute}，停止时间：{stop_hour}:{stop_minute}')
-                else:
-                    log('INFO', '配置更新，定时启停未启用')
-            if everyday_start_stop_bot_switch:
-                if is_target_time(start_hour, start_minute): # 启动时间
-                    log('INFO', '到达预定启动时间，正在启动机器人')
-                    if bot_thread and bot_thread.is_alive():
-                        log("WARNING", "状态：机器人已在运行")
-                        email_send.send_email(subject="定时启动机器人", content="机器人已在运行，无需启动")
-                    else:
-                        def run_bot():
-                            pythoncom.CoInitialize()  # 防止多线程调用COM组件时出错
-                            global bot
-                            bot = WXBot()
-                            bot.run()
-                            pythoncom.CoUninitialize()  # 释放COM组件
-                        try:
-                            bot_thread = threading.Thread(target=run_bot, daemon=True)
-                            bot_thread.start()
-                            email_send.send_email(subject="定时启动机器人", content="机器人已启动")
-                        except Exception as e:
-                            log('ERROR', f'启动机器人失败: {str(e)}')
-                    time.sleep(60) # 防止一分钟内重复启动
-                if is_target_time(stop_hour, stop_minute): # 停止时间
-                    log('INFO', '到达预定停止时间，正在停止机器人')
-                    if bot_thread and bot_thread.is_alive():
-                        if bot.stop_wxbot():  # 调用停止函数并检查返回值
-                            log('SUCCESS', '机器人已停止')
-                            bot_thread = None
-                            bot = None
-                            email_send.send_email(subject="定时停止机器人", content="机器人已停止")
-                        else:
-                            log('ERROR', '停止机器人失败')
-                    else:
-                        log('WARNING', '状态：机器人未运行')
-                        email_send.send_email(subject="定时停止机器人", content="机器人未运行，无需停止")
-                    time.sleep(60) # 防止一分钟内重复停止
-            time.sleep(10)
-    
-    time_thread = threading.Thread(target=time_check_thread, daemon=True)
-    time_thread.start()
+    schedule_start_stop()
+    scheduler.start()
+
 def find_free_port(start_port=10001, max_port=11000):
     """从 start_port 开始寻找空闲端口"""
     for port in range(start_port, max_port):
@@ -442,7 +683,30 @@ def find_free_port(start_port=10001, max_port=11000):
     raise RuntimeError("未找到可用端口")
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='机器人管理网页')
+    parser.add_argument('--prod', action='store_true', help='生产模式：多线程 WSGI 服务 + gzip 压缩 + 静态资源缓存')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=0, help='监听端口（默认从 10001 起自动选择空闲端口）')
+    parser.add_argument('--threads', type=int, default=8, help='生产模式的工作线程数')
+    parser.add_argument('--no-browser', action='store_true', help='启动后不自动打开浏览器')
+    return parser.parse_args(argv)
+
+def serve_production(host, port, threads):
+    """生产模式：优先使用 waitress（纯 Python，可随 PyInstaller 打包），否则退回 werkzeug 多线程服务"""
+    serve_options['gzip'] = True
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+    try:
+        from waitress import serve
+        log('INFO', f'生产模式：waitress，{threads} 个工作线程')
+        serve(app, host=host, port=port, threads=threads)
+    except ImportError:
+        from werkzeug.serving import make_server
+        log('INFO', '生产模式：未安装 waitress，使用 werkzeug 多线程服务')
+        make_server(host, port, app, threaded=True).serve_forever()
+
+def main(argv=None):
+    args = parse_args(argv)
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
@@ -456,14 +720,18 @@ def main():
             log('WARNING', '配置文件不存在，已创建空配置文件')
         log('INFO', '服务5s后启动')
         # 动态选择端口
-        free_port = find_free_port(10001, 11000)
+        free_port = args.port or find_free_port(10001, 11000)
         log('INFO', f'请访问 http://localhost:{free_port} 或者 http://127.0.0.1:{free_port} 进行登录')
         # 启动后自动打开浏览器
-        webbrowser.open(f"http://127.0.0.1:{free_port}")
+        if not args.no_browser:
+            webbrowser.open(f"http://127.0.0.1:{free_port}")
         # 定时启停
         time_start_stop()
         # 启动服务器
-        app.run(host='0.0.0.0', port=free_port, debug=False)
+        if args.prod:
+            serve_production(args.host, free_port, args.threads)
+        else:
+            app.run(host=args.host, port=free_port, debug=False)
     except Exception as e:
         log('ERROR', f'服务器启动失败: {str(e)}')
     finally:
@@ -16,9 +16,27 @@ import traceback
 import random
 import threading
 import importlib.util
+from collections import deque
 from datetime import datetime
 from typing import List, Dict, Any
 
+import logger
+from logger import get_logger
+from scheduler import Scheduler
+from keyword_engine import KeywordReplyEngine
+from onboarding import OnboardingQueue
+from chat_cache import ChatMetaCache
+from ratelimit import MessageRateLimiter
+from inbound import InboundScheduler
+from context import Context, CancelToken
+from state_store import StateStore
+from config_schema import plugin_settings
+from hang_watch import Watchdog
+from remote_plugins import RemotePluginPool
+import memstats
+import outbound
+from outbound import send_text
+
 # ====== 依赖 wxautox ======
 try:
     from wxautox import WeChat
@@ -28,47 +46,16 @@ try:
     WXAUTO_AVAILABLE = True
 except Exception as e:
     WXAUTO_AVAILABLE = False
+    SystemMessage = None
 
-# ====== 日志模块（复用你之前的 log 实现） ======
-LOG_PATH = "./logs"
-if not os.path.exists(LOG_PATH):
-    try:
-        os.makedirs(LOG_PATH, exist_ok=True)
-    except Exception:
-        pass
-
-# 内存日志（网页管理控制台可使用）
-log_messages = []
-
-def log_server(level, msg):
-    """
-    记录日志到内存和文件（简易内存缓存 + 本地文件）
-    """
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    entry = {'time': timestamp, 'level': level, 'message': msg}
-    log_messages.append(entry)
-    # 限制内存日志长度
-    if len(log_messages) > 2000:
-        log_messages.pop(0)
-    # 输出控制台
-    print(f"[{timestamp}] [{level}] {msg}")
-    # 写文件
-    try:
-        now_day = datetime.now().strftime("%y%m%d")
-        with open(os.path.join(LOG_PATH, f'log_{now_day}.txt'), 'a', encoding='utf-8-sig') as f:
-            f.write(f'[{timestamp}] [{level}] {msg}\n')
-    except Exception:
-        # 若写文件失败，尽量创建目录再写
-        try:
-            os.makedirs(LOG_PATH, exist_ok=True)
-            with open(os.path.join(LOG_PATH, f'log_{now_day}.txt'), 'a', encoding='utf-8-sig') as f:
-                f.write(f'[{timestamp}] [{level}] {msg}\n')
-        except Exception:
-            print(f"[{timestamp}] [ERROR] 无法写入日志文件")
+# ====== 日志模块（统一日志系统 logger.py） ======
+_log = get_logger("wxbot")
+# 每条消息的明细日志单独一个模块名，可在 log_levels 中单独调低/关闭
+_msg_log = get_logger("wxbot.messages")
 
 def log(message="", level="INFO"):
-    """统一日志接口"""
-    log_server(level, str(message))
+    """统一日志接口（保留主程序原有的 log(message, level) 调用方式）"""
+    _log.log(level, message)
 
 # ====== 全局参数调整（与 wxautox 一致可配置） ======
 try:
@@ -94,12 +81,53 @@ class WXBotConfig:
             "group_welcome": False,
             "group_welcome_random": 1.0,
             "group_welcome_msg": "欢迎新朋友！请先查看群公告！本消息由wxautox发送!",
+            "group_welcome_window": 8,  # 入群欢迎合并窗口（秒），窗口内的新人合并为一条欢迎
             "new_friend_switch": False,
             "new_friend_msg": [],
-            # 插件相关配置（网页端会用到）
+            # 关键词自动回复（键可加前缀 "=" 精确 / "^" 前缀，默认按 keyword_match_mode 匹配）
+            "chat_keyword_switch": False,
+            "group_keyword_switch": False,
+            "keyword_match_mode": "contains",  # exact / prefix / contains
+            "keyword_dict": {},
+            "outbound_max_len": 2000,  # 单条消息最大长度，超出按条目/行边界切分发送
+            # 回复合并：插件以 coalesce 键发送的回复，window 秒内同一聊天只发一次并 @ 所有请求者（先等 hold 秒）
+            "reply_coalesce": {"enabled": True, "window": 60, "hold": 2.0, "ref_text": "↑ 同上"},
+            "reply_deadline": 180,  # 单条消息的处理截止时间（秒），超时后插件的请求与回复被取消
+            # 限流（令牌桶，rate 为每秒条数）：按发送者/聊天/插件，缺省字段见 ratelimit.DEFAULTS
+            "rate_limit": {
+                "enabled": True,
+                "sender": {"rate": 0.2, "burst": 5},
+                "chat": {"rate": 1.0, "burst": 20},
+                "plugins": {},
+                "notify": True
+            },
+            # 入站优先级调度：admin > private > mention(@机器人) > group，积压过多时丢弃过期群消息
+            # batch_size > 1 时积压的消息成批分发（插件可实现 check_batch 一次检查整批）
+            "inbound": {
+                "weights": {"admin": 8, "private": 4, "mention": 4, "group": 1},
+                "max_backlog": 200,
+                "stale_seconds": 60,
+                "batch_size": 1
+            },
+            # 插件会话状态：总条数/字节上限（LRU 淘汰）、默认有效期、可选定期快照到 state_store.json
+            "state_store": {"max_entries": 10000, "max_bytes": 8388608, "default_ttl": 3600,
+                            "snapshot": False, "snapshot_interval": 300},
+            # 卡死检测：回调/工作线程单次处理超过 threshold 秒时转储线程栈并在网页端标记，可选重启监听
+            "watchdog": {"enabled": True, "threshold": 90, "interval": 5, "dump_stacks": True,
+                         "restart_listener": False},
+            # 远程插件执行：把列出的插件交给其他机器上的工作进程（python remote_plugins.py --listen ...），不可用时本机执行
+            "remote_plugins": {"enabled": False, "workers": [], "plugins": [], "token": "",
+                               "ack_timeout": 2.0, "heartbeat": 5.0},
+            # 日志级别：模块名 -> 级别（"" 为全局默认，如 {"": "INFO", "plugins.search_plugin": "DEBUG"}）
+            "log_levels": {"": "INFO"},
+            # 插件设置：插件文件名 -> {字段: 值}，字段由插件的 SETTINGS 声明，保存后热更新
+            # 可另加 "rate_limit": {"rate", "burst"} 覆盖该插件的限流
             "plugins": {
-                # "search_plugin": 1
+                # "search_plugin": {"timeout": 60, "retries": 1, "page_size": 5}
             },
+            # 微信后端："wxautox"（真实客户端，仅 Windows）/ "sim"（无界面模拟，压测用，参数见 wxsim.DEFAULTS）
+            "backend": "wxautox",
+            "sim": {"latency": 0.05, "jitter": 0.02, "failure_rate": 0.0},
             # 企业微信推送（选项保留，邮件去掉）
             "notify_method": "wechat",  # "wechat" or ""（空为不推送）
             "wechat_notify": {
@@ -142,6 +170,13 @@ class WXBotConfig:
                 except Exception as ex:
                     log(f"重建配置失败: {ex}", level="ERROR")
 
+    def mtime(self):
+        """配置文件修改时间（用于检测网页端保存）"""
+        try:
+            return os.path.getmtime(self.CONFIG_FILE)
+        except OSError:
+            return 0.0
+
     def save(self):
         try:
             with open(self.CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -179,6 +214,106 @@ class WXBotConfig:
     def group_welcome_msg(self):
         return self.config.get("group_welcome_msg", "")
 
+    @property
+    def group_welcome_random(self):
+        try:
+            return min(1.0, max(0.0, float(self.config.get("group_welcome_random", 1.0))))
+        except (TypeError, ValueError):
+            return 1.0
+
+    @property
+    def group_welcome_window(self):
+        try:
+            return max(0.0, float(self.config.get("group_welcome_window", 8)))
+        except (TypeError, ValueError):
+            return 8.0
+
+    @property
+    def group_reply_at(self):
+        return self.config.get("group_reply_at", False)
+
+    @property
+    def new_friend_switch(self):
+        return self.config.get("new_friend_switch", False)
+
+    @property
+    def new_friend_msg(self):
+        return self.config.get("new_friend_msg", [])
+
+    @property
+    def chat_keyword_switch(self):
+        return self.config.get("chat_keyword_switch", False)
+
+    @property
+    def group_keyword_switch(self):
+        return self.config.get("group_keyword_switch", False)
+
+    @property
+    def keyword_match_mode(self):
+        return self.config.get("keyword_match_mode", "contains")
+
+    @property
+    def outbound_max_len(self):
+        return self.config.get("outbound_max_len", 2000)
+
+    @property
+    def reply_coalesce(self):
+        rc = self.config.get("reply_coalesce", {})
+        return rc if isinstance(rc, dict) else {}
+
+    @property
+    def reply_deadline(self):
+        return self.config.get("reply_deadline", 180)
+
+    @property
+    def rate_limit(self):
+        rl = self.config.get("rate_limit", {})
+        return rl if isinstance(rl, dict) else {}
+
+    @property
+    def inbound(self):
+        ib = self.config.get("inbound", {})
+        return ib if isinstance(ib, dict) else {}
+
+    @property
+    def backend(self):
+        return os.environ.get("WXBOT_BACKEND") or self.config.get("backend", "wxautox")
+
+    @property
+    def sim(self):
+        s = self.config.get("sim", {})
+        return s if isinstance(s, dict) else {}
+
+    @property
+    def state_store(self):
+        ss = self.config.get("state_store", {})
+        return ss if isinstance(ss, dict) else {}
+
+    @property
+    def watchdog(self):
+        wd = self.config.get("watchdog", {})
+        return wd if isinstance(wd, dict) else {}
+
+    @property
+    def remote_plugins(self):
+        rp = self.config.get("remote_plugins", {})
+        return rp if isinstance(rp, dict) else {}
+
+    @property
+    def plugins(self):
+        ps = self.config.get("plugins", {})
+        return ps if isinstance(ps, dict) else {}
+
+    @property
+    def log_levels(self):
+        lv = self.config.get("log_levels", {})
+        return lv if isinstance(lv, dict) else {}
+
+    @property
+    def keyword_dict(self):
+        kd = self.config.get("keyword_dict", {})
+        return kd if isinstance(kd, dict) else {}
+
     def update(self, key, value):
         self.config[key] = value
         self.save()
@@ -192,14 +327,31 @@ class PluginManager:
     - PLUGIN_ENABLED: int (1 开启, 0 关闭)
     - PLUGIN_PRIORITY: int (优先级, 大的先执行)
     - def check(msg, chat, chat_info) -> (bool, data)  # 是否匹配
+    - def check_batch(batch) -> [(bool, data), ...]  # 可选，批量模式下一次检查整批 [(msg, chat, chat_info), ...]
     - def handle(msg, chat, chat_info, data) -> WxResponse | None  # 执行处理
+    - def register_jobs(scheduler)  # 可选，机器人启动时注册定时任务（见 scheduler.Scheduler）
+    - SETTINGS: dict  # 可选，可调设置声明 {字段: {"type", "default", "min", "max"...}}，格式同 config_schema.FIELDS
+    - def on_settings(settings)  # 可选，加载时及 config.json 的 plugins 段变化时以完整设置调用
+    - remote_plugins 中列出的插件：check 在本机执行，handle 由工作进程执行（data 需可 JSON 序列化），工作进程不可用时本机执行
+    - chat_info['state']：调用 check/handle 时注入的会话状态视图（state_store.StateScope，按插件/聊天/发送者隔离）
     主程序调用逻辑：
     - 按 PLUGIN_PRIORITY 降序遍历已加载并启用的插件
     - 对每个插件调用 check，若返回 (True, data)，则调用 handle 并终止后续处理（插件表明已处理）
     """
-    def __init__(self, plugins_dir: str = "./plugins"):
+    def __init__(self, plugins_dir: str = "./plugins", admit=None, state_store=None, settings=None, monitor=None,
+                 remote=None):
         self.plugins_dir = plugins_dir
-        self.plugins = []  # 每项为 dict: {'name':..., 'module':..., 'priority':..., 'enabled':...}
+        self.plugins = []  # 每项为 dict: {'name':..., 'key':..., 'module':..., 'priority':..., 'enabled':..., 'settings':...}
+        # 准入检查（限流）：admit(plugin_name, chat, chat_info) -> bool，None 表示不限
+        self.admit = admit
+        # 插件会话状态存储（state_store.StateStore），None 表示不提供 chat_info['state']
+        self.state_store = state_store
+        # config.json 的 plugins 段（插件文件名 -> 设置）
+        self.settings_config = settings or {}
+        # 卡死检测（hang_watch.Watchdog）：记录当前正在执行的插件，卡死报告中可见
+        self.monitor = monitor
+        # 远程执行（remote_plugins.RemotePluginPool），None 表示全部本机执行
+        self.remote = remote
         self.load_plugins()
 
     def load_plugins(self):
@@ -229,10 +381,12 @@ class PluginManager:
                 p_priority = int(getattr(module, "PLUGIN_PRIORITY", 50))
                 self.plugins.append({
                     "name": p_name,
+                    "key": modulename,
                     "module": module,
                     "priority": p_priority,
                     "enabled": bool(p_enabled),
-                    "path": fpath
+                    "path": fpath,
+                    "settings": None
                 })
                 log(f"加载插件: {p_name} (enabled={p_enabled}, priority={p_priority})")
             except Exception as e:
@@ -240,76 +394,324 @@ class PluginManager:
                 log(traceback.format_exc(), level="ERROR")
         # 按优先级排序（降序）
         self.plugins.sort(key=lambda x: x["priority"], reverse=True)
+        self.apply_settings(self.settings_config)
         log(f"插件加载完成，共 {len(self.plugins)} 个插件（包含未启用）")
 
+    def _raw_settings(self, p, section):
+        """插件在 plugins 段中的配置：按文件名查找，其次按 PLUGIN_NAME"""
+        raw = section.get(p["key"], section.get(p["name"]))
+        return raw if isinstance(raw, dict) else {}
+
+    def apply_settings(self, section):
+        """按 plugins 段计算各插件的设置，有变化时调用插件的 on_settings(settings)"""
+        self.settings_config = section or {}
+        for p in self.plugins:
+            declared = getattr(p["module"], "SETTINGS", None)
+            if not isinstance(declared, dict):
+                continue
+            values, errors = plugin_settings(declared, self._raw_settings(p, self.settings_config))
+            for field, err in errors.items():
+                log(f"插件 {p['name']} 设置 {field} 无效（{err}），使用默认值", level="WARNING")
+            if values == p["settings"]:
+                continue
+            p["settings"] = values
+            on_settings = getattr(p["module"], "on_settings", None)
+            if callable(on_settings):
+                try:
+                    on_settings(dict(values))
+                except Exception as e:
+                    log(f"插件 {p['name']} 应用设置出错: {e}", level="ERROR")
+                    log(traceback.format_exc(), level="ERROR")
+
+    def rate_limit_specs(self):
+        """plugins 段中各插件的 rate_limit 覆盖，键为插件名（与限流器一致）"""
+        specs = {}
+        for p in self.plugins:
+            rl = self._raw_settings(p, self.settings_config).get("rate_limit")
+            if isinstance(rl, dict):
+                specs[p["name"]] = rl
+        return specs
+
     def reload_plugins(self):
         """重新加载插件（可由外部命令调用）"""
         self.plugins = []
         self.load_plugins()
 
-    def dispatch(self, msg, chat, chat_info):
+    def _scoped(self, p, chat_info):
+        """每个插件拿到自己的状态视图（浅拷贝 chat_info，避免视图串到其他插件）"""
+        if self.state_store is None:
+            return chat_info
+        return {**chat_info, 'state': self.state_store.scope(p["name"], chat_info.get('name'), chat_info.get('sender'))}
+
+    def _run(self, p, msg, chat, chat_info, data):
+        """匹配后的准入检查与 handle 调用（远程插件先交给工作进程），返回分发结果"""
+        if self.admit is not None and not self.admit(p["name"], chat, chat_info):
+            # 被限流：视为已处理，不再交给后续插件
+            return {"plugin": p["name"], "result": None, "throttled": True}
+        if self.remote is not None and self.remote.handles(p) and self.remote.run(p, msg, chat, chat_info, data):
+            log(f"插件 {p['name']} 匹配消息，交给工作进程执行", level="INFO")
+            return {"plugin": p["name"], "result": True, "remote": True}
+        log(f"插件 {p['name']} 匹配消息，调用 handle()", level="INFO")
+        handle_fn = getattr(p["module"], "handle", None)
+        if not callable(handle_fn):
+            # 模块没有 handle 函数，仅标记为匹配并返回
+            return {"plugin": p["name"], "result": None}
+        try:
+            result = handle_fn(msg, chat, chat_info, data)
+            # 如果插件返回非 None，视为已处理（可返回具体 WxResponse）
+            return {"plugin": p["name"], "result": result}
+        except Exception as e:
+            log(f"插件 {p['name']} 执行 handle() 出错: {e}", level="ERROR")
+            log(traceback.format_exc(), level="ERROR")
+            return {"plugin": p["name"], "result": None}
+
+    def dispatch(self, msg, chat, chat_info, checked=None):
         """
         将消息分发给插件处理。按优先级顺序尝试。
         如果插件匹配并处理了消息，返回该插件的处理结果（或 True 表示已处理）。
         若无插件处理，返回 None。
+        checked：{插件 key: (matched, data)}，批量模式下已由 check_batch 得到的结果，这些插件不再调用 check
         """
         for p in self.plugins:
             if not p["enabled"]:
                 continue
-            module = p["module"]
+            if self.monitor is not None:
+                self.monitor.note(f"插件 {p['name']}（{chat_info.get('name')}）")
+            scoped = self._scoped(p, chat_info)
             try:
-                check_fn = getattr(module, "check", None)
-                handle_fn = getattr(module, "handle", None)
-                if callable(check_fn):
-                    matched, data = check_fn(msg, chat, chat_info)
-                    if matched:
-                        log(f"插件 {p['name']} 匹配消息，调用 handle()", level="INFO")
-                        if callable(handle_fn):
-                            try:
-                                result = handle_fn(msg, chat, chat_info, data)
-                                # 如果插件返回非 None，视为已处理（可返回具体 WxResponse）
-                                return {"plugin": p["name"], "result": result}
-                            except Exception as e:
-                                log(f"插件 {p['name']} 执行 handle() 出错: {e}", level="ERROR")
-                                log(traceback.format_exc(), level="ERROR")
-                                return {"plugin": p["name"], "result": None}
-                        else:
-                            # 模块没有 handle 函数，仅标记为匹配并返回
-                            return {"plugin": p["name"], "result": None}
+                if checked is not None and p["key"] in checked:
+                    matched, data = checked[p["key"]]
+                elif callable(getattr(p["module"], "check", None)):
+                    matched, data = p["module"].check(msg, chat, scoped)
                 else:
                     # 没有 check 函数，忽略
                     continue
+                if matched:
+                    return self._run(p, msg, chat, scoped, data)
             except Exception as e:
                 log(f"插件 {p['name']} 处理异常: {e}", level="ERROR")
                 log(traceback.format_exc(), level="ERROR")
         return None
 
+    def _check_batch(self, p, batch):
+        """调用插件的 check_batch，返回与 batch 等长的 [(matched, data)]；不支持或出错返回 None（逐条 check）"""
+        fn = getattr(p["module"], "check_batch", None)
+        if not callable(fn):
+            return None
+        try:
+            results = list(fn([(msg, chat, self._scoped(p, info)) for msg, chat, info in batch]))
+        except Exception as e:
+            log(f"插件 {p['name']} 执行 check_batch() 出错，改为逐条检查: {e}", level="ERROR")
+            log(traceback.format_exc(), level="ERROR")
+            return None
+        if len(results) != len(batch):
+            log(f"插件 {p['name']} 的 check_batch() 返回 {len(results)} 项（应为 {len(batch)}），改为逐条检查",
+                level="ERROR")
+            return None
+        return results
+
+    def dispatch_batch(self, batch):
+        """
+        批量分发：batch 为 [(msg, chat, chat_info), ...]，返回与之等长的分发结果列表
+        - 提供 check_batch 的插件对整批只调用一次，其余插件仍逐条调用 check
+        - 消息按原顺序逐条执行 handle，优先级与 dispatch 一致（每条消息由最高优先级的匹配插件处理）
+        - check_batch 在整批 handle 之前执行，不应依赖同批前面消息的 handle 写入的状态
+        """
+        checked = [{} for _ in batch]
+        for p in self.plugins:
+            if not p["enabled"]:
+                continue
+            results = self._check_batch(p, batch)
+            if results is None:
+                continue
+            for per_msg, res in zip(checked, results):
+                per_msg[p["key"]] = res if isinstance(res, tuple) and len(res) == 2 else (False, None)
+        return [self.dispatch(msg, chat, chat_info, checked=c) for (msg, chat, chat_info), c in zip(batch, checked)]
+
+    def register_jobs(self, scheduler):
+        """调用已启用插件的 register_jobs(scheduler)，由插件自行注册定时任务"""
+        for p in self.plugins:
+            if not p["enabled"]:
+                continue
+            register_fn = getattr(p["module"], "register_jobs", None)
+            if not callable(register_fn):
+                continue
+            try:
+                register_fn(scheduler)
+                log(f"插件 {p['name']} 已注册定时任务")
+            except Exception as e:
+                log(f"插件 {p['name']} 注册定时任务失败: {e}", level="ERROR")
+                log(traceback.format_exc(), level="ERROR")
+
     def list_plugins(self):
-        return [{"name": p["name"], "enabled": p["enabled"], "priority": p["priority"], "path": p["path"]} for p in self.plugins]
+        return [{"name": p["name"], "key": p["key"], "enabled": p["enabled"], "priority": p["priority"],
+                 "path": p["path"], "settings": p["settings"],
+                 "schema": getattr(p["module"], "SETTINGS", None)} for p in self.plugins]
+
+    def memory_stats(self):
+        """插件表大小（供 /api/memory 使用）"""
+        return memstats.measure({"plugins": list(self.plugins)})
+
+# ====== 入群欢迎合并发送 ======
+def is_system_msg(msg):
+    """是否为系统消息（入群提示等）"""
+    if getattr(msg, "attr", "") == "system":
+        return True
+    return SystemMessage is not None and isinstance(msg, SystemMessage)
+
+def parse_joiners(content):
+    """
+    从入群系统消息中提取新成员昵称，兼容：
+      "A"邀请"B"、"C"加入了群聊
+      "B"通过扫描"A"分享的二维码加入群聊
+    """
+    if "加入群聊" not in content and "加入了群聊" not in content:
+        return []
+    quoted = r'["“]([^"”]+)["”]'
+    if "邀请" in content:
+        return re.findall(quoted, content.split("邀请", 1)[1])
+    return re.findall(quoted, content)[:1]
+
+class GroupWelcomer:
+    """
+    入群欢迎：回调线程只负责登记新成员，窗口期结束后由调度器（未运行时由定时器线程）
+    合并发送一条 @ 全部新成员的欢迎语，并按 group_welcome_random 概率决定是否发送
+    """
+    MAX_AT_PER_MSG = 20  # 单条消息最多 @ 的人数
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._lock = threading.Lock()
+        self._pending = {}  # 群名 -> {'chat': Chat, 'names': [昵称], 'job': 待执行的合并发送任务}
+        self.batches = 0
+        self.joiners = 0
+
+    def add(self, group_name, chat, names):
+        """登记新成员（回调线程调用，立即返回）"""
+        with self._lock:
+            batch = self._pending.get(group_name)
+            if batch is None:
+                batch = self._pending[group_name] = {'chat': chat, 'names': [], 'job': None}
+            batch['chat'] = chat
+            for n in names:
+                if n not in batch['names']:
+                    batch['names'].append(n)
+            # 没有有效的发送任务时才安排（任务可能随调度器 clear() 被取消，需重新安排）
+            job = batch['job']
+            if job is not None and not getattr(job, 'cancelled', False):
+                return
+            scheduler = self.bot.scheduler
+            window = self.bot.config.group_welcome_window
+            if scheduler is not None:
+                batch['job'] = scheduler.after(window, self.flush, group_name, name="group_welcome", threaded=True)
+            else:
+                # 调度器未运行：同样等窗口期结束再合并发送，期间入群的成员并入同一批
+                timer = batch['job'] = threading.Timer(window, self.flush, args=(group_name,))
+                timer.name = "group_welcome"
+                timer.daemon = True
+                timer.start()
+
+    def clear(self):
+        """丢弃尚未发送的欢迎（机器人停止时调用，重启后不再欢迎停止前入群的成员）"""
+        with self._lock:
+            dropped = sum(len(b['names']) for b in self._pending.values())
+            for b in self._pending.values():
+                if isinstance(b['job'], threading.Timer):
+                    b['job'].cancel()  # 调度器任务随 scheduler.clear() 取消，定时器需单独取消
+            self._pending.clear()
+        if dropped:
+            log(f"机器人停止，丢弃 {dropped} 位新成员的待发欢迎", level="DEBUG")
+
+    def memory_stats(self):
+        """主要数据结构的条目数与估算字节数（持锁统计，供 /api/memory 使用）"""
+        with self._lock:
+            return memstats.measure({"pending": self._pending})
+
+    def flush(self, group_name):
+        with self._lock:
+            batch = self._pending.pop(group_name, None)
+        if not batch or not batch['names']:
+            return
+        names = batch['names']
+        self.batches += 1
+        self.joiners += len(names)
+        if random.random() >= self.bot.config.group_welcome_random:
+            log(f"群 {group_name} 新成员 {len(names)} 人，按欢迎概率本次不发送")
+            return
+        welcome = self.bot.config.group_welcome_msg
+        chat = batch['chat']
+        for i in range(0, len(names), self.MAX_AT_PER_MSG):
+            part = names[i:i + self.MAX_AT_PER_MSG]
+            try:
+                chat.SendMsg(msg=welcome, at=part)
+                log(f"群欢迎消息已发送：{group_name}，at: {'、'.join(part)}")
+            except Exception as e:
+                log(f"群欢迎消息 at 失败，改为直接发送: {e}", level="WARNING")
+                try:
+                    chat.SendMsg(welcome)
+                except Exception as ex:
+                    log(f"群欢迎消息发送失败: {ex}", level="ERROR")
 
 # ====== 微信机器人主类（简化/插件化） ======
 class WXBot:
-    def __init__(self):
+    def __init__(self, config_file: str = "config.json", plugins_dir: str = "./plugins"):
+        t0 = time.perf_counter()
         self.ver = version
         self.ver_log = version_log
-        self.config = WXBotConfig()
+        self.config = WXBotConfig(config_file)
         self.wx = None
-        self.plugin_mgr = PluginManager("./plugins")
+        self.backend = self.config.backend
+        # 限流：插件匹配后、执行 handle 前按发送者/聊天/插件检查令牌桶
+        self.rate_limiter = MessageRateLimiter(self.config.rate_limit)
+        # 卡死检测：回调、入站/发送线程、定时任务登记心跳，由看门狗线程检查
+        self.watchdog = Watchdog(self.config.watchdog, on_stuck=self._on_stuck, name="wxbot-watchdog")
+        self._listener_restarting = threading.Lock()
+        # 插件会话状态（按插件/聊天/发送者隔离，内存有上限），启用快照时恢复上次的记录
+        self.state_store = StateStore(self.config.state_store)
+        if self.state_store.snapshot_enabled:
+            self.state_store.restore()
+        # 远程插件工作进程池（未启用时不建立连接）
+        self.remote = RemotePluginPool(self.config.remote_plugins)
+        self.plugin_mgr = PluginManager(plugins_dir, admit=self.admit, state_store=self.state_store,
+                                        settings=self.config.plugins, monitor=self.watchdog, remote=self.remote)
+        self.rate_limiter.configure(self._rate_limit_config())
+        # 入站优先级调度：回调线程只分类入队，由工作线程按加权公平顺序处理
+        self.inbound = InboundScheduler(self.process_message, self.config.inbound, batch_handler=self.process_batch)
+        self.inbound.monitor = self.watchdog
+        outbound.sender.monitor = self.watchdog
+        # 关键词自动回复引擎（配置保存后后台重建并原子替换）
+        self.keyword_engine = KeywordReplyEngine(self.config.keyword_dict, self.config.keyword_match_mode)
+        self._config_mtime = self.config.mtime()
+        outbound.configure(max_len=self.config.outbound_max_len, coalesce=self.config.reply_coalesce)
+        logger.set_levels(self.config.log_levels)
+        self.welcomer = GroupWelcomer(self)
+        # 聊天元数据缓存（避免每条消息都调用 UI 接口获取聊天类型/名称）
+        self.chat_cache = ChatMetaCache()
+        # 新好友接待队列（持久化，按步骤定时执行）
+        self.onboarding = OnboardingQueue(self)
         self.run_flag = True
+        # 根取消令牌：每条消息的上下文（chat_info['ctx']）都挂在它下面，stop() 时统一取消
+        self.cancel_token = CancelToken()
+        self.scheduler = None  # 每次 main() 运行时创建，见 _setup_jobs
         self.start_time = datetime.now()
         self.callback_is_die = False
         self.all_Mode_listen_list = []  # 用于全局模式动态监听
-        # 监听初始化时设置的子窗口对象
+        # 监听初始化时设置的子窗口对象（名称 -> AddListenChat 返回值），停止时据此移除监听
         self.listen_windows = {}
+        # 启动耗时：首次为冷启动（含构造：读配置、加载插件、连接微信），之后 main() 复用实例为热启动
+        self.runs = 0
+        self.startups = deque(maxlen=20)
         # 其他必要初始化
-        if WXAUTO_AVAILABLE:
-            # Set wxautox params if needed
-            pass
-        else:
+        if self.backend == "sim":
+            log("使用无界面模拟后端（wxsim）", level="WARNING")
+        elif not WXAUTO_AVAILABLE:
             log("wxautox 未安装或无法导入，请确保 wxautox 可用！", level="WARNING")
+        self.init_seconds = time.perf_counter() - t0
 
     def check_wx_license(self):
         """校验 wxautox 授权（如可用）"""
+        if self.backend == "sim":
+            return True
         try:
             return check_license()
         except Exception:
@@ -319,12 +721,12 @@ class WXBot:
 
     def init_wechat(self):
         """初始化 WeChat 客户端并启动监听（若尚未初始化）"""
-        if not WXAUTO_AVAILABLE:
+        if self.backend != "sim" and not WXAUTO_AVAILABLE:
             log("wxautox 模块不可用，无法初始化微信客户端", level="ERROR")
             return False
         if not self.wx:
             try:
-                self.wx = WeChat()
+                self.wx = self._create_client()
                 self.wx.Show()
                 time.sleep(0.5)
                 log(f"已连接微信客户端: {self.wx.nickname}")
@@ -344,7 +746,7 @@ class WXBot:
         try:
             admin = self.config.admin
             if admin:
-                res = self.wx.AddListenChat(nickname=admin, callback=self.message_handle_callback)
+                res = self._add_listen(admin)
                 if res:
                     log(f"已为管理员 {admin} 添加监听")
                 else:
@@ -356,7 +758,7 @@ class WXBot:
         if not self.config.AllListen_switch:
             for name in self.config.listen_list:
                 try:
-                    res = self.wx.AddListenChat(nickname=name, callback=self.message_handle_callback)
+                    res = self._add_listen(name)
                     if res:
                         log(f"为用户 {name} 添加监听")
                 except Exception as e:
@@ -365,16 +767,36 @@ class WXBot:
         if self.config.group_switch:
             for g in self.config.group:
                 try:
-                    res = self.wx.AddListenChat(nickname=g, callback=self.message_handle_callback)
+                    res = self._add_listen(g)
                     if res:
                         log(f"为群组 {g} 添加监听")
                 except Exception as e:
                     log(f"为群组 {g} 添加监听失败: {e}", level="ERROR")
         return True
 
+    def _create_client(self):
+        """按 backend 创建微信客户端（sim 为无界面模拟，见 wxsim.py）"""
+        if self.backend == "sim":
+            import wxsim
+            return wxsim.WeChat(**self.config.sim)
+        return WeChat()
+
+    def _add_listen(self, name):
+        """添加监听并记录（热启动时 stop_listening 会先移除，避免重复监听）"""
+        res = self.wx.AddListenChat(nickname=name, callback=self.message_handle_callback)
+        if res:
+            self.listen_windows[name] = res
+        return res
+
     def stop_listening(self):
-        """停止微信监听"""
+        """移除已添加的监听并停止微信监听（保留微信连接，供下次热启动复用）"""
         if self.wx:
+            for name in list(self.listen_windows):
+                try:
+                    self.wx.RemoveListenChat(nickname=name)
+                except Exception as e:
+                    log(f"移除 {name} 的监听失败: {e}", level="WARNING")
+            self.listen_windows.clear()
             try:
                 self.wx.StopListening()
                 log("微信监听器已停止")
@@ -390,177 +812,390 @@ class WXBot:
             chat: Chat 对象（wxautox 子窗口）
         处理流程：
             1. 忽略自己发送的消息（msg.attr == 'self'）
-            2. 构造 chat_info (dict)，包含 type/name/sender/sender_remark 等
-            3. 将消息交给 PluginManager.dispatch 逐个插件判断处理（插件返回表示已处理则停止）
-            4. 若所有插件均未处理，执行默认行为（目前仅记录日志，可扩展为其他功能）
+            2. 构造 chat_info (dict)，包含 type/name/sender/sender_remark 等（聊天类型/名称来自 chat_cache）
+            3. 按优先级类别放入入站调度器后立即返回，由 process_message 在工作线程中处理
         """
+        # 卡死检测：UI 调用或缓存刷新卡住时由看门狗报告（可选重启监听）
+        with self.watchdog.track("callback", getattr(chat, "who", "")):
+            try:
+                # 基本日志（聊天类型/名称优先取缓存，未命中才调用 UI 接口）
+                meta = self.chat_cache.get(chat, msg)
+                chat_name = meta['name']
+                sender = getattr(msg, "sender", "")
+                sender_remark = getattr(msg, "sender_remark", "") if hasattr(msg, "sender_remark") else ""
+                _msg_log.info("类型：%s 属性：%s 窗口：%s 发送人：%s - 消息：%s",
+                              msg.type, msg.attr, chat_name, sender_remark or sender, getattr(msg, 'content', ''))
+
+                # 群改名、入群/退群等系统消息会改变聊天信息，标记缓存失效（下次访问时刷新）
+                if is_system_msg(msg):
+                    self.chat_cache.invalidate(chat)
+
+                # 忽略机器人自己发送的消息（避免循环）
+                if msg.attr == "self":
+                    log("忽略自己发送的消息", level="DEBUG")
+                    return
+
+                # 构造 chat_info 字典，传给插件
+                chat_info = {
+                    'type': meta['type'],
+                    'name': chat_name,
+                    'member_count': meta['member_count'],
+                }
+                chat_info['sender'] = sender
+                chat_info['sender_remark'] = sender_remark
+                chat_info['is_admin'] = bool(sender) and sender == self.config.admin
+                chat_info['msg_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                # 处理上下文：截止时间从收到消息起算（含排队时间），机器人停止时随根令牌取消
+                chat_info['ctx'] = Context.with_timeout(self.config.reply_deadline, self.cancel_token)
+
+                self.inbound.submit(self.classify(msg, chat_info), (msg, chat, chat_info))
+            except Exception as e:
+                log(f"回调处理出错: {e}", level="ERROR")
+                log(traceback.format_exc(), level="ERROR")
+
+    def classify(self, msg, chat_info):
+        """入站优先级分类：admin / private / mention / group"""
+        if chat_info.get('is_admin'):
+            return "admin"
+        if chat_info.get('type') != 'group':
+            return "private"
+        nickname = getattr(self.wx, "nickname", "") if self.wx else ""
+        if nickname and f"@{nickname}" in (getattr(msg, 'content', '') or ""):
+            return "mention"
+        return "group"
+
+    def process_message(self, item):
+        """
+        入站工作线程处理单条消息：
+            1. 交给 PluginManager.dispatch 逐个插件判断处理（插件返回表示已处理则停止）
+            2. 内置关键词自动回复
+            3. 若均未处理，执行默认行为（入群欢迎等）
+        """
+        msg, chat, chat_info = item
+        ctx = chat_info.get('ctx')
+        if ctx is not None and ctx.done:
+            log(f"消息已过期或机器人已停止，跳过处理：{chat_info['name']}", level="DEBUG")
+            return
         try:
-            # 基本日志
-            chat_name = getattr(chat, "who", None) or (chat.ChatInfo().get("chat_name") if hasattr(chat, "ChatInfo") else "unknown")
-            sender = getattr(msg, "sender", "")
-            sender_remark = getattr(msg, "sender_remark", "") if hasattr(msg, "sender_remark") else ""
-            log(f"{datetime.now().strftime('%Y/%m/%d %H:%M:%S')} 类型：{msg.type} 属性：{msg.attr} 窗口：{chat_name} 发送人：{sender_remark or sender} - 消息：{getattr(msg, 'content', '')}")
-
-            # 忽略机器人自己发送的消息（避免循环）
-            if msg.attr == "self":
-                log("忽略自己发送的消息", level="DEBUG")
-                return
+            # 先交给插件处理（插件按优先级顺序）
+            self.finish_message(msg, chat, chat_info, self.plugin_mgr.dispatch(msg, chat, chat_info))
+        except Exception as e:
+            log(f"消息处理出错: {e}", level="ERROR")
+            log(traceback.format_exc(), level="ERROR")
 
-            # 构造 chat_info 字典，传给插件
-            chat_info = {}
+    def process_batch(self, items):
+        """入站工作线程批量处理（inbound.batch_size > 1 且有积压时）：插件分发见 PluginManager.dispatch_batch"""
+        batch = []
+        for msg, chat, chat_info in items:
+            ctx = chat_info.get('ctx')
+            if ctx is not None and ctx.done:
+                log(f"消息已过期或机器人已停止，跳过处理：{chat_info['name']}", level="DEBUG")
+                continue
+            batch.append((msg, chat, chat_info))
+        if not batch:
+            return
+        try:
+            results = self.plugin_mgr.dispatch_batch(batch)
+        except Exception as e:
+            log(f"批量分发出错: {e}", level="ERROR")
+            log(traceback.format_exc(), level="ERROR")
+            return
+        for (msg, chat, chat_info), dispatch_res in zip(batch, results):
             try:
-                ci = msg.chat_info() if hasattr(msg, "chat_info") else {}
-                chat_info['type'] = ci.get('chat_type', 'friend') if isinstance(ci, dict) else 'friend'
-                chat_info['name'] = ci.get('chat_name', chat_name) if isinstance(ci, dict) else chat_name
-            except Exception:
-                chat_info['type'] = 'friend'
-                chat_info['name'] = chat_name
-            chat_info['sender'] = sender
-            chat_info['sender_remark'] = sender_remark
-            chat_info['msg_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.finish_message(msg, chat, chat_info, dispatch_res)
+            except Exception as e:
+                log(f"消息处理出错: {e}", level="ERROR")
+                log(traceback.format_exc(), level="ERROR")
 
-            # 先交给插件处理（插件按优先级顺序）
-            dispatch_res = self.plugin_mgr.dispatch(msg, chat, chat_info)
-            if dispatch_res is not None:
-                # 插件已处理（或至少匹配并执行）
-                plugin_name = dispatch_res.get("plugin")
-                log(f"消息由插件 {plugin_name} 处理完毕", level="INFO")
-                return
+    def finish_message(self, msg, chat, chat_info, dispatch_res):
+        """插件分发之后的处理：已被插件处理则结束，否则关键词回复与默认行为"""
+        if dispatch_res is not None:
+            # 插件已处理（或至少匹配并执行）
+            plugin_name = dispatch_res.get("plugin")
+            log(f"消息由插件 {plugin_name} 处理完毕", level="INFO")
+            return
 
-            # 若没有插件处理，则执行默认行为（目前仅记录日志；可以在此扩展为内置处理）
-            log(f"未被插件处理的消息：{chat_info['name']} - {getattr(msg, 'content', '')}", level="DEBUG")
+        # 内置关键词自动回复
+        if self.keyword_reply(msg, chat, chat_info):
+            return
 
-            # 群欢迎逻辑（如果是 system 消息并启用）
-            if isinstance(msg, SystemMessage) and self.config.group_welcome and chat_info.get('type') == 'group':
-                # 处理入群类 system 消息
-                try:
-                    content = getattr(msg, 'content', '') or ""
-                    # 简单匹配“加入群聊”或“加入了群聊”
-                    if "加入群聊" in content or "加入了群聊" in content:
-                        # 提取用户名（尽量兼容多种 system 文本）
-                        m = re.findall(r'"([^"]+)"', content)
-                        new_name = m[0] if m else None
-                        if new_name:
-                            time.sleep(3)
-                            try:
-                                chat.SendMsg(msg=self.config.group_welcome_msg, at=new_name)
-                                log(f"群欢迎消息已发送，at: {new_name}")
-                            except Exception:
-                                chat.SendMsg(self.config.group_welcome_msg)
-                                log("群欢迎消息发送（未能 at）")
-                except Exception as e:
-                    log(f"处理群欢迎消息失败: {e}", level="ERROR")
-            # 其他默认行为可在此处扩展
+        # 若没有插件处理，则执行默认行为（目前仅记录日志；可以在此扩展为内置处理）
+        log(f"未被插件处理的消息：{chat_info['name']} - {getattr(msg, 'content', '')}", level="DEBUG")
+
+        # 群欢迎逻辑（如果是 system 消息并启用）：仅登记，合并后异步发送
+        if is_system_msg(msg) and self.config.group_welcome and chat_info.get('type') == 'group':
+            names = parse_joiners(getattr(msg, 'content', '') or "")
+            if names:
+                self.welcomer.add(chat_info['name'], chat, names)
+        # 其他默认行为可在此处扩展
+
+    # ---------- 关键词自动回复 ----------
+    def keyword_reply(self, msg, chat, chat_info):
+        """按 keyword_dict 自动回复文本消息，已回复返回 True"""
+        if getattr(msg, "type", "") != "text":
+            return False
+        is_group = chat_info.get('type') == 'group'
+        if not (self.config.group_keyword_switch if is_group else self.config.chat_keyword_switch):
+            return False
+        reply = self.keyword_engine.match(getattr(msg, 'content', ''))
+        if reply is None:
+            return False
+        if not self.admit(None, chat, chat_info):
+            return True
+        try:
+            at = chat_info['sender'] if is_group and self.config.group_reply_at and chat_info.get('sender') else None
+            send_text(chat, reply, at=at, ctx=chat_info.get('ctx'))
+            log(f"关键词自动回复：{chat_info['name']} - {reply[:30]}")
         except Exception as e:
-            log(f"回调处理出错: {e}", level="ERROR")
-            log(traceback.format_exc(), level="ERROR")
+            log(f"关键词回复发送失败: {e}", level="ERROR")
+        return True
+
+    # ---------- 限流 ----------
+    def admit(self, plugin_name, chat, chat_info):
+        """
+        准入检查：管理员不限；其余按聊天、发送者、插件（plugin_name 为 None 时跳过）三级令牌桶
+        被限流时按配置回复一次「慢一点」提示，返回 False
+        """
+        if chat_info.get('is_admin'):
+            return True
+        chat_name, sender = chat_info.get('name', ''), chat_info.get('sender', '')
+        ok, scope = self.rate_limiter.allow_message(chat_name, sender)
+        if ok and plugin_name is not None and not self.rate_limiter.allow_plugin(plugin_name):
+            ok, scope = False, f"plugin:{plugin_name}"
+        if ok:
+            return True
+        log(f"消息被限流（{scope}）：{chat_name} - {sender}", level="WARNING")
+        if self.rate_limiter.should_notify(chat_name, sender):
+            at = sender if chat_info.get('type') == 'group' and sender else None
+            send_text(chat, self.rate_limiter.notify_msg, at=at)
+        return False
+
+    # ---------- 配置热更新 ----------
+    def reload_config(self):
+        """重新读取 config.json，并在后台重建依赖配置的组件（关键词自动机等）"""
+        self._config_mtime = self.config.mtime()
+        self.config.load_or_create()
+        self._apply_config()
+
+    def apply_config_diff(self, diff):
+        """
+        应用网页端推送的配置差异 {字段: {'old','new'}}，无需重新读取文件
+        只重建受影响的组件（例如关键词字典未变化时不重建自动机）
+        """
+        for key, change in diff.items():
+            self.config.config[key] = change['new']
+        self._config_mtime = self.config.mtime()
+        self._apply_config(set(diff))
+
+    def _apply_config(self, changed=None):
+        """按当前配置更新各组件；changed 为变化字段集合，None 表示全部"""
+        def touched(*keys):
+            return changed is None or any(k in changed for k in keys)
+        if touched("outbound_max_len"):
+            outbound.configure(max_len=self.config.outbound_max_len)
+        if touched("reply_coalesce"):
+            outbound.configure(coalesce=self.config.reply_coalesce)
+        if touched("plugins"):
+            self.plugin_mgr.apply_settings(self.config.plugins)
+        if touched("rate_limit", "plugins"):
+            self.rate_limiter.configure(self._rate_limit_config())
+        if touched("inbound"):
+            self.inbound.configure(self.config.inbound)
+        if touched("state_store"):
+            self.state_store.configure(self.config.state_store)
+        if touched("log_levels"):
+            logger.set_levels(self.config.log_levels)
+        if touched("watchdog"):
+            self.watchdog.configure(self.config.watchdog)
+        if touched("remote_plugins"):
+            self.remote.configure(self.config.remote_plugins)
+        if touched("keyword_dict", "keyword_match_mode"):
+            self.keyword_engine.rebuild_async(self.config.keyword_dict, self.config.keyword_match_mode)
+
+    def _rate_limit_config(self):
+        """rate_limit 段，合并 plugins 段中各插件的 rate_limit 覆盖"""
+        rl = dict(self.config.rate_limit)
+        overrides = self.plugin_mgr.rate_limit_specs()
+        if overrides:
+            rl["plugins"] = {**(rl.get("plugins") or {}), **overrides}
+        return rl
+
+    def watch_config(self):
+        """定时任务：配置文件被外部修改（如网页端保存）时热更新"""
+        if self.config.mtime() != self._config_mtime:
+            log("检测到配置文件变更，重新加载配置")
+            self.reload_config()
 
     # ---------- 新好友处理（定期执行） ----------
     def pass_new_friends(self):
-        """检查并自动通过新的好友申请（如果配置开启）"""
+        """检查新的好友申请并交给接待队列（通过、欢迎语等步骤由调度器按时执行，不阻塞）"""
         try:
-            if not self.wx:
-                return
-            if not self.config.new_friend_switch:
-                return
-            newfriends = self.wx.GetNewFriends(acceptable=True)
-            time.sleep(1)
-            if not newfriends:
-                return
-            log(f"发现 {len(newfriends)} 个新的好友申请")
-            for new in newfriends:
-                try:
-                    remark = new.name + "_机器人备注"
-                    new.accept(remark=remark)
-                    log(f"已接受好友：{new.name} 并备注为 {remark}")
-                    time.sleep(2)
-                    # 发送欢迎语
-                    for msg in self.config.new_friend_msg:
-                        if os.path.exists(msg) and os.path.isfile(msg):
-                            self.wx.SendFiles(who=remark, filepath=msg)
-                        else:
-                            self.wx.SendMsg(who=remark, msg=msg)
-                        time.sleep(random.randint(1, 3))
-                    self.wx.SwitchToChat()
-                    time.sleep(1)
-                    self.wx.SwitchToContact()
-                except Exception as e:
-                    log(f"处理新好友 {getattr(new,'name', '')} 失败: {e}", level="ERROR")
+            self.onboarding.poll()
         except Exception as e:
             log(f"自动处理新好友出错: {e}", level="ERROR")
             log(traceback.format_exc(), level="ERROR")
 
     # ---------- 主运行循环 ----------
     def main(self):
-        """主运行函数：初始化、启动监听并循环检查任务"""
-        log(f"wxbot 启动 - 版本: {self.ver}")
-        # 检查 wxautox 激活授权
-        activated = True
-        try:
-            activated = self.check_wx_license()
-        except Exception as e:
-            log(f"授权检查异常: {e}", level="WARNING")
-        if not activated:
-            log("wxautox 未激活，请激活后再运行", level="ERROR")
-            return False
+        """
+        主运行函数：初始化、启动监听并循环检查任务，stop() 后返回
+        同一实例可反复调用（热启动）：插件、缓存与微信连接保留，只重新添加监听
+        """
+        t0 = time.perf_counter()
+        warm = self.runs > 0
+        self.run_flag = True
+        log(f"wxbot {'热' if warm else '冷'}启动 - 版本: {self.ver}")
+        if warm:
+            self.watch_config()  # 停止期间的配置变更
+        else:
+            # 检查 wxautox 激活授权（仅首次）
+            activated = True
+            try:
+                activated = self.check_wx_license()
+            except Exception as e:
+                log(f"授权检查异常: {e}", level="WARNING")
+            if not activated:
+                log("wxautox 未激活，请激活后再运行", level="ERROR")
+                return False
+
+        # 上次 stop() 已取消根令牌，重新运行时换一个新的
+        if self.cancel_token.cancelled:
+            self.cancel_token = CancelToken()
+        # 先启动入站工作线程，监听器添加后即可开始处理消息
+        self.inbound.start()
 
         # 初始化微信客户端与监听器
         ok = self.init_wechat()
         if not ok:
             log("初始化微信失败，退出", level="ERROR")
+            self.inbound.stop()
             return False
 
-        # 主循环
-        self.run_flag = True
-        check_counter = 0
-        check_interval = 10
-        new_friend_counter = 0
+        # 主循环：所有周期任务交给调度器，线程空闲时睡到下一个任务到期
+        self.scheduler = Scheduler("wxbot")
+        self.scheduler.monitor = self.watchdog
+        self._setup_jobs()
+        self.watchdog.start()
+        self._record_startup(warm, time.perf_counter() - t0)
+        if not self.run_flag:
+            self.scheduler.stop()  # 启动过程中已收到 stop()
         try:
-            while self.run_flag:
-                try:
-                    # 定期检查微信是否在线
-                    check_counter += 1
-                    if check_counter >= check_interval:
-                        check_counter = 0
-                        try:
-                            if self.wx and not self.wx.IsOnline():
-                                log("检测到微信客户端不在线，请检查登录状态", level="ERROR")
-                                # 此处不直接退出，但记录并继续
-                        except Exception as e:
-                            log(f"检测微信在线状态出错: {e}", level="ERROR")
-
-                    # 定期处理新好友
-                    new_friend_counter += 1
-                    if new_friend_counter >= 60:  # 约每分钟检查一次（可 ajustar）
-                        new_friend_counter = 0
-                        try:
-                            self.pass_new_friends()
-                        except Exception as e:
-                            log(f"自动接受新好友出错: {e}", level="ERROR")
-
-                    # 这里不再处理 AI 或 GetNextNewMessage，所有处理通过 AddListenChat 的回调完成
-                    # 运行中的其他定时任务（例如 config.everyday_msg）可以在插件中实现
-                except Exception as e:
-                    log(f"主循环内部错误: {e}", level="ERROR")
-                    log(traceback.format_exc(), level="ERROR")
-                time.sleep(1)
+            self.scheduler.run()
         except KeyboardInterrupt:
             log("接收到中断信号，正在停止...")
             self.stop_listening()
         except Exception as e:
             log(f"主线程异常退出: {e}", level="ERROR")
             log(traceback.format_exc(), level="ERROR")
+        finally:
+            self.scheduler.clear()
+            self.welcomer.clear()
+            self.watchdog.stop()
+            self.inbound.stop()
+            if self.state_store.snapshot_enabled:
+                self.state_store.snapshot()
         log("主线程安全退出")
         return True
 
+    def _setup_jobs(self):
+        """注册主程序定时任务：在线检测、新好友处理，以及插件自带的定时任务"""
+        self.scheduler.every(10, self.check_online, name="check_online")
+        self.scheduler.every(60, self.pass_new_friends, name="pass_new_friends", jitter=5)
+        self.scheduler.every(5, self.watch_config, name="watch_config")
+        self.onboarding.schedule_pump()  # 继续执行上次未完成的接待步骤
+        self.state_store.schedule_snapshot(self.scheduler)
+        # 运行中的其他定时任务（例如 config.everyday_msg）由插件通过 register_jobs 注册
+        self.plugin_mgr.register_jobs(self.scheduler)
+
+    def _record_startup(self, warm, seconds):
+        """记录启动耗时（冷启动计入构造耗时）"""
+        self.runs += 1
+        total = seconds if warm else seconds + self.init_seconds
+        self.startups.append({"mode": "warm" if warm else "cold", "seconds": round(total, 3),
+                              "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        log(f"机器人{'热' if warm else '冷'}启动完成，耗时 {total:.2f}s")
+
+    def startup_stats(self):
+        cold = [s["seconds"] for s in self.startups if s["mode"] == "cold"]
+        warm = [s["seconds"] for s in self.startups if s["mode"] == "warm"]
+        return {
+            "runs": self.runs,
+            "cold_seconds": cold[-1] if cold else None,
+            "warm_avg_seconds": round(sum(warm) / len(warm), 3) if warm else None,
+            "recent": list(self.startups),
+        }
+
+    def _on_stuck(self, component, detail):
+        """看门狗回调（看门狗线程中调用）：监听回调卡死且开启 restart_listener 时重启监听"""
+        if component != "callback" or not self.watchdog.restart_listener or not self.run_flag:
+            return
+        threading.Thread(target=self.restart_listener, name="wxbot-listener-restart", daemon=True).start()
+
+    def restart_listener(self):
+        """停止并重新建立微信监听（卡住的回调返回后由旧监听线程自行退出）"""
+        if not self._listener_restarting.acquire(blocking=False):
+            return False  # 已有重启在进行
+        try:
+            log("监听回调卡死，正在重启微信监听", level="WARNING")
+            names = list(self.listen_windows)
+            self.stop_listening()
+            ok = self.run_flag and self.init_wechat()
+            if ok:
+                # 运行中动态添加的监听（不在配置里的）也要恢复
+                for name in names:
+                    if name not in self.listen_windows:
+                        try:
+                            self._add_listen(name)
+                        except Exception as e:
+                            log(f"恢复 {name} 的监听失败: {e}", level="ERROR")
+            log("微信监听已重启" if ok else "重启微信监听失败", level="SUCCESS" if ok else "ERROR")
+            return ok
+        finally:
+            self._listener_restarting.release()
+
+    def check_online(self):
+        """检查微信是否在线（不直接退出，仅记录）"""
+        try:
+            if self.wx and not self.wx.IsOnline():
+                log("检测到微信客户端不在线，请检查登录状态", level="ERROR")
+        except Exception as e:
+            log(f"检测微信在线状态出错: {e}", level="ERROR")
+
+    def stats(self):
+        """运行状态统计（供网页端展示）"""
+        return {
+            "version": self.ver,
+            "running": self.run_flag,
+            "start_time": self.start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "jobs": self.scheduler.jobs() if self.scheduler else [],
+            "keyword": self.keyword_engine.stats(),
+            "welcome": {"batches": self.welcomer.batches, "joiners": self.welcomer.joiners},
+            "onboarding": self.onboarding.stats(),
+            "outbound": outbound.sender.stats(),
+            "chat_cache": self.chat_cache.stats(),
+            "rate_limit": self.rate_limiter.stats(),
+            "inbound": self.inbound.stats(),
+            "startup": self.startup_stats(),
+            "state": self.state_store.stats(),
+            "watchdog": self.watchdog.stats(),
+            "remote": self.remote.stats(),
+        }
+
     def stop(self):
-        """停止机器人"""
+        """停止机器人，成功返回 True"""
         self.run_flag = False
+        # 取消所有进行中的消息上下文：插件的 HTTP 请求被中断，未发出的回复被丢弃
+        self.cancel_token.cancel("机器人已停止")
+        if self.scheduler:
+            self.scheduler.stop()
+        self.watchdog.stop()
+        self.inbound.stop()
         try:
             self.stop_listening()
         except Exception:
             pass
         log("机器人已停止", level="WARNING")
+        return True
 
 # ====== 简单插件 demo（供测试） ======
 # 说明：此处不启用为文件，而是示范插件规范。真正的插件应放到 ./plugins 目录下，
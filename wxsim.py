@@ -0,0 +1,247 @@
+# wxsim.py
+# 无界面微信模拟后端：实现主程序用到的 wxautox 接口（WeChat / Chat / Message），可在 Linux 上压测
+# - WeChat：AddListenChat / StartListening / StopListening / IsOnline / GetNewFriends / SendMsg / SendFiles 等
+# - Chat：SendMsg / SendFiles / ChatInfo，消息对象提供 chat_info()
+# - 可配置 UI 调用延迟（均值 + 抖动，可按接口覆盖）与失败注入（按概率抛出 SimulatedUIError）
+# - inject() 投递消息：由监听线程按顺序回调，与 wxautox 的监听线程行为一致
+# 主程序通过 config.json 的 "backend": "sim" 或环境变量 WXBOT_BACKEND=sim 启用，参数见 "sim" 段
+import itertools
+import queue
+import random
+import threading
+import time
+
+from logger import get_logger
+
+_log = get_logger("wxsim")
+
+DEFAULTS = {
+    "nickname": "模拟机器人",
+    "latency": 0.05,       # UI 调用平均延迟（秒）
+    "jitter": 0.02,        # 延迟抖动（正态分布标准差，秒）
+    "failure_rate": 0.0,   # UI 调用失败概率（0~1）
+    "op_latency": {},      # 按接口覆盖延迟，如 {"SendMsg": 0.2}
+    "op_failure": {},      # 按接口覆盖失败概率，如 {"SendMsg": 0.05}
+    "seed": None,          # 随机种子（复现同一组延迟/失败）
+}
+
+
+class SimulatedUIError(Exception):
+    """失败注入：模拟 UI 自动化调用失败"""
+
+
+class Message:
+    """模拟消息：属性与 wxautox 消息对象一致（type/attr/content/sender/sender_remark）"""
+    _ids = itertools.count(1)
+
+    def __init__(self, chat, content, sender="", type="text", attr="friend", sender_remark=""):
+        self.id = next(self._ids)
+        self.chat = chat
+        self.content = content
+        self.sender = sender
+        self.sender_remark = sender_remark
+        self.type = type
+        self.attr = attr
+        self.created = time.time()
+
+    def chat_info(self):
+        return self.chat.ChatInfo()
+
+    def __repr__(self):
+        return f"<SimMessage {self.chat.who} {self.sender}: {self.content[:20]}>"
+
+
+class Chat:
+    """模拟聊天子窗口"""
+    def __init__(self, wx, who, chat_type="friend", member_count=None):
+        self.wx = wx
+        self.who = who
+        self.chat_type = chat_type
+        self.member_count = member_count
+
+    def ChatInfo(self):
+        self.wx._ui("ChatInfo")
+        info = {"chat_type": self.chat_type, "chat_name": self.who}
+        if self.chat_type == "group":
+            info["group_member_count"] = self.member_count
+        return info
+
+    def SendMsg(self, msg, at=None):
+        self.wx._ui("SendMsg")
+        self.wx._record(self.who, "text", msg, at)
+
+    def SendFiles(self, filepath):
+        self.wx._ui("SendFiles")
+        self.wx._record(self.who, "file", filepath, None)
+
+
+class NewFriend:
+    """模拟好友申请（GetNewFriends 返回）"""
+    def __init__(self, wx, name):
+        self.wx = wx
+        self.name = name
+
+    def accept(self, remark=None, tags=None):
+        self.wx._ui("AcceptNewFriend")
+        self.wx._accept_friend(self.name, remark)
+
+
+class WeChat:
+    """
+    模拟微信客户端
+    on_send(chat_name, kind, content, at, timestamp)：每次发送成功后回调（压测工具用于统计回复延迟）
+    """
+    def __init__(self, **params):
+        cfg = {**DEFAULTS, **params}
+        self.nickname = cfg["nickname"]
+        self.latency = float(cfg["latency"])
+        self.jitter = float(cfg["jitter"])
+        self.failure_rate = float(cfg["failure_rate"])
+        self.op_latency = dict(cfg["op_latency"] or {})
+        self.op_failure = dict(cfg["op_failure"] or {})
+        self._rng = random.Random(cfg["seed"])
+        self._rng_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._chats = {}           # 名称 -> Chat
+        self._listeners = {}       # 名称 -> callback
+        self._inbox = queue.Queue()
+        self._listen_thread = None
+        self._listening = False
+        self._listen_gen = 0       # 每次 StartListening 递增，旧监听线程据此退出
+        self._online = True
+        self._friend_requests = []
+        self.friends = {}          # 已通过的好友 -> 备注
+        self.sent = []             # (chat_name, kind, content, at, timestamp)
+        self.on_send = None
+        self.counters = {"ui_calls": 0, "ui_failures": 0, "delivered": 0, "dropped": 0, "sent": 0}
+
+    # ---------- 延迟与失败注入 ----------
+    def _ui(self, op):
+        with self._rng_lock:
+            mean = self.op_latency.get(op, self.latency)
+            delay = max(0.0, self._rng.gauss(mean, self.jitter)) if mean > 0 else 0.0
+            fail = self._rng.random() < self.op_failure.get(op, self.failure_rate)
+        self.counters["ui_calls"] += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self.counters["ui_failures"] += 1
+            raise SimulatedUIError(f"模拟 {op} 调用失败")
+
+    def _record(self, who, kind, content, at):
+        now = time.time()
+        with self._lock:
+            self.sent.append((who, kind, content, at, now))
+            self.counters["sent"] += 1
+        if self.on_send:
+            self.on_send(who, kind, content, at, now)
+
+    def _chat(self, who, chat_type=None, member_count=None):
+        with self._lock:
+            chat = self._chats.get(who)
+            if chat is None:
+                chat = self._chats[who] = Chat(self, who, chat_type or "friend", member_count)
+            elif chat_type:
+                chat.chat_type = chat_type
+                if member_count is not None:
+                    chat.member_count = member_count
+            return chat
+
+    # ---------- wxautox 接口 ----------
+    def Show(self):
+        pass
+
+    def IsOnline(self):
+        self._ui("IsOnline")
+        return self._online
+
+    def StartListening(self):
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+            self._listen_gen += 1
+            self._listen_thread = threading.Thread(target=self._listen, args=(self._listen_gen,),
+                                                   name="wxsim-listener", daemon=True)
+            self._listen_thread.start()
+
+    def StopListening(self):
+        with self._lock:
+            self._listening = False
+        self._inbox.put(None)
+
+    def AddListenChat(self, nickname, callback):
+        self._ui("AddListenChat")
+        chat = self._chat(nickname)
+        with self._lock:
+            self._listeners[nickname] = callback
+        return chat
+
+    def RemoveListenChat(self, nickname):
+        with self._lock:
+            return self._listeners.pop(nickname, None) is not None
+
+    def GetNewFriends(self, acceptable=True):
+        self._ui("GetNewFriends")
+        with self._lock:
+            pending, self._friend_requests = self._friend_requests, []
+        return [NewFriend(self, name) for name in pending]
+
+    def SendMsg(self, msg, who=None, at=None):
+        self._ui("SendMsg")
+        self._record(who, "text", msg, at)
+
+    def SendFiles(self, filepath, who=None):
+        self._ui("SendFiles")
+        self._record(who, "file", filepath, None)
+
+    def SwitchToChat(self):
+        self._ui("SwitchToChat")
+
+    def SwitchToContact(self):
+        self._ui("SwitchToContact")
+
+    # ---------- 模拟控制 ----------
+    def inject(self, chat_name, content, sender="", chat_type="friend", type="text", attr="friend",
+               member_count=None):
+        """投递一条消息，返回 Message；未监听的聊天由监听线程丢弃（与真实客户端一致）"""
+        chat = self._chat(chat_name, chat_type, member_count)
+        msg = Message(chat, content, sender=sender or (chat_name if chat_type != "group" else ""),
+                      type=type, attr=attr)
+        self._inbox.put(msg)
+        return msg
+
+    def add_friend_request(self, name):
+        with self._lock:
+            self._friend_requests.append(name)
+
+    def set_online(self, online=True):
+        self._online = bool(online)
+
+    def _accept_friend(self, name, remark):
+        with self._lock:
+            self.friends[name] = remark or name
+
+    def _listen(self, gen):
+        while True:
+            msg = self._inbox.get()
+            if gen != self._listen_gen or not self._listening:
+                if msg is not None:
+                    self._inbox.put(msg)  # 留给新的监听线程
+                return
+            if msg is None:
+                continue
+            with self._lock:
+                callback = self._listeners.get(msg.chat.who)
+            if callback is None:
+                self.counters["dropped"] += 1
+                continue
+            self.counters["delivered"] += 1
+            try:
+                callback(msg, msg.chat)
+            except Exception as e:
+                _log.error("监听回调异常: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "listening": len(self._listeners), "backlog": self._inbox.qsize()}